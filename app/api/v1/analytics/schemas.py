@@ -10,9 +10,17 @@ from typing import Any
 from pydantic import BaseModel, Field, conint
 
 
+class Granularity(Enum):
+    hour = "hour"
+    day = "day"
+    week = "week"
+    month = "month"
+
+
 class HourlyStatusMetric(BaseModel):
     date: str | None = None
     hour: conint(ge=0, le=23) | None = None
+    granularity: Granularity | None = None
     status: int | None = None
     count: int | None = None
     total_duration: int | None = None
@@ -24,6 +32,7 @@ class HourlyStatusMetric(BaseModel):
 class HourlyOrderMetric(BaseModel):
     date: str | None = None
     hour: conint(ge=0, le=23) | None = None
+    granularity: Granularity | None = None
     throughput: int | None = None
 
 
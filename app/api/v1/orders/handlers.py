@@ -1,44 +1,281 @@
-from fastapi import Depends, HTTPException, Path
+from datetime import datetime
 
-from app.api.v1.orders.schemas import Order, OrderCreate, OrderStatus, OrderStatusUpdate
+from fastapi import Depends, HTTPException, Path, Query
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+
+from app.api.v1.orders.schemas import (
+    Order,
+    OrderBatchCreate,
+    OrderBatchGet,
+    OrderBatchGetResponse,
+    OrderBatchGetResult,
+    OrderBatchResponse,
+    OrderBatchResult,
+    OrderCreate,
+    OrderExportFormat,
+    OrderIngestionStatus,
+    OrderStatusBulkResponse,
+    OrderStatusBulkResult,
+    OrderStatusBulkUpdate,
+    OrderStatusEnum,
+    OrderStatusUpdate,
+    OrderView,
+)
+from app.core.config import settings
+from app.core.responses import PydanticJSONResponse
+from app.domains.orders.exceptions import DuplicateOrderError
 from app.domains.orders.service import OrderService
 
 
+def _format_validation_error(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in detail['loc']) or 'order'}: {detail['msg']}" for detail in error.errors()
+    )
+
+
+def _parse_order_fields(fields: str | None) -> set[str] | None:
+    if fields is None:
+        return None
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested - set(Order.model_fields)
+    if not requested or unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown order fields: {', '.join(sorted(unknown)) or fields}")
+    return requested
+
+
 async def get_order_handler(
     order_id: int = Path(...),
+    fields: str | None = Query(None, description="Comma-separated Order fields to return, e.g. id,status,pickup_time"),
     service: OrderService = Depends()
-) -> Order:
+) -> PydanticJSONResponse:
+    requested_fields = _parse_order_fields(fields)
     try:
-        order = await service.get_order(order_id)
-        if order is None:
-            raise HTTPException(status_code=404, detail=f"Order with ID {order_id} not found")
-        return order
+        order = await service.get_order(order_id, requested_fields)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to retrieve order: {str(e)}")
 
+    if order is None:
+        raise HTTPException(status_code=404, detail=f"Order with ID {order_id} not found")
+    if requested_fields is not None:
+        return PydanticJSONResponse(order.model_dump(include=requested_fields))
+    return PydanticJSONResponse(order)
+
+async def batch_get_orders_handler(
+    batch: OrderBatchGet,
+    service: OrderService = Depends()
+) -> PydanticJSONResponse:
+    if not batch.ids:
+        raise HTTPException(status_code=400, detail="At least one order ID is required")
+    if len(batch.ids) > settings.order_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size {len(batch.ids)} exceeds the limit of {settings.order_batch_max_size}"
+        )
+
+    try:
+        orders = await service.get_orders(batch.ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve orders: {str(e)}")
+
+    return PydanticJSONResponse(OrderBatchGetResponse(results=[
+        OrderBatchGetResult(id=order_id, found=order is not None, order=order)
+        for order_id, order in zip(batch.ids, orders, strict=True)
+    ]))
+
+async def list_orders_handler(
+    account_id: str | None = Query(None, description="Filter by account"),
+    brand_id: str | None = Query(None, description="Filter by brand"),
+    customer_id: int | None = Query(None, description="Filter by customer"),
+    status: int | None = Query(None, description="Filter by current status code"),
+    created_from: datetime | None = Query(None, description="Created at or after (inclusive)"),
+    created_to: datetime | None = Query(None, description="Created before (exclusive)"),
+    pickup_from: datetime | None = Query(None, description="Pickup at or after (inclusive)"),
+    pickup_to: datetime | None = Query(None, description="Pickup before (exclusive)"),
+    view: OrderView = Query(OrderView.summary, description="summary skips items, history, customer and address"),
+    limit: int = Query(50, ge=1, le=200, description="Page size"),
+    cursor: str | None = Query(None, description="Cursor returned as next_cursor by the previous page"),
+    service: OrderService = Depends()
+) -> PydanticJSONResponse:
+    try:
+        page = await service.list_orders(
+            account_id=account_id,
+            brand_id=brand_id,
+            customer_id=customer_id,
+            status=OrderStatusEnum(status) if status is not None else None,
+            created_from=created_from,
+            created_to=created_to,
+            pickup_from=pickup_from,
+            pickup_to=pickup_to,
+            cursor=cursor,
+            limit=limit,
+            view=view,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to list orders: {str(e)}")
+
+    return PydanticJSONResponse(page)
+
+async def export_orders_handler(
+    export_format: OrderExportFormat = Query(OrderExportFormat.ndjson, alias="format", description="ndjson or csv"),
+    account_id: str | None = Query(None, description="Filter by account"),
+    brand_id: str | None = Query(None, description="Filter by brand"),
+    customer_id: int | None = Query(None, description="Filter by customer"),
+    status: int | None = Query(None, description="Filter by current status code"),
+    created_from: datetime | None = Query(None, description="Created at or after (inclusive)"),
+    created_to: datetime | None = Query(None, description="Created before (exclusive)"),
+    pickup_from: datetime | None = Query(None, description="Pickup at or after (inclusive)"),
+    pickup_to: datetime | None = Query(None, description="Pickup before (exclusive)"),
+    service: OrderService = Depends()
+) -> StreamingResponse:
+    try:
+        order_status = OrderStatusEnum(status) if status is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    content = service.export_orders(
+        export_format,
+        account_id=account_id,
+        brand_id=brand_id,
+        customer_id=customer_id,
+        status=order_status,
+        created_from=created_from,
+        created_to=created_to,
+        pickup_from=pickup_from,
+        pickup_to=pickup_to,
+    )
+    media_type = "text/csv" if export_format == OrderExportFormat.csv else "application/x-ndjson"
+    return StreamingResponse(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=orders.{export_format.value}"}
+    )
+
+async def stream_order_events_handler(
+    account_id: str | None = Query(None, description="Only events of this account"),
+    brand_id: str | None = Query(None, description="Only events of this brand"),
+    service: OrderService = Depends()
+) -> StreamingResponse:
+    if not service.events.enabled:
+        raise HTTPException(status_code=503, detail="Order events are disabled")
+
+    return StreamingResponse(
+        service.stream_events(account_id, brand_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 async def create_order_handler(
     order: OrderCreate,
     service: OrderService = Depends()
-) -> Order:
+) -> PydanticJSONResponse:
     try:
-        return await service.create_order(order)
+        result = await service.submit_order(order)
+    except DuplicateOrderError as e:
+        # channel retries are answered with the order created by the first submission
+        return PydanticJSONResponse(e.order, status_code=200)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create order: {str(e)}")
 
+    # queued orders are written by the ingestion worker and tracked by their tracking id
+    return PydanticJSONResponse(result, status_code=202 if isinstance(result, OrderIngestionStatus) else 201)
+
+async def get_ingestion_status_handler(
+    tracking_id: str = Path(..., description="Tracking ID returned when the order was accepted"),
+    service: OrderService = Depends()
+) -> PydanticJSONResponse:
+    try:
+        status = await service.get_ingestion_status(tracking_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get ingestion status: {str(e)}")
+
+    if status is None:
+        raise HTTPException(status_code=404, detail="Tracking ID not found")
+    return PydanticJSONResponse(status)
+
+async def create_orders_batch_handler(
+    batch: OrderBatchCreate,
+    service: OrderService = Depends()
+) -> PydanticJSONResponse:
+    if not batch.orders:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one order")
+    if len(batch.orders) > settings.order_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size {len(batch.orders)} exceeds the limit of {settings.order_batch_max_size}"
+        )
+
+    results: list[OrderBatchResult] = []
+    valid_orders: list[tuple[int, OrderCreate]] = []
+    for index, payload in enumerate(batch.orders):
+        try:
+            valid_orders.append((index, OrderCreate.model_validate(payload)))
+        except ValidationError as e:
+            results.append(OrderBatchResult(index=index, error=_format_validation_error(e)))
+
+    try:
+        created = await service.create_orders([order for _, order in valid_orders]) if valid_orders else []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to create orders: {str(e)}")
+
+    for (index, _), result in zip(valid_orders, created, strict=True):
+        if isinstance(result, DuplicateOrderError):
+            results.append(OrderBatchResult(index=index, order=result.order, duplicate=True))
+        elif isinstance(result, ValueError):
+            results.append(OrderBatchResult(index=index, error=str(result)))
+        else:
+            results.append(OrderBatchResult(index=index, order=result))
+
+    return PydanticJSONResponse(OrderBatchResponse(results=sorted(results, key=lambda result: result.index)))
+
 async def update_order_status_handler(
     order_id: int = Path(...),
     status_update: OrderStatusUpdate | None = None,
     service: OrderService = Depends()
-) -> OrderStatus:
+) -> PydanticJSONResponse:
     try:
         if status_update is None:
             raise HTTPException(status_code=400, detail="Status update is required")
-        return await service.update_status(order_id, status_update.status)
+        return PydanticJSONResponse(await service.update_status(order_id, status_update.status), status_code=201)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except KeyError:
         raise HTTPException(status_code=404, detail=f"Order with ID {order_id} not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to update order status: {str(e)}")
+
+async def update_order_statuses_handler(
+    bulk_update: OrderStatusBulkUpdate,
+    service: OrderService = Depends()
+) -> PydanticJSONResponse:
+    if not bulk_update.updates:
+        raise HTTPException(status_code=400, detail="At least one status update is required")
+    if len(bulk_update.updates) > settings.order_batch_max_size:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Batch size {len(bulk_update.updates)} exceeds the limit of {settings.order_batch_max_size}"
+        )
+
+    try:
+        updates = [(update.order_id, update.status) for update in bulk_update.updates]
+        results = await service.update_statuses(updates)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update order statuses: {str(e)}")
+
+    response = OrderStatusBulkResponse(results=[])
+    for (order_id, _), result in zip(updates, results, strict=True):
+        if isinstance(result, KeyError):
+            response.results.append(
+                OrderStatusBulkResult(order_id=order_id, error=f"Order with ID {order_id} not found")
+            )
+        elif isinstance(result, ValueError):
+            response.results.append(OrderStatusBulkResult(order_id=order_id, error=str(result)))
+        else:
+            response.results.append(OrderStatusBulkResult(order_id=order_id, status=result))
+
+    return PydanticJSONResponse(response)
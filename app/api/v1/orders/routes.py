@@ -1,10 +1,55 @@
 from fastapi import APIRouter
+from fastapi.responses import StreamingResponse
 
-from app.api.v1.orders.handlers import create_order_handler, get_order_handler, update_order_status_handler
-from app.api.v1.orders.schemas import Order, OrderStatus
+from app.api.v1.orders.handlers import (
+    batch_get_orders_handler,
+    create_order_handler,
+    create_orders_batch_handler,
+    export_orders_handler,
+    get_ingestion_status_handler,
+    get_order_handler,
+    list_orders_handler,
+    stream_order_events_handler,
+    update_order_status_handler,
+    update_order_statuses_handler,
+)
+from app.api.v1.orders.schemas import (
+    Order,
+    OrderBatchGetResponse,
+    OrderBatchResponse,
+    OrderIngestionStatus,
+    OrderPage,
+    OrderStatus,
+    OrderStatusBulkResponse,
+)
 
 router = APIRouter(tags=["Orders"], prefix="/orders")
 
+# registered before /{order_id} so the literal paths are not captured as an order id
+router.add_api_route(
+    path="/export",
+    endpoint=export_orders_handler,
+    methods=["GET"],
+    response_class=StreamingResponse,
+    status_code=200,
+    responses={
+        200: {"content": {"application/x-ndjson": {}, "text/csv": {}}},
+        400: {"description": "Invalid filters"},
+    }
+)
+
+router.add_api_route(
+    path="/events",
+    endpoint=stream_order_events_handler,
+    methods=["GET"],
+    response_class=StreamingResponse,
+    status_code=200,
+    responses={
+        200: {"content": {"text/event-stream": {}}},
+        503: {"description": "Order events are disabled"},
+    }
+)
+
 router.add_api_route(
     path="/{order_id}",
     endpoint=get_order_handler,
@@ -12,12 +57,24 @@ router.add_api_route(
     response_model=Order,
     status_code=200,
     responses={
-        400: {"description": "Invalid order ID"},
+        400: {"description": "Invalid order ID or fields"},
         404: {"description": "Order not found"},
         500: {"description": "Server error"}
     }
 )
 
+router.add_api_route(
+    path="/",
+    endpoint=list_orders_handler,
+    methods=["GET"],
+    response_model=OrderPage,
+    status_code=200,
+    responses={
+        400: {"description": "Invalid filters or cursor"},
+        500: {"description": "Server error"}
+    }
+)
+
 router.add_api_route(
     path="/",
     endpoint=create_order_handler,
@@ -25,11 +82,61 @@ router.add_api_route(
     response_model=Order,
     status_code=201,
     responses={
+        200: {"model": Order, "description": "Duplicate submission, the original order"},
+        202: {"model": OrderIngestionStatus, "description": "Order queued for asynchronous ingestion"},
         400: {"description": "Invalid input"},
         500: {"description": "Server error"}
     }
 )
 
+router.add_api_route(
+    path="/ingest/{tracking_id}",
+    endpoint=get_ingestion_status_handler,
+    methods=["GET"],
+    response_model=OrderIngestionStatus,
+    status_code=200,
+    responses={
+        404: {"description": "Tracking ID not found or expired"},
+        500: {"description": "Server error"}
+    }
+)
+
+router.add_api_route(
+    path=":batchGet",
+    endpoint=batch_get_orders_handler,
+    methods=["POST"],
+    response_model=OrderBatchGetResponse,
+    status_code=200,
+    responses={
+        400: {"description": "Empty or oversized request"},
+        500: {"description": "Server error"}
+    }
+)
+
+router.add_api_route(
+    path="/batch",
+    endpoint=create_orders_batch_handler,
+    methods=["POST"],
+    response_model=OrderBatchResponse,
+    status_code=200,
+    responses={
+        400: {"description": "Empty or oversized batch"},
+        500: {"description": "Server error"}
+    }
+)
+
+router.add_api_route(
+    path="/status",
+    endpoint=update_order_statuses_handler,
+    methods=["PUT"],
+    response_model=OrderStatusBulkResponse,
+    status_code=200,
+    responses={
+        400: {"description": "Empty or oversized request"},
+        500: {"description": "Server error"}
+    }
+)
+
 router.add_api_route(
     path="/{order_id}/status",
     endpoint=update_order_status_handler,
@@ -6,6 +6,7 @@ from __future__ import annotations
 
 from datetime import datetime
 from enum import Enum
+from typing import Any
 
 from pydantic import BaseModel, Field, conint
 
@@ -33,9 +34,9 @@ class OrderStatusUpdate(BaseModel):
 
 
 class OrderItemCreate(BaseModel):
-    name: str
-    plu: str
-    quantity: conint(ge=1)
+    name: str = Field(..., max_length=255)
+    plu: str = Field(..., max_length=50)
+    quantity: conint(ge=1, le=2147483647)
 
 
 class OrderItem(BaseModel):
@@ -47,7 +48,7 @@ class OrderItem(BaseModel):
 
 
 class OrderStatus(BaseModel):
-    id: int
+    id: int | None = Field(..., description="History row id, null when the history is read from the status timeline")
     order_id: int
     status: OrderStatusEnum
     timestamp: datetime
@@ -61,22 +62,28 @@ class HTTPError(BaseModel):
 
 
 class Customer(BaseModel):
-    name: str
-    phoneNumber: str
+    name: str = Field(..., max_length=255)
+    phoneNumber: str = Field(..., max_length=20)
 
 
 class Address(BaseModel):
-    city: str
-    street: str
-    postalCode: str
+    city: str = Field(..., max_length=100)
+    street: str = Field(..., max_length=255)
+    postalCode: str = Field(..., max_length=20)
 
 
 class OrderCreate(BaseModel):
-    account_id: str
-    brand_id: str
-    channel_order_id: str
-    customer_id: int
-    address_id: int
+    account_id: str = Field(..., max_length=255)
+    brand_id: str = Field(..., max_length=255)
+    channel_order_id: str = Field(..., max_length=255)
+    customer_id: int | None = Field(
+        None, ge=1, le=2147483647, description="Existing customer, required unless customer is given"
+    )
+    address_id: int | None = Field(
+        None, ge=1, le=2147483647, description="Existing address, required unless delivery_address is given"
+    )
+    customer: Customer | None = Field(None, description="Customer upserted by phone number")
+    delivery_address: Address | None = Field(None, description="Address upserted by its normalized value")
     pickup_time: datetime
     items: list[OrderItemCreate]
 
@@ -93,3 +100,96 @@ class Order(BaseModel):
     items: list[OrderItem]
     status: OrderStatusEnum | None = None
     status_history: list[OrderStatus]
+
+
+class OrderBatchCreate(BaseModel):
+    orders: list[dict[str, Any]] = Field(
+        ...,
+        description="Order payloads in OrderCreate format, validated individually so one invalid order does not reject the batch",
+    )
+
+
+class OrderBatchResult(BaseModel):
+    index: int = Field(..., description="Position of the order in the submitted batch")
+    order: Order | None = None
+    error: str | None = None
+    duplicate: bool = Field(False, description="The order existed already and order is the original")
+
+
+class OrderBatchResponse(BaseModel):
+    results: list[OrderBatchResult]
+
+
+class OrderStatusBulkUpdateItem(BaseModel):
+    order_id: int
+    status: OrderStatusEnum
+
+
+class OrderStatusBulkUpdate(BaseModel):
+    updates: list[OrderStatusBulkUpdateItem]
+
+
+class OrderStatusBulkResult(BaseModel):
+    order_id: int
+    status: OrderStatus | None = None
+    error: str | None = None
+
+
+class OrderStatusBulkResponse(BaseModel):
+    results: list[OrderStatusBulkResult]
+
+
+class OrderView(Enum):
+    summary = "summary"
+    full = "full"
+
+
+class OrderExportFormat(Enum):
+    ndjson = "ndjson"
+    csv = "csv"
+
+
+class OrderSummary(BaseModel):
+    id: int
+    account_id: str
+    brand_id: str
+    channel_order_id: str
+    customer_id: int
+    address_id: int
+    pickup_time: datetime
+    created_at: datetime
+    status: OrderStatusEnum
+
+
+class OrderPage(BaseModel):
+    items: list[OrderSummary | Order]
+    next_cursor: str | None = Field(
+        None, description="Opaque cursor for the next page, absent on the last page"
+    )
+
+
+class OrderBatchGet(BaseModel):
+    ids: list[int]
+
+
+class OrderBatchGetResult(BaseModel):
+    id: int
+    found: bool
+    order: Order | None = None
+
+
+class OrderBatchGetResponse(BaseModel):
+    results: list[OrderBatchGetResult]
+
+
+class OrderIngestionState(Enum):
+    pending = "pending"
+    completed = "completed"
+    failed = "failed"
+
+
+class OrderIngestionStatus(BaseModel):
+    tracking_id: str
+    status: OrderIngestionState
+    order_id: int | None = None
+    error: str | None = None
@@ -1,12 +1,20 @@
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
 from celery import Celery
+from tortoise import Tortoise
 
 from app.core.config import settings
+from app.core.database import TORTOISE_ORM
+
+T = TypeVar("T")
 
 celery_app = Celery(
     "analytics",
     broker=settings.redis_url,
     backend=settings.redis_url,
-    include=["app.domains.analytics.tasks"]
+    include=["app.domains.analytics.tasks", "app.domains.orders.tasks"]
 )
 
 celery_app.conf.beat_schedule = {
@@ -15,11 +23,43 @@ celery_app.conf.beat_schedule = {
         "schedule": settings.aggregate_hourly_metrics_interval,  # Run hourly by default
         "args": (None,),
     },
+    "flush-hourly-metrics": {
+        "task": "app.domains.analytics.tasks.flush_hourly_metrics",
+        "schedule": settings.analytics_flush_interval,  # Run every minute by default
+    },
     "update-customer-metrics": {
         "task": "app.domains.analytics.tasks.update_customer_metrics",
         "schedule": settings.update_customer_metrics_interval,  # Run daily by default
         "args": (None,),
     },
+    "maintain-status-history-partitions": {
+        "task": "app.domains.orders.tasks.maintain_status_history_partitions",
+        "schedule": settings.status_history_partitions_interval,  # Run daily by default
+    },
+    "archive-closed-orders": {
+        "task": "app.domains.orders.tasks.archive_closed_orders",
+        "schedule": settings.order_archive_interval,  # Run daily by default
+    },
 }
 
 celery_app.conf.timezone = "UTC"
+
+
+def tortoise_task(task_func: Callable[..., Awaitable[T]]) -> Any:
+    """Decorator to initialize Tortoise ORM for celery tasks"""
+    task_name = f"{task_func.__module__}.{task_func.__name__}"
+
+    @celery_app.task(name=task_name)
+    def wrapper(*args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_event_loop()
+
+        async def run_task() -> T:
+            await Tortoise.init(config=TORTOISE_ORM)
+            try:
+                return await task_func(*args, **kwargs)
+            finally:
+                await Tortoise.close_connections()
+
+        return loop.run_until_complete(run_task())
+
+    return wrapper
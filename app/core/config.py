@@ -17,9 +17,64 @@ class Settings(BaseSettings):
     redis_port: int = int(os.environ.get("REDIS_PORT", 6379))
     redis_db: int = int(os.environ.get("REDIS_DB", 0))
     redis_expiration_time: int = int(os.environ.get("REDIS_EXPIRATION_TIME", 60 * 60 * 24 * 7))  # 7 days
-    redis_job_names: list[str] = ["hourly_metrics", "customer_metrics"]
+    redis_job_names: list[str] = [
+        "hourly_metrics", "hourly_metrics_flush", "hourly_metrics_backfill", "customer_metrics",
+        "status_history_partitions", "order_archive"
+    ]
     aggregate_hourly_metrics_interval: int = int(os.environ.get("AGGREGATE_HOURLY_METRICS_INTERVAL", 3600))  # 1 hour
     update_customer_metrics_interval: int = int(os.environ.get("UPDATE_CUSTOMER_METRICS_INTERVAL", 86400))  # 1 day
+    status_history_partitions_interval: int = int(os.environ.get("STATUS_HISTORY_PARTITIONS_INTERVAL", 86400))  # 1 day
+    status_history_partitions_ahead: int = int(os.environ.get("STATUS_HISTORY_PARTITIONS_AHEAD", 3))  # months
+    status_history_retention_months: int = int(os.environ.get("STATUS_HISTORY_RETENTION_MONTHS", 0))  # 0 keeps all
+    order_archive_enabled: bool = os.environ.get("ORDER_ARCHIVE_ENABLED", "false").lower() == "true"
+    order_archive_path: str = os.environ.get("ORDER_ARCHIVE_PATH", "archive")
+    order_archive_after_days: int = int(os.environ.get("ORDER_ARCHIVE_AFTER_DAYS", 30))
+    order_archive_batch_size: int = int(os.environ.get("ORDER_ARCHIVE_BATCH_SIZE", 500))
+    order_archive_interval: int = int(os.environ.get("ORDER_ARCHIVE_INTERVAL", 86400))  # 1 day
+    order_outbox_enabled: bool = os.environ.get("ORDER_OUTBOX_ENABLED", "false").lower() == "true"
+    order_outbox_stream: str = os.environ.get("ORDER_OUTBOX_STREAM", "order_outbox")
+    order_outbox_stream_maxlen: int = int(os.environ.get("ORDER_OUTBOX_STREAM_MAXLEN", 1000000))
+    order_outbox_batch_size: int = int(os.environ.get("ORDER_OUTBOX_BATCH_SIZE", 1000))
+    order_outbox_poll_interval: float = float(os.environ.get("ORDER_OUTBOX_POLL_INTERVAL", 0.2))  # seconds
+    order_outbox_retention_days: int = int(os.environ.get("ORDER_OUTBOX_RETENTION_DAYS", 7))
+    order_outbox_prune_interval: int = int(os.environ.get("ORDER_OUTBOX_PRUNE_INTERVAL", 3600))  # 1 hour
+    order_outbox_metrics_port: int = int(os.environ.get("ORDER_OUTBOX_METRICS_PORT", 9102))
+    hourly_metrics_backfill_chunk_days: int = int(os.environ.get("HOURLY_METRICS_BACKFILL_CHUNK_DAYS", 7))
+    customer_metrics_incremental: bool = os.environ.get("CUSTOMER_METRICS_INCREMENTAL", "false").lower() == "true"
+    customer_metrics_batch_size: int = int(os.environ.get("CUSTOMER_METRICS_BATCH_SIZE", 1000))
+    customer_metrics_watermark_lag: int = int(os.environ.get("CUSTOMER_METRICS_WATERMARK_LAG", 300))  # 5 minutes
+    analytics_cache_enabled: bool = os.environ.get("ANALYTICS_CACHE_ENABLED", "true").lower() == "true"
+    analytics_cache_ttl: int = int(os.environ.get("ANALYTICS_CACHE_TTL", 3600))  # 1 hour
+    analytics_incremental_enabled: bool = os.environ.get("ANALYTICS_INCREMENTAL_ENABLED", "false").lower() == "true"
+    analytics_flush_interval: int = int(os.environ.get("ANALYTICS_FLUSH_INTERVAL", 60))  # 1 minute
+    analytics_consumer_batch_size: int = int(os.environ.get("ANALYTICS_CONSUMER_BATCH_SIZE", 1000))
+    analytics_consumer_block_ms: int = int(os.environ.get("ANALYTICS_CONSUMER_BLOCK_MS", 1000))  # 1 second
+    analytics_consumer_metrics_port: int = int(os.environ.get("ANALYTICS_CONSUMER_METRICS_PORT", 9103))
+    order_batch_max_size: int = int(os.environ.get("ORDER_BATCH_MAX_SIZE", 500))
+    order_export_chunk_size: int = int(os.environ.get("ORDER_EXPORT_CHUNK_SIZE", 500))
+    order_cache_enabled: bool = os.environ.get("ORDER_CACHE_ENABLED", "true").lower() == "true"
+    order_cache_ttl: int = int(os.environ.get("ORDER_CACHE_TTL", 60))  # 1 minute
+    order_dedup_enabled: bool = os.environ.get("ORDER_DEDUP_ENABLED", "true").lower() == "true"
+    order_dedup_ttl: int = int(os.environ.get("ORDER_DEDUP_TTL", 86400))  # 1 day
+    order_status_timeline_reads: bool = os.environ.get("ORDER_STATUS_TIMELINE_READS", "false").lower() == "true"
+    order_lookup_cache_size: int = int(os.environ.get("ORDER_LOOKUP_CACHE_SIZE", 10000))
+    order_events_enabled: bool = os.environ.get("ORDER_EVENTS_ENABLED", "true").lower() == "true"
+    order_events_channel: str = os.environ.get("ORDER_EVENTS_CHANNEL", "order_events")
+    order_events_queue_size: int = int(os.environ.get("ORDER_EVENTS_QUEUE_SIZE", 100))
+    order_events_heartbeat: int = int(os.environ.get("ORDER_EVENTS_HEARTBEAT", 15))  # 15 seconds
+    order_events_reconnect_delay: int = int(os.environ.get("ORDER_EVENTS_RECONNECT_DELAY", 1))  # 1 second
+    order_ingestion_mode: str = os.environ.get("ORDER_INGESTION_MODE", "sync")  # sync or async
+    order_ingestion_stream: str = os.environ.get("ORDER_INGESTION_STREAM", "order_ingestion")
+    order_ingestion_group: str = os.environ.get("ORDER_INGESTION_GROUP", "order_writers")
+    order_ingestion_batch_size: int = int(os.environ.get("ORDER_INGESTION_BATCH_SIZE", 500))
+    order_ingestion_block_ms: int = int(os.environ.get("ORDER_INGESTION_BLOCK_MS", 1000))  # 1 second
+    order_ingestion_claim_idle_ms: int = int(os.environ.get("ORDER_INGESTION_CLAIM_IDLE_MS", 60000))  # 1 minute
+    order_ingestion_max_deliveries: int = int(os.environ.get("ORDER_INGESTION_MAX_DELIVERIES", 5))
+    order_ingestion_dead_letter_stream: str = os.environ.get(
+        "ORDER_INGESTION_DEAD_LETTER_STREAM", "order_ingestion_dead_letter"
+    )
+    order_ingestion_status_ttl: int = int(os.environ.get("ORDER_INGESTION_STATUS_TTL", 86400))  # 1 day
+    order_ingestion_metrics_port: int = int(os.environ.get("ORDER_INGESTION_METRICS_PORT", 9101))
 
 
 @lru_cache
@@ -1,4 +1,8 @@
+from collections.abc import Sequence
+from typing import Any
+
 from fastapi import FastAPI
+from tortoise import BaseDBAsyncClient, Model
 from tortoise.contrib.fastapi import register_tortoise
 
 from app.core.config import settings
@@ -17,12 +21,15 @@ TORTOISE_ORM_TEST = {
     "connections": {"default": "sqlite://:memory:"},
     "apps": {
         "orders": {
-            "models": ["app.domains.orders.models"],
+            "models": ["app.domains.orders.models", "app.domains.analytics.models"],
             "default_connection": "default",
         }
     },
 }
 
+# keep well below the bind parameter limits of both asyncpg (32767) and SQLite (32766)
+MAX_QUERY_PARAMETERS = 10000
+
 def init_db(app: FastAPI) -> None:
     register_tortoise(
         app,
@@ -30,3 +37,118 @@ def init_db(app: FastAPI) -> None:
         generate_schemas=False, # to avoid generating schemas on every startup
         add_exception_handlers=True,
     )
+
+
+def is_postgres(connection: BaseDBAsyncClient) -> bool:
+    return connection.capabilities.dialect == "postgres"
+
+
+def sql_parameter(connection: BaseDBAsyncClient, position: int) -> str:
+    """Return the bind parameter placeholder for a 1-based position in the connection's dialect"""
+    return f"${position}" if is_postgres(connection) else "?"
+
+
+async def insert_many(
+        connection: BaseDBAsyncClient,
+        model: type[Model],
+        rows: Sequence[dict[str, Any]],
+        returning: Sequence[str] = (),
+        on_conflict: Sequence[str] = (),
+        on_conflict_update: Sequence[str] = (),
+) -> list[dict[str, Any]]:
+    """
+    Insert rows with multi-row INSERT statements, chunked to stay within the bind parameter limit.
+    Values are converted with the model's field converters and returned columns are converted back.
+    Rows conflicting on the unique on_conflict columns are skipped and not returned,
+    unless on_conflict_update names the columns to overwrite from the conflicting row, which returns them too.
+    """
+    if not rows:
+        return []
+
+    meta = model._meta
+    columns = list(rows[0].keys())
+    column_list = ", ".join(f'"{meta.fields_db_projection[column]}"' for column in columns)
+    conflict_sql = ""
+    if on_conflict:
+        conflict_sql = " ON CONFLICT (" + ", ".join(
+            f'"{meta.fields_db_projection[column]}"' for column in on_conflict
+        ) + ")"
+        if on_conflict_update:
+            conflict_sql += " DO UPDATE SET " + ", ".join(
+                f'"{meta.fields_db_projection[column]}" = EXCLUDED."{meta.fields_db_projection[column]}"'
+                for column in on_conflict_update
+            )
+        else:
+            conflict_sql += " DO NOTHING"
+    returning_sql = ""
+    if returning:
+        returning_sql = " RETURNING " + ", ".join(f'"{meta.fields_db_projection[column]}"' for column in returning)
+
+    chunk_size = max(1, MAX_QUERY_PARAMETERS // len(columns))
+    results: list[dict[str, Any]] = []
+
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        values: list[Any] = []
+        tuples = []
+        for row in chunk:
+            placeholders = []
+            for column in columns:
+                values.append(meta.fields_map[column].to_db_value(row[column], model))
+                placeholders.append(sql_parameter(connection, len(values)))
+            tuples.append(f"({', '.join(placeholders)})")
+
+        query = f'INSERT INTO "{meta.db_table}" ({column_list}) VALUES {", ".join(tuples)}'
+        query += conflict_sql + returning_sql
+        _, records = await connection.execute_query(query, values)
+
+        for record in records:
+            results.append({
+                column: meta.fields_map[column].to_python_value(record[meta.fields_db_projection[column]])
+                for column in returning
+            })
+
+    return results
+
+
+async def upsert_many(
+        connection: BaseDBAsyncClient,
+        model: type[Model],
+        rows: Sequence[dict[str, Any]],
+        on_conflict: Sequence[str],
+        on_conflict_update: Sequence[str],
+) -> None:
+    """
+    Insert rows, overwriting the on_conflict_update columns of existing rows that conflict on the unique
+    on_conflict columns. On Postgres all rows are sent in one statement that unnests one array parameter
+    per column, so the statement text and its parameter count do not grow with the number of rows.
+    Other databases use the multi-row inserts of insert_many.
+    """
+    if not rows:
+        return
+
+    if not is_postgres(connection):
+        await insert_many(connection, model, rows, on_conflict=on_conflict, on_conflict_update=on_conflict_update)
+        return
+
+    meta = model._meta
+    columns = list(rows[0].keys())
+    column_list = ", ".join(f'"{meta.fields_db_projection[column]}"' for column in columns)
+    arrays = ", ".join(
+        f"${position}::{meta.fields_map[column].get_for_dialect('postgres', 'SQL_TYPE')}[]"
+        for position, column in enumerate(columns, start=1)
+    )
+    conflict_columns = ", ".join(f'"{meta.fields_db_projection[column]}"' for column in on_conflict)
+    updates = ", ".join(
+        f'"{meta.fields_db_projection[column]}" = EXCLUDED."{meta.fields_db_projection[column]}"'
+        for column in on_conflict_update
+    )
+    values = [
+        [meta.fields_map[column].to_db_value(row[column], model) for row in rows]
+        for column in columns
+    ]
+    await connection.execute_query(
+        f'INSERT INTO "{meta.db_table}" ({column_list}) SELECT * FROM unnest({arrays}) '
+        f"ON CONFLICT ({conflict_columns}) DO UPDATE SET {updates}",
+        values
+    )
@@ -0,0 +1,15 @@
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic_core import to_json
+
+
+class PydanticJSONResponse(JSONResponse):
+    """
+    JSON response encoded by pydantic-core's Rust serializer.
+    Handlers return it directly with already validated models (or plain dicts built from trusted rows),
+    which skips FastAPI's response_model re-validation and the jsonable_encoder/json.dumps pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return to_json(content)
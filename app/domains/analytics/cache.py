@@ -0,0 +1,164 @@
+import asyncio
+import json
+import logging
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import date, timedelta
+from typing import Any, ClassVar
+
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.domains.analytics.rollups import next_period_start, period_start
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_CACHE_HITS = Counter("oms_analytics_cache_hits_total", "Analytics reads served from the cache", ["endpoint"])
+ANALYTICS_CACHE_MISSES = Counter(
+    "oms_analytics_cache_misses_total", "Analytics reads that fell through to the database", ["endpoint"]
+)
+ANALYTICS_CACHE_COALESCED = Counter(
+    "oms_analytics_cache_coalesced_total", "Analytics reads that waited for an identical read in flight", ["endpoint"]
+)
+ANALYTICS_CACHE_EVICTIONS = Counter(
+    "oms_analytics_cache_evictions_total", "Cached analytics responses removed after metrics were written"
+)
+
+# bumped by every invalidation, a response read before it is not cached after it
+ANALYTICS_CACHE_VERSION_KEY = "analytics_cache:version"
+
+# KEYS: the version, the response and the date index keys; ARGV: the version the response was loaded at,
+# the response and the TTL. Checked and written in one step, so an invalidation cannot fall in between.
+FILL_RESPONSE_SCRIPT = """
+if (redis.call('GET', KEYS[1]) or '') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[3])
+for index = 3, #KEYS do
+    redis.call('SADD', KEYS[index], KEYS[2])
+    redis.call('EXPIRE', KEYS[index], ARGV[3])
+end
+return 1
+"""
+
+Loader = Callable[[], Awaitable[list[dict[str, Any]]]]
+
+
+class AnalyticsCache:
+    """
+    Read-through cache of analytics metric responses in Redis, keyed by the normalized query.
+    Every cached response is indexed under each date its rows are computed from, and the aggregation tasks
+    drop the responses of the dates they write. Identical reads in flight in this process share one query.
+    Cache failures are logged and treated as misses so the database stays the source of truth.
+    """
+
+    _in_flight: ClassVar[dict[str, asyncio.Task[str]]] = {}
+    fill_script = redis_client.register_script(FILL_RESPONSE_SCRIPT)
+
+    @staticmethod
+    def _key(
+            endpoint: str,
+            granularity: str,
+            from_date: date,
+            to_date: date,
+            hour: int | None,
+            status: int | None
+    ) -> str:
+        return (
+            f"analytics_cache:{endpoint}:{granularity}:{from_date.isoformat()}:{to_date.isoformat()}"
+            f":{'*' if hour is None else hour}:{'*' if status is None else status}"
+        )
+
+    @staticmethod
+    def _date_key(day: date) -> str:
+        return f"analytics_cache_date:{day.isoformat()}"
+
+    @staticmethod
+    def _source_dates(granularity: str, from_date: date, to_date: date) -> list[date]:
+        """Dates whose metrics make up the response, rollup periods can extend beyond the range"""
+        day = period_start(from_date, granularity)
+        end = next_period_start(period_start(to_date, granularity), granularity)
+        dates = []
+        while day < end:
+            dates.append(day)
+            day += timedelta(days=1)
+        return dates
+
+    @property
+    def enabled(self) -> bool:
+        return settings.analytics_cache_enabled
+
+    async def get_or_load(
+            self,
+            endpoint: str,
+            granularity: str,
+            from_date: date,
+            to_date: date,
+            hour: int | None,
+            status: int | None,
+            load: Loader
+    ) -> list[dict[str, Any]]:
+        if not self.enabled:
+            return await load()
+
+        key = self._key(endpoint, granularity, from_date, to_date, hour, status)
+        task = self._in_flight.get(key)
+        if task is not None:
+            ANALYTICS_CACHE_COALESCED.labels(endpoint).inc()
+        else:
+            task = asyncio.ensure_future(
+                self._read_through(key, endpoint, self._source_dates(granularity, from_date, to_date), load)
+            )
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        # every caller gets its own copy of the rows
+        return json.loads(await asyncio.shield(task))  # type: ignore[no-any-return]
+
+    async def _read_through(self, key: str, endpoint: str, dates: list[date], load: Loader) -> str:
+        try:
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                pipeline.get(key)
+                pipeline.get(ANALYTICS_CACHE_VERSION_KEY)
+                payload, version = await pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Error reading analytics response from cache: {str(e)}")
+            return json.dumps(await load())
+
+        if payload is not None:
+            ANALYTICS_CACHE_HITS.labels(endpoint).inc()
+            return payload  # type: ignore[no-any-return]
+
+        ANALYTICS_CACHE_MISSES.labels(endpoint).inc()
+        loaded = json.dumps(await load())
+
+        try:
+            await self.fill_script(
+                keys=[ANALYTICS_CACHE_VERSION_KEY, key, *(self._date_key(day) for day in dates)],
+                args=[version or "", loaded, settings.analytics_cache_ttl]
+            )
+        except RedisError as e:
+            logger.warning(f"Error writing analytics response to cache: {str(e)}")
+
+        return loaded
+
+    async def invalidate(self, dates: Iterable[date]) -> None:
+        """Drop the cached responses computed from metrics of the dates"""
+        date_keys = [self._date_key(day) for day in dates]
+        if not self.enabled or not date_keys:
+            return
+
+        try:
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                for date_key in date_keys:
+                    pipeline.smembers(date_key)
+                cached = set().union(*await pipeline.execute())
+
+            async with redis_client.pipeline(transaction=True) as pipeline:
+                pipeline.incr(ANALYTICS_CACHE_VERSION_KEY)
+                pipeline.delete(*cached, *date_keys)
+                await pipeline.execute()
+            ANALYTICS_CACHE_EVICTIONS.inc(len(cached))
+        except RedisError as e:
+            logger.warning(f"Error invalidating cached analytics responses: {str(e)}")
@@ -0,0 +1,537 @@
+import asyncio
+import json
+import logging
+import signal
+import time
+from collections import Counter as DeltaCounter
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from datetime import date, datetime
+from typing import Any
+from uuid import uuid4
+
+from prometheus_client import Counter, start_http_server
+from redis.exceptions import RedisError, ResponseError, WatchError
+from tortoise import BaseDBAsyncClient, Tortoise, connections
+from tortoise.transactions import in_transaction
+
+from app.api.v1.orders.schemas import OrderStatusEnum
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import TORTOISE_ORM, is_postgres
+from app.core.logger import setup_logger
+from app.domains.analytics.cache import AnalyticsCache
+from app.domains.analytics.models import HourlyOrderMetric, HourlyStatusMetric
+from app.domains.analytics.rollups import HOUR, period_start, refresh_metric_rollups
+from app.domains.orders.outbox import (
+    ORDER_CREATED,
+    STATUS_CHANGED,
+    get_consumer_position,
+    parse_stream_position,
+    set_consumer_position,
+)
+
+logger = logging.getLogger(__name__)
+
+HOURLY_METRICS_EVENTS = Counter("oms_hourly_metrics_events_total", "Outbox events counted into the hourly metrics")
+
+HOURLY_METRICS_CONSUMER = "hourly_metrics"
+# counters not yet merged into the metric tables; the position field holds the last stream entry they include
+HOURLY_DELTAS_KEY = "analytics:hourly:deltas"
+# deltas taken by a flush that has not finished yet
+HOURLY_FLUSHING_KEY = "analytics:hourly:flushing"
+HOURLY_POSITION_KEY = "analytics:hourly:position"
+HOURLY_FLUSH_LOCK_KEY = "analytics:hourly:flush_lock"
+HOURLY_FLUSH_LOCK_TIMEOUT = 300
+POSITION_FIELD = "position"
+
+# rescans in progress or done recently, by id: JSON with the rescanned UTC hours [start, end) as YYYY-MM-DDTHH,
+# the pg_current_snapshot() the rescan read, whether it committed and when it started (epoch seconds)
+HOURLY_REWRITES_KEY = "analytics:hourly:rewrites"
+# counters of a rescan's events the consumer left out, put back when the rescan fails
+HOURLY_REWRITE_SKIPPED_KEY = "analytics:hourly:rewrite:{rewrite_id}"
+
+UPDATE_REWRITE_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: the rewrites, the rewrite's skipped counters and the deltas; ARGV: the rewrite id
+RESTORE_REWRITE_SCRIPT = """
+local skipped = redis.call('HGETALL', KEYS[2])
+for index = 1, #skipped, 2 do
+    redis.call('HINCRBY', KEYS[3], skipped[index], skipped[index + 1])
+end
+redis.call('DEL', KEYS[2])
+redis.call('HDEL', KEYS[1], ARGV[1])
+return #skipped / 2
+"""
+
+# delta fields are "<hour>:count:<status>", "<hour>:duration:<status>" and "<hour>:throughput"
+# for the UTC hour written as YYYY-MM-DDTHH
+HourKey = tuple[date, int]
+
+
+def hour_of(timestamp: str) -> str:
+    return datetime.fromisoformat(timestamp).strftime("%Y-%m-%dT%H")
+
+
+def snapshot_visible(snapshot: str, transaction_id: int) -> bool:
+    """Whether the effects of a transaction are visible in a pg_current_snapshot() written as text"""
+    xmin, xmax, running = snapshot.split(":")
+    if transaction_id < int(xmin):
+        return True
+    return transaction_id < int(xmax) and str(transaction_id) not in running.split(",")
+
+
+def entry_deltas(entry: dict[str, str]) -> list[tuple[str, int]]:
+    """
+    Counter increments of one outbox stream entry, matching what aggregate_hourly_metrics computes:
+    a status is counted in the hour it was entered and the time spent in it is added to that same hour,
+    and an order adds to the throughput of the hour it was created in.
+    """
+    payload = json.loads(entry["payload"])
+    if entry["type"] == ORDER_CREATED:
+        hour = hour_of(payload["created_at"])
+        return [(f"{hour}:count:{OrderStatusEnum.RECEIVED.value}", 1), (f"{hour}:throughput", 1)]
+    if entry["type"] == STATUS_CHANGED:
+        return [
+            (f"{hour_of(payload['timestamp'])}:count:{payload['status']}", 1),
+            (f"{hour_of(payload['previous_status_since'])}:duration:{payload['previous_status']}", payload["duration"]),
+        ]
+    return []
+
+
+def hourly_deltas(
+        entries: list[tuple[str, dict[str, str]]],
+        rewrites: dict[str, dict[str, Any]] | None = None
+) -> tuple[DeltaCounter[str], dict[str, DeltaCounter[str]]]:
+    """
+    Counter increments for outbox stream entries, and per rewrite the increments left out because the
+    rewrite's rescan of their hour already saw the entry's transaction
+    """
+    deltas: DeltaCounter[str] = DeltaCounter()
+    skipped: dict[str, DeltaCounter[str]] = {}
+    for entry_id, entry in entries:
+        transaction_id, _ = parse_stream_position(entry_id)
+        for field, value in entry_deltas(entry):
+            hour = field.split(":")[0]
+            rewrite_id = next((
+                rewrite_id for rewrite_id, rewrite in (rewrites or {}).items()
+                if rewrite["start"] <= hour < rewrite["end"] and snapshot_visible(rewrite["snapshot"], transaction_id)
+            ), None)
+            if rewrite_id is None:
+                deltas[field] += value
+            else:
+                skipped.setdefault(rewrite_id, DeltaCounter())[field] += value
+    return deltas, skipped
+
+
+def parse_hourly_deltas(
+        fields: dict[str, str]
+) -> tuple[dict[tuple[date, int, int], dict[str, int]], dict[HourKey, int]]:
+    """Split delta fields into status (count, total_duration) and order throughput increments per hour"""
+    status_deltas: dict[tuple[date, int, int], dict[str, int]] = {}
+    order_deltas: dict[HourKey, int] = {}
+    for field, value in fields.items():
+        if field == POSITION_FIELD:
+            continue
+
+        hour, metric, *status = field.split(":")
+        hour_start = datetime.strptime(hour, "%Y-%m-%dT%H")
+        key = hour_start.date(), hour_start.hour
+        if metric == "throughput":
+            order_deltas[key] = order_deltas.get(key, 0) + int(value)
+        else:
+            status_delta = status_deltas.setdefault((*key, int(status[0])), {"count": 0, "total_duration": 0})
+            status_delta["count" if metric == "count" else "total_duration"] += int(value)
+    return status_deltas, order_deltas
+
+
+async def merge_hourly_deltas(connection: BaseDBAsyncClient, fields: dict[str, str]) -> set[date]:
+    """Add delta fields to the metric tables, creating the rows of hours seen for the first time"""
+    status_deltas, order_deltas = parse_hourly_deltas(fields)
+    dates = {key[0] for key in status_deltas} | {key[0] for key in order_deltas}
+    if not dates:
+        return dates
+
+    status_metrics = {
+        (metric.date, metric.hour, metric.status): metric
+        for metric in await HourlyStatusMetric.filter(date__in=dates).using_db(connection)
+    }
+    created_status, updated_status = [], []
+    for key, delta in status_deltas.items():
+        status_metric = status_metrics.get(key)
+        if status_metric is None:
+            status_metric = HourlyStatusMetric(
+                date=key[0], hour=key[1], status=key[2], count=0, total_duration=0, avg_duration=0
+            )
+            created_status.append(status_metric)
+        else:
+            updated_status.append(status_metric)
+        status_metric.count += delta["count"]
+        status_metric.total_duration += delta["total_duration"]
+        status_metric.avg_duration = (
+            status_metric.total_duration / status_metric.count if status_metric.count > 0 else 0
+        )
+
+    order_metrics = {
+        (metric.date, metric.hour): metric
+        for metric in await HourlyOrderMetric.filter(date__in=dates).using_db(connection)
+    }
+    created_orders, updated_orders = [], []
+    for hour_key, throughput in order_deltas.items():
+        order_metric = order_metrics.get(hour_key)
+        if order_metric is None:
+            order_metric = HourlyOrderMetric(date=hour_key[0], hour=hour_key[1], throughput=0)
+            created_orders.append(order_metric)
+        else:
+            updated_orders.append(order_metric)
+        order_metric.throughput += throughput
+
+    if created_status:
+        await HourlyStatusMetric.bulk_create(created_status, using_db=connection)
+    if updated_status:
+        await HourlyStatusMetric.bulk_update(
+            updated_status, fields=["count", "total_duration", "avg_duration"], using_db=connection
+        )
+    if created_orders:
+        await HourlyOrderMetric.bulk_create(created_orders, using_db=connection)
+    if updated_orders:
+        await HourlyOrderMetric.bulk_update(updated_orders, fields=["throughput"], using_db=connection)
+
+    return dates
+
+
+class HourlyMetricsCounters:
+    """
+    Hourly status and throughput counters kept in Redis between flushes into the metric tables.
+    The counters are fed from the order outbox stream by HourlyMetricsConsumer, and every flush records the
+    stream position it merged in stream_consumer_offsets in the same transaction, so each event is counted once.
+    """
+
+    update_rewrite_script = redis_client.register_script(UPDATE_REWRITE_SCRIPT)
+    restore_rewrite_script = redis_client.register_script(RESTORE_REWRITE_SCRIPT)
+
+    @property
+    def enabled(self) -> bool:
+        return settings.analytics_incremental_enabled
+
+    async def pending(self) -> dict[str, str]:
+        """Delta fields not yet merged into the metric tables"""
+        if not self.enabled:
+            return {}
+
+        try:
+            async with redis_client.pipeline(transaction=True) as pipeline:
+                pipeline.hgetall(HOURLY_FLUSHING_KEY)
+                pipeline.hgetall(HOURLY_DELTAS_KEY)
+                flushing, deltas = await pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Could not read pending hourly metrics from Redis: {str(e)}")
+            return {}
+
+        if flushing and not await self._flushed(flushing[POSITION_FIELD]):
+            for field, value in flushing.items():
+                if field != POSITION_FIELD:
+                    deltas[field] = str(int(deltas.get(field, 0)) + int(value))
+        return deltas  # type: ignore[no-any-return]
+
+    @staticmethod
+    async def _flushed(position: str) -> bool:
+        flushed = await get_consumer_position(connections.get("default"), HOURLY_METRICS_CONSUMER)
+        return parse_stream_position(position) <= flushed
+
+    async def flush(self) -> int:
+        """Merge the counters into the metric tables and return the number of delta fields merged"""
+        lock = redis_client.lock(HOURLY_FLUSH_LOCK_KEY, timeout=HOURLY_FLUSH_LOCK_TIMEOUT)
+        if not await lock.acquire(blocking=False):
+            return 0
+
+        try:
+            return await self._flush_locked()
+        finally:
+            await lock.release()
+
+    @staticmethod
+    async def _flush_locked() -> int:
+        # a flush interrupted before clearing its deltas is finished first
+        if not await redis_client.exists(HOURLY_FLUSHING_KEY):
+            try:
+                # the consumer starts a new deltas hash with its next batch
+                await redis_client.rename(HOURLY_DELTAS_KEY, HOURLY_FLUSHING_KEY)
+            except ResponseError as e:
+                if "no such key" not in str(e):
+                    raise
+                return 0
+
+        fields = await redis_client.hgetall(HOURLY_FLUSHING_KEY)
+        if not fields:
+            return 0
+
+        position = parse_stream_position(fields[POSITION_FIELD])
+        dates: set[date] = set()
+        async with in_transaction() as connection:
+            if position > await get_consumer_position(connection, HOURLY_METRICS_CONSUMER):
+                dates = await merge_hourly_deltas(connection, fields)
+                if dates:
+                    await refresh_metric_rollups(connection, min(dates), max(dates))
+                await set_consumer_position(connection, HOURLY_METRICS_CONSUMER, position)
+        # cached responses hold the metric tables without these counters
+        await AnalyticsCache().invalidate(dates)
+
+        await redis_client.delete(HOURLY_FLUSHING_KEY)
+        return len(fields) - 1
+
+    @asynccontextmanager
+    async def rewriting(self, start: datetime, end: datetime) -> AsyncIterator[BaseDBAsyncClient]:
+        """
+        Transaction in which the metric rows of the UTC hours in [start, end) are rewritten from a rescan.
+        With incremental metrics the rescan sees every event of transactions in its snapshot, counted already or
+        still on its way through the outbox, so the counters must leave exactly those out:
+        - the consumer pauses while the rewrite is registered and the counters up to there are flushed,
+        - the rescan reads one REPEATABLE READ snapshot, recorded with the rewrite, and from then on the consumer
+          leaves out the increments of the rescanned hours whose transaction is visible in it,
+        - if the rewrite fails, those increments are put back.
+        Flushes wait until the rewrite is committed.
+        """
+        connection = connections.get("default")
+        if not self.enabled or not is_postgres(connection):
+            async with in_transaction() as transaction:
+                yield transaction
+            return
+
+        lock = redis_client.lock(
+            HOURLY_FLUSH_LOCK_KEY, timeout=HOURLY_FLUSH_LOCK_TIMEOUT, blocking_timeout=HOURLY_FLUSH_LOCK_TIMEOUT
+        )
+        if not await lock.acquire():
+            raise RuntimeError("Timed out waiting for the hourly metrics flush lock")
+
+        rewrite_id = uuid4().hex
+        skipped_key = HOURLY_REWRITE_SKIPPED_KEY.format(rewrite_id=rewrite_id)
+        rewrite: dict[str, Any] = {
+            "start": start.strftime("%Y-%m-%dT%H"),
+            "end": end.strftime("%Y-%m-%dT%H"),
+            "snapshot": None,
+            "committed": False,
+            "since": time.time()
+        }
+        try:
+            try:
+                await redis_client.hset(HOURLY_REWRITES_KEY, rewrite_id, json.dumps(rewrite))
+                # every event counted so far committed before the snapshot below, the rescan includes it
+                await self._flush_locked()
+
+                async with in_transaction() as transaction:
+                    await transaction.execute_script("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ")
+                    _, rows = await transaction.execute_query('SELECT pg_current_snapshot()::text AS "snapshot"')
+                    rewrite["snapshot"] = rows[0]["snapshot"]
+                    await self._update_rewrite(rewrite_id, rewrite)
+                    yield transaction
+            except BaseException:
+                await self.restore_rewrite_script(
+                    keys=[HOURLY_REWRITES_KEY, skipped_key, HOURLY_DELTAS_KEY],
+                    args=[rewrite_id]
+                )
+                raise
+
+            # the consumer keeps leaving out the rescan's events until it has read past the snapshot
+            rewrite["committed"] = True
+            await self._update_rewrite(rewrite_id, rewrite)
+            await redis_client.delete(skipped_key)
+        finally:
+            await lock.release()
+
+    async def _update_rewrite(self, rewrite_id: str, rewrite: dict[str, Any]) -> None:
+        if not await self.update_rewrite_script(keys=[HOURLY_REWRITES_KEY], args=[rewrite_id, json.dumps(rewrite)]):
+            raise RuntimeError(f"Hourly metrics rewrite {rewrite_id} was dropped by the consumer as abandoned")
+
+
+class HourlyMetricsConsumer:
+    """
+    Reads the order outbox stream and increments the hourly counters with HINCRBY, in the same MULTI that
+    advances the consumer's position, so a batch is applied completely or not at all.
+    """
+
+    def __init__(self) -> None:
+        self.stopping = asyncio.Event()
+
+    @staticmethod
+    async def position() -> str:
+        position = await redis_client.get(HOURLY_POSITION_KEY)
+        if position is None:
+            # the counters were lost with Redis, recount everything after the last flush
+            transaction_id, event_id = await get_consumer_position(
+                connections.get("default"), HOURLY_METRICS_CONSUMER
+            )
+            position = f"{transaction_id}-{event_id}"
+        return position  # type: ignore[no-any-return]
+
+    @staticmethod
+    async def apply(position: str, entries: list[tuple[str, dict[str, str]]]) -> bool:
+        """
+        Count the entries read after position; False when another consumer moved the position meanwhile or a
+        rewrite is starting, see HourlyMetricsCounters.rewriting
+        """
+        last_entry_id = entries[-1][0]
+        last_transaction_id, _ = parse_stream_position(last_entry_id)
+        async with redis_client.pipeline(transaction=True) as pipeline:
+            await pipeline.watch(HOURLY_POSITION_KEY, HOURLY_REWRITES_KEY)
+            current = await pipeline.get(HOURLY_POSITION_KEY)
+            if current is not None and current != position:
+                return False
+
+            rewrites, finished = {}, []
+            for rewrite_id, value in (await pipeline.hgetall(HOURLY_REWRITES_KEY)).items():
+                rewrite = json.loads(value)
+                abandoned = time.time() - rewrite["since"] > HOURLY_FLUSH_LOCK_TIMEOUT
+                if rewrite["snapshot"] is None and not abandoned:
+                    await asyncio.sleep(0.1)
+                    return False
+                if rewrite["snapshot"] is None:
+                    finished.append(rewrite_id)
+                    continue
+
+                rewrites[rewrite_id] = rewrite
+                # later entries all belong to transactions the snapshot does not see
+                if int(rewrite["snapshot"].split(":")[1]) <= last_transaction_id and (
+                    rewrite["committed"] or abandoned
+                ):
+                    finished.append(rewrite_id)
+
+            deltas, skipped = hourly_deltas(entries, rewrites)
+
+            pipeline.multi()
+            for field, value in deltas.items():
+                pipeline.hincrby(HOURLY_DELTAS_KEY, field, value)
+            for rewrite_id, rewrite_deltas in skipped.items():
+                if rewrites[rewrite_id]["committed"]:
+                    continue
+                for field, value in rewrite_deltas.items():
+                    pipeline.hincrby(HOURLY_REWRITE_SKIPPED_KEY.format(rewrite_id=rewrite_id), field, value)
+            pipeline.hset(HOURLY_DELTAS_KEY, POSITION_FIELD, last_entry_id)
+            pipeline.set(HOURLY_POSITION_KEY, last_entry_id)
+            for rewrite_id in finished:
+                pipeline.hdel(HOURLY_REWRITES_KEY, rewrite_id)
+                pipeline.delete(HOURLY_REWRITE_SKIPPED_KEY.format(rewrite_id=rewrite_id))
+            try:
+                await pipeline.execute()
+            except WatchError:
+                return False
+
+        HOURLY_METRICS_EVENTS.inc(len(entries))
+        return True
+
+    async def run(self) -> None:
+        logger.info(f"Hourly metrics consumer reading {settings.order_outbox_stream}")
+
+        position: str | None = None
+        while not self.stopping.is_set():
+            try:
+                if position is None:
+                    position = await self.position()
+
+                streams = await redis_client.xread(
+                    {settings.order_outbox_stream: position},
+                    count=settings.analytics_consumer_batch_size,
+                    block=settings.analytics_consumer_block_ms,
+                )
+                if not streams:
+                    continue
+
+                entries = streams[0][1]
+                position = entries[-1][0] if await self.apply(position, entries) else None
+            except RedisError as e:
+                logger.warning(f"Hourly metrics consumer lost Redis, retrying: {str(e)}")
+                position = None
+                await asyncio.sleep(1)
+            except Exception as e:
+                logger.exception(f"Hourly metrics consumer failed: {str(e)}")
+                position = None
+                await asyncio.sleep(1)
+
+
+async def run_consumer() -> None:
+    consumer = HourlyMetricsConsumer()
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, consumer.stopping.set)
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        await consumer.run()
+    finally:
+        await Tortoise.close_connections()
+        await redis_client.aclose()
+
+
+def merge_status_metrics(
+        metrics: list[dict[str, Any]],
+        fields: dict[str, str],
+        from_date: date,
+        to_date: date,
+        hour: int | None = None,
+        status: int | None = None,
+        granularity: str = HOUR
+) -> list[dict[str, Any]]:
+    """Add the pending delta fields that match the filters to status metric responses of the granularity"""
+    status_deltas, _ = parse_hourly_deltas(fields)
+    merged = {(metric["date"], metric["hour"], metric["status"]): metric for metric in metrics}
+    for (delta_date, delta_hour, delta_status), delta in status_deltas.items():
+        matches = from_date <= delta_date <= to_date and hour in (None, delta_hour) and status in (None, delta_status)
+        if not matches:
+            continue
+
+        start = period_start(delta_date, granularity)
+
+        bucket_hour = delta_hour if granularity == HOUR else None
+        metric = merged.setdefault((start.isoformat(), bucket_hour, delta_status), {
+            "date": start.isoformat(),
+            "hour": bucket_hour,
+            "granularity": granularity,
+            "status": delta_status,
+            "count": 0,
+            "total_duration": 0
+        })
+        metric["count"] += delta["count"]
+        metric["total_duration"] += delta["total_duration"]
+        metric["average_duration"] = metric["total_duration"] / metric["count"] if metric["count"] > 0 else 0
+    return [merged[key] for key in sorted(merged)]
+
+
+def merge_order_metrics(
+        metrics: list[dict[str, Any]],
+        fields: dict[str, str],
+        from_date: date,
+        to_date: date,
+        hour: int | None = None,
+        granularity: str = HOUR
+) -> list[dict[str, Any]]:
+    """Add the pending delta fields that match the filters to order throughput responses of the granularity"""
+    _, order_deltas = parse_hourly_deltas(fields)
+    merged = {(metric["date"], metric["hour"]): metric for metric in metrics}
+    for (delta_date, delta_hour), throughput in order_deltas.items():
+        if not (from_date <= delta_date <= to_date and hour in (None, delta_hour)):
+            continue
+
+        start = period_start(delta_date, granularity)
+
+        bucket_hour = delta_hour if granularity == HOUR else None
+        metric = merged.setdefault((start.isoformat(), bucket_hour), {
+            "date": start.isoformat(),
+            "hour": bucket_hour,
+            "granularity": granularity,
+            "throughput": 0
+        })
+        metric["throughput"] += throughput
+    return [merged[key] for key in sorted(merged)]
+
+
+if __name__ == "__main__":
+    setup_logger()
+    start_http_server(settings.analytics_consumer_metrics_port)
+    asyncio.run(run_consumer())
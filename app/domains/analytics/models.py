@@ -48,3 +48,30 @@ class CustomerLifetimeMetric(models.Model):
             Index(fields=["customer_id"]),
             Index(fields=["order_count"])
         ]
+
+
+# HourlyStatusMetric summed per day, ISO week (starting Monday) or month
+class StatusMetricRollup(models.Model):
+    id = fields.IntField(primary_key=True)
+    granularity = fields.CharField(max_length=5)  # day, week or month
+    period_start = fields.DateField()
+    status = fields.IntField()
+    count = fields.IntField()
+    total_duration = fields.BigIntField()
+    avg_duration = fields.FloatField()
+
+    class Meta:
+        table = "analytics_status_metric_rollups"
+        unique_together = (("granularity", "period_start", "status"),)
+
+
+# HourlyOrderMetric summed per day, ISO week (starting Monday) or month
+class OrderMetricRollup(models.Model):
+    id = fields.IntField(primary_key=True)
+    granularity = fields.CharField(max_length=5)
+    period_start = fields.DateField()
+    throughput = fields.IntField()
+
+    class Meta:
+        table = "analytics_order_metric_rollups"
+        unique_together = (("granularity", "period_start"),)
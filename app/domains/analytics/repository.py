@@ -3,7 +3,14 @@ from datetime import date, datetime
 from typing import Any
 
 from app.core.config import settings
-from app.domains.analytics.models import CustomerLifetimeMetric, HourlyOrderMetric, HourlyStatusMetric
+from app.domains.analytics.models import (
+    CustomerLifetimeMetric,
+    HourlyOrderMetric,
+    HourlyStatusMetric,
+    OrderMetricRollup,
+    StatusMetricRollup,
+)
+from app.domains.analytics.rollups import period_start, split_periods
 
 logger = logging.getLogger(__name__)
 
@@ -46,6 +53,70 @@ class AnalyticsRepository:
 
         return await query.order_by("date", "hour")
 
+    @staticmethod
+    async def get_status_metric_rollups(
+            granularity: str,
+            from_date: date,
+            to_date: date,
+            status: int | None = None
+    ) -> list[StatusMetricRollup]:
+        """
+        Get daily, weekly or monthly status metrics of the date range. A week or month the range covers only
+        partly is summed from the daily rollups of its days inside the range.
+        """
+        (whole_start, whole_end), edges = split_periods(from_date, to_date, granularity)
+        query = StatusMetricRollup.filter(
+            granularity=granularity,
+            period_start__gte=whole_start,
+            period_start__lt=whole_end
+        )
+        if status is not None:
+            query = query.filter(status=status)
+        rollups = await query
+
+        partial: dict[tuple[date, int], StatusMetricRollup] = {}
+        for edge_start, edge_end in edges:
+            days = StatusMetricRollup.filter(granularity="day", period_start__gte=edge_start, period_start__lt=edge_end)
+            if status is not None:
+                days = days.filter(status=status)
+            for day in await days:
+                start = period_start(day.period_start, granularity)
+                rollup = partial.setdefault((start, day.status), StatusMetricRollup(
+                    granularity=granularity, period_start=start, status=day.status, count=0, total_duration=0
+                ))
+                rollup.count += day.count
+                rollup.total_duration += day.total_duration
+        for rollup in partial.values():
+            rollup.avg_duration = rollup.total_duration / rollup.count if rollup.count > 0 else 0
+
+        return sorted([*rollups, *partial.values()], key=lambda rollup: (rollup.period_start, rollup.status))
+
+    @staticmethod
+    async def get_order_metric_rollups(granularity: str, from_date: date, to_date: date) -> list[OrderMetricRollup]:
+        """
+        Get daily, weekly or monthly order metrics of the date range. A week or month the range covers only
+        partly is summed from the daily rollups of its days inside the range.
+        """
+        (whole_start, whole_end), edges = split_periods(from_date, to_date, granularity)
+        rollups = await OrderMetricRollup.filter(
+            granularity=granularity,
+            period_start__gte=whole_start,
+            period_start__lt=whole_end
+        )
+
+        partial: dict[date, OrderMetricRollup] = {}
+        for edge_start, edge_end in edges:
+            for day in await OrderMetricRollup.filter(
+                granularity="day", period_start__gte=edge_start, period_start__lt=edge_end
+            ):
+                start = period_start(day.period_start, granularity)
+                rollup = partial.setdefault(
+                    start, OrderMetricRollup(granularity=granularity, period_start=start, throughput=0)
+                )
+                rollup.throughput += day.throughput
+
+        return sorted([*rollups, *partial.values()], key=lambda rollup: rollup.period_start)
+
     @staticmethod
     async def customer_exists(customer_id: int) -> bool:
         """Check if customer exists in the database"""
@@ -0,0 +1,176 @@
+from datetime import date, timedelta
+from typing import Any
+
+from tortoise import BaseDBAsyncClient
+
+from app.core.database import insert_many, is_postgres
+from app.domains.analytics.models import HourlyOrderMetric, HourlyStatusMetric, OrderMetricRollup, StatusMetricRollup
+
+HOUR = "hour"
+ROLLUP_GRANULARITIES = ("day", "week", "month")
+
+# the finest granularity whose buckets for a range of up to this many days stay few enough to chart;
+# longer ranges are read by month
+AUTOMATIC_GRANULARITY_DAYS = ((HOUR, 2), ("day", 62), ("week", 366))
+
+# $1 is the granularity, which date_trunc takes as its field, and [$2, $3) the days of the periods to refresh;
+# weeks start on Monday like ISO weeks. Periods whose hourly rows are gone are deleted, the others upserted.
+DELETE_STALE_STATUS_ROLLUPS_SQL = """
+    DELETE FROM "analytics_status_metric_rollups" AS "rollup"
+    WHERE "rollup"."granularity" = $1::text AND "rollup"."period_start" >= $2 AND "rollup"."period_start" < $3
+        AND NOT EXISTS (
+            SELECT 1 FROM "analytics_hourly_status_metrics" AS "metric"
+            WHERE "metric"."date" >= $2 AND "metric"."date" < $3 AND "metric"."status" = "rollup"."status"
+                AND date_trunc($1::text, "metric"."date"::timestamp)::date = "rollup"."period_start"
+        )
+"""
+
+UPSERT_STATUS_ROLLUPS_SQL = """
+    INSERT INTO "analytics_status_metric_rollups"
+        ("granularity", "period_start", "status", "count", "total_duration", "avg_duration")
+    SELECT $1::text, date_trunc($1::text, "date"::timestamp)::date, "status", SUM("count"), SUM("total_duration"),
+        CASE WHEN SUM("count") > 0 THEN SUM("total_duration")::float / SUM("count") ELSE 0 END
+    FROM "analytics_hourly_status_metrics"
+    WHERE "date" >= $2 AND "date" < $3
+    GROUP BY 2, 3
+    ON CONFLICT ("granularity", "period_start", "status") DO UPDATE SET "count" = EXCLUDED."count",
+        "total_duration" = EXCLUDED."total_duration", "avg_duration" = EXCLUDED."avg_duration"
+"""
+
+DELETE_STALE_ORDER_ROLLUPS_SQL = """
+    DELETE FROM "analytics_order_metric_rollups" AS "rollup"
+    WHERE "rollup"."granularity" = $1::text AND "rollup"."period_start" >= $2 AND "rollup"."period_start" < $3
+        AND NOT EXISTS (
+            SELECT 1 FROM "analytics_hourly_order_metrics" AS "metric"
+            WHERE "metric"."date" >= $2 AND "metric"."date" < $3
+                AND date_trunc($1::text, "metric"."date"::timestamp)::date = "rollup"."period_start"
+        )
+"""
+
+UPSERT_ORDER_ROLLUPS_SQL = """
+    INSERT INTO "analytics_order_metric_rollups" ("granularity", "period_start", "throughput")
+    SELECT $1::text, date_trunc($1::text, "date"::timestamp)::date, SUM("throughput")
+    FROM "analytics_hourly_order_metrics"
+    WHERE "date" >= $2 AND "date" < $3
+    GROUP BY 2
+    ON CONFLICT ("granularity", "period_start") DO UPDATE SET "throughput" = EXCLUDED."throughput"
+"""
+
+def period_start(day: date, granularity: str) -> date:
+    """First day of the day, week (starting Monday) or month that contains day"""
+    if granularity == "week":
+        return day - timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    return day
+
+
+def next_period_start(start: date, granularity: str) -> date:
+    if granularity == "week":
+        return start + timedelta(days=7)
+    if granularity == "month":
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=1)
+
+
+def choose_granularity(from_date: date, to_date: date) -> str:
+    """The granularity a range is read at when the client does not ask for one"""
+    days = (to_date - from_date).days + 1
+    for granularity, max_days in AUTOMATIC_GRANULARITY_DAYS:
+        if days <= max_days:
+            return granularity
+    return "month"
+
+
+def split_periods(
+        from_date: date,
+        to_date: date,
+        granularity: str
+) -> tuple[tuple[date, date], list[tuple[date, date]]]:
+    """
+    Split the inclusive date range into the [start, end) span of the granularity's periods it covers completely
+    and the [start, end) days at its edges that only cover part of a period
+    """
+    end = to_date + timedelta(days=1)
+    whole_start = period_start(from_date, granularity)
+    if whole_start < from_date:
+        whole_start = next_period_start(whole_start, granularity)
+    if whole_start >= end:
+        return (from_date, from_date), [(from_date, end)]
+
+    whole_end = period_start(end, granularity)
+    edges = [(start, edge_end) for start, edge_end in ((from_date, whole_start), (whole_end, end)) if start < edge_end]
+    return (whole_start, whole_end), edges
+
+
+async def refresh_metric_rollups(connection: BaseDBAsyncClient, from_date: date, to_date: date) -> None:
+    """
+    Recompute the daily, weekly and monthly rollups of every period that contains a date from from_date
+    to to_date (inclusive) from the hourly metrics, after those dates' hourly rows were written.
+    """
+    periods = {
+        granularity: (period_start(from_date, granularity),
+                      next_period_start(period_start(to_date, granularity), granularity))
+        for granularity in ROLLUP_GRANULARITIES
+    }
+    if is_postgres(connection):
+        # summed in the database, only the touched periods' rollup rows travel
+        for granularity, (granularity_start, granularity_end) in periods.items():
+            for sql in (
+                DELETE_STALE_STATUS_ROLLUPS_SQL,
+                UPSERT_STATUS_ROLLUPS_SQL,
+                DELETE_STALE_ORDER_ROLLUPS_SQL,
+                UPSERT_ORDER_ROLLUPS_SQL
+            ):
+                await connection.execute_query(sql, [granularity, granularity_start, granularity_end])
+        return
+
+    start = min(period[0] for period in periods.values())
+    end = max(period[1] for period in periods.values())
+
+    status_metrics = await HourlyStatusMetric.filter(date__gte=start, date__lt=end).using_db(connection).values(
+        "date", "status", "count", "total_duration"
+    )
+    order_metrics = await HourlyOrderMetric.filter(date__gte=start, date__lt=end).using_db(connection).values(
+        "date", "throughput"
+    )
+
+    for granularity, (granularity_start, granularity_end) in periods.items():
+        status_totals: dict[tuple[date, int], dict[str, Any]] = {}
+        for metric in status_metrics:
+            if not granularity_start <= metric["date"] < granularity_end:
+                continue
+            totals = status_totals.setdefault(
+                (period_start(metric["date"], granularity), metric["status"]), {"count": 0, "total_duration": 0}
+            )
+            totals["count"] += metric["count"]
+            totals["total_duration"] += metric["total_duration"]
+
+        throughput: dict[date, int] = {}
+        for metric in order_metrics:
+            if granularity_start <= metric["date"] < granularity_end:
+                key = period_start(metric["date"], granularity)
+                throughput[key] = throughput.get(key, 0) + metric["throughput"]
+
+        # periods whose hourly rows are gone must not keep their rollups
+        await StatusMetricRollup.filter(
+            granularity=granularity, period_start__gte=granularity_start, period_start__lt=granularity_end
+        ).using_db(connection).delete()
+        await OrderMetricRollup.filter(
+            granularity=granularity, period_start__gte=granularity_start, period_start__lt=granularity_end
+        ).using_db(connection).delete()
+        await insert_many(connection, StatusMetricRollup, [
+            {
+                "granularity": granularity,
+                "period_start": start_date,
+                "status": status,
+                "count": totals["count"],
+                "total_duration": totals["total_duration"],
+                "avg_duration": totals["total_duration"] / totals["count"] if totals["count"] > 0 else 0
+            }
+            for (start_date, status), totals in sorted(status_totals.items())
+        ])
+        await insert_many(connection, OrderMetricRollup, [
+            {"granularity": granularity, "period_start": start_date, "throughput": total}
+            for start_date, total in sorted(throughput.items())
+        ])
@@ -5,34 +5,80 @@ from typing import Any
 from kombu.exceptions import OperationalError
 
 from app.core.celery import celery_app
+from app.domains.analytics.cache import AnalyticsCache
+from app.domains.analytics.incremental import HourlyMetricsCounters, merge_order_metrics, merge_status_metrics
 from app.domains.analytics.repository import AnalyticsRepository
+from app.domains.analytics.rollups import HOUR, choose_granularity
 
 logger = logging.getLogger(__name__)
 
 class AnalyticsService:
     def __init__(self) -> None:
         self.analytics_repo = AnalyticsRepository()
+        self.hourly_counters = HourlyMetricsCounters()
+        self.cache = AnalyticsCache()
 
     async def get_hourly_status_metrics(
             self,
             from_date: date,
             to_date: date,
             hour: int | None = None,
-            status: int | None = None
+            status: int | None = None,
+            granularity: str | None = None
     ) -> list[dict[str, Any]]:
-        """Get hourly status metrics within a date range"""
-        metrics = await self.analytics_repo.get_hourly_status_metrics(from_date, to_date, hour, status)
+        """
+        Get status metrics within a date range, per hour or rolled up per day, week or month.
+        Without a granularity an hour filter reads hourly rows, otherwise the range length picks one.
+        """
+        granularity = granularity or (HOUR if hour is not None else choose_granularity(from_date, to_date))
 
+        async def load() -> list[dict[str, Any]]:
+            return await self._load_status_metrics(from_date, to_date, hour, status, granularity)
+
+        response = await self.cache.get_or_load(
+            "status_metrics", granularity, from_date, to_date, hour, status, load
+        )
+
+        if self.hourly_counters.enabled:
+            # the current hour and anything else not flushed yet
+            pending = await self.hourly_counters.pending()
+            return merge_status_metrics(response, pending, from_date, to_date, hour, status, granularity)
+
+        return response
+
+    async def _load_status_metrics(
+            self,
+            from_date: date,
+            to_date: date,
+            hour: int | None,
+            status: int | None,
+            granularity: str
+    ) -> list[dict[str, Any]]:
         response = []
-        for metric in metrics:
-            response.append({
-                "date": metric.date.isoformat() if metric.date else None,
-                "hour": metric.hour,
-                "status": metric.status,
-                "count": metric.count,
-                "total_duration": metric.total_duration,
-                "average_duration": metric.avg_duration
-            })
+        if granularity == HOUR:
+            metrics = await self.analytics_repo.get_hourly_status_metrics(from_date, to_date, hour, status)
+            for metric in metrics:
+                response.append({
+                    "date": metric.date.isoformat() if metric.date else None,
+                    "hour": metric.hour,
+                    "granularity": granularity,
+                    "status": metric.status,
+                    "count": metric.count,
+                    "total_duration": metric.total_duration,
+                    "average_duration": metric.avg_duration
+                })
+        else:
+            rollups = await self.analytics_repo.get_status_metric_rollups(granularity, from_date, to_date, status)
+            for rollup in rollups:
+                response.append({
+                    "date": rollup.period_start.isoformat(),
+                    "hour": None,
+                    "granularity": granularity,
+                    "status": rollup.status,
+                    "count": rollup.count,
+                    "total_duration": rollup.total_duration,
+                    "average_duration": rollup.avg_duration
+                })
 
         return response
 
@@ -41,19 +87,50 @@ class AnalyticsService:
             from_date: date,
             to_date: date,
             hour: int | None = None,
+            granularity: str | None = None
     ) -> list[dict[str, Any]]:
-        """Get hourly order throughput metrics within a date range"""
-        metrics = await self.analytics_repo.get_hourly_order_metrics(
-            from_date, to_date, hour
-        )
+        """Get order throughput metrics within a date range, per hour or rolled up per day, week or month"""
+        granularity = granularity or (HOUR if hour is not None else choose_granularity(from_date, to_date))
+
+        async def load() -> list[dict[str, Any]]:
+            return await self._load_order_metrics(from_date, to_date, hour, granularity)
+
+        response = await self.cache.get_or_load("order_metrics", granularity, from_date, to_date, hour, None, load)
+
+        if self.hourly_counters.enabled:
+            pending = await self.hourly_counters.pending()
+            return merge_order_metrics(response, pending, from_date, to_date, hour, granularity)
+
+        return response
 
+    async def _load_order_metrics(
+            self,
+            from_date: date,
+            to_date: date,
+            hour: int | None,
+            granularity: str
+    ) -> list[dict[str, Any]]:
         response = []
-        for metric in metrics:
-            response.append({
-                "date": metric.date.isoformat() if metric.date else None,
-                "hour": metric.hour,
-                "throughput": metric.throughput
-            })
+        if granularity == HOUR:
+            metrics = await self.analytics_repo.get_hourly_order_metrics(
+                from_date, to_date, hour
+            )
+            for metric in metrics:
+                response.append({
+                    "date": metric.date.isoformat() if metric.date else None,
+                    "hour": metric.hour,
+                    "granularity": granularity,
+                    "throughput": metric.throughput
+                })
+        else:
+            rollups = await self.analytics_repo.get_order_metric_rollups(granularity, from_date, to_date)
+            for rollup in rollups:
+                response.append({
+                    "date": rollup.period_start.isoformat(),
+                    "hour": None,
+                    "granularity": granularity,
+                    "throughput": rollup.throughput
+                })
 
         return response
 
@@ -1,51 +1,90 @@
-import asyncio
 import logging
-from collections.abc import Awaitable, Callable
-from datetime import datetime, timedelta, timezone
-from typing import Any, TypeVar, cast
-
-from tortoise import Tortoise
-from tortoise.functions import Count, Sum
-
-from app.core.cache import set_job_status
-from app.core.celery import celery_app
-from app.core.database import TORTOISE_ORM
+from collections import Counter
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any
+from uuid import uuid4
+
+from celery import chord
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.expressions import Q, Subquery
+from tortoise.functions import Count, Max, Min
+from tortoise.transactions import in_transaction
+
+from app.core.cache import get_job_status, redis_client, set_job_status
+from app.core.celery import tortoise_task
+from app.core.config import settings
+from app.core.database import insert_many, is_postgres, upsert_many
+from app.domains.analytics.cache import AnalyticsCache
+from app.domains.analytics.incremental import HourlyMetricsCounters
 from app.domains.analytics.models import CustomerLifetimeMetric, HourlyOrderMetric, HourlyStatusMetric
-from app.domains.orders.models import Customer, Order, OrderStatusHistory
+from app.domains.analytics.rollups import refresh_metric_rollups
+from app.domains.orders.models import ArchivedOrder, Customer, Order, OrderStatusHistory
+from app.domains.orders.repository import status_history_durations
 
 logger = logging.getLogger(__name__)
 
-T = TypeVar("T")
-
-
-def tortoise_task(task_func: Callable[..., Awaitable[T]]) -> Any:
-    """Decorator to initialize Tortoise ORM for celery tasks"""
-    task_name = f"app.domains.analytics.tasks.{task_func.__name__}"
-
-    @celery_app.task(name=task_name)
-    def wrapper(*args: Any, **kwargs: Any) -> T:
-        loop = asyncio.get_event_loop()
-
-        async def run_task() -> T:
-            await Tortoise.init(config=TORTOISE_ORM)
-            try:
-                return await task_func(*args, **kwargs)
-            finally:
-                await Tortoise.close_connections()
-
-        return loop.run_until_complete(run_task())
-
-    return wrapper
+# a status lasts until the order's next history row, which may lie after the range
+HOURLY_STATUS_METRICS_SQL = """
+    SELECT date_trunc('hour', "history"."timestamp" AT TIME ZONE 'UTC') AS "hour", "history"."status",
+        COUNT(*) AS "count",
+        COALESCE(SUM(FLOOR(EXTRACT(EPOCH FROM "next"."timestamp" - "history"."timestamp"))), 0)::bigint
+            AS "total_duration"
+    FROM "order_status_history" AS "history"
+    LEFT JOIN LATERAL (
+        SELECT "following"."timestamp" FROM "order_status_history" AS "following"
+        WHERE "following"."order_id" = "history"."order_id"
+            AND ("following"."timestamp", "following"."id") > ("history"."timestamp", "history"."id")
+        ORDER BY "following"."timestamp", "following"."id"
+        LIMIT 1
+    ) AS "next" ON TRUE
+    WHERE "history"."timestamp" >= $1 AND "history"."timestamp" < $2
+    GROUP BY 1, 2
+"""
+
+# archived orders still count towards their customer's lifetime metrics
+CUSTOMER_ORDER_TOTALS_SQL = """
+    SELECT "customer_id", COUNT(*) AS "order_count", MIN("created_at") AS "first_order_at",
+        MAX("created_at") AS "last_order_at"
+    FROM (
+        SELECT "customer_id", "created_at" FROM "orders"
+        UNION ALL
+        SELECT "customer_id", "created_at" FROM "order_archive" WHERE "customer_id" IS NOT NULL
+    ) AS "customer_orders"
+    WHERE "customer_id" > $1
+        AND ($2::timestamptz IS NULL OR "customer_id" IN (
+            SELECT "customer_id" FROM "orders" WHERE "created_at" >= $2
+            UNION
+            SELECT "customer_id" FROM "order_archive" WHERE "created_at" >= $2
+        ))
+    GROUP BY "customer_id"
+    ORDER BY "customer_id"
+    LIMIT $3
+"""
+
+HOURLY_ORDER_METRICS_SQL = """
+    SELECT date_trunc('hour', "created_at" AT TIME ZONE 'UTC') AS "hour", COUNT(*) AS "throughput"
+    FROM "orders"
+    WHERE "created_at" >= $1 AND "created_at" < $2
+    GROUP BY 1
+"""
 
 
 @tortoise_task
 async def aggregate_hourly_metrics(target_hour: str | None = None) -> str:
     """Aggregate metrics for a specific hour or the previous hour if not specified"""
+    if settings.analytics_incremental_enabled and not target_hour:
+        # the hourly counters are flushed by flush_hourly_metrics, a rescan would overwrite their later increments
+        return "Hourly metrics are maintained incrementally"
+
     try:
         await set_job_status("hourly_metrics", {"status": "running"})
 
         if target_hour:
+            # hours are UTC hours, like the ones the metric rows are grouped by
             target_hour_dt = datetime.fromisoformat(target_hour)
+            if target_hour_dt.tzinfo is None:
+                target_hour_dt = target_hour_dt.replace(tzinfo=timezone.utc)
+            target_hour_dt = target_hour_dt.astimezone(timezone.utc)
         else:
             now = datetime.now(timezone.utc)
             target_hour_dt = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
@@ -58,46 +97,34 @@ async def aggregate_hourly_metrics(target_hour: str | None = None) -> str:
 
         logger.info(f"Processing hourly metrics for {target_date} hour {hour}")
 
-        status_results = await OrderStatusHistory.filter(
-            timestamp__gte=hour_start,
-            timestamp__lt=hour_end
-        ).group_by("status").annotate(
-            count=Count("id"),
-            total_duration=Sum("duration")
-        ).values("status", "count", "total_duration")
-
-        logger.info(f"Retrieved {len(status_results)} status results")
-        for result in status_results:
-            total_duration = result["total_duration"] or 0
-            average_duration = total_duration / result["count"] if result["count"] > 0 else 0
-            await HourlyStatusMetric.update_or_create(
-                date=target_date,
-                hour=hour,
-                status=result["status"],
-                defaults={
-                    "count": result["count"],
-                    "total_duration": total_duration,
-                    "avg_duration": average_duration
-                }
+        async with HourlyMetricsCounters().rewriting(hour_start, hour_end) as connection:
+            status_rows, order_rows = await _hourly_metric_rows(connection, hour_start, hour_end)
+            logger.info(f"Retrieved {len(status_rows)} status results")
+            await upsert_many(
+                connection,
+                HourlyStatusMetric,
+                status_rows,
+                on_conflict=("date", "hour", "status"),
+                on_conflict_update=("count", "total_duration", "avg_duration")
             )
 
-        total_orders = await Order.filter(
-            created_at__gte=hour_start,
-            created_at__lt=hour_end
-        ).count()
-
-        await HourlyOrderMetric.update_or_create(
-            date=target_date,
-            hour=hour,
-            defaults={"throughput": total_orders}
-        )
+            total_orders = order_rows[0]["throughput"]
+            await upsert_many(
+                connection,
+                HourlyOrderMetric,
+                order_rows,
+                on_conflict=("date", "hour"),
+                on_conflict_update=("throughput",)
+            )
+            await refresh_metric_rollups(connection, target_date, target_date)
+        await AnalyticsCache().invalidate([target_date])
 
         await set_job_status("hourly_metrics", {
             "status": "completed",
             "processed_date": target_date.isoformat(),
             "processed_hour": hour,
             "order_count": total_orders,
-            "status_count": len(status_results)
+            "status_count": len(status_rows)
         })
 
         return f"Processed metrics for {target_date} hour {hour}"
@@ -111,11 +138,237 @@ async def aggregate_hourly_metrics(target_hour: str | None = None) -> str:
         raise
 
 
+async def _hourly_metric_rows(
+        connection: BaseDBAsyncClient,
+        start: datetime,
+        end: datetime
+) -> tuple[list[dict[str, Any]], list[dict[str, Any]]]:
+    """HourlyStatusMetric and HourlyOrderMetric rows for every hour in [start, end), one grouped query each"""
+    status_totals: dict[tuple[datetime, int], dict[str, int]] = {}
+    throughput: Counter[datetime] = Counter()
+    if is_postgres(connection):
+        _, status_results = await connection.execute_query(HOURLY_STATUS_METRICS_SQL, [start, end])
+        for result in status_results:
+            status_totals[(result["hour"], result["status"])] = {
+                "count": result["count"],
+                "total_duration": result["total_duration"]
+            }
+        _, order_results = await connection.execute_query(HOURLY_ORDER_METRICS_SQL, [start, end])
+        for result in order_results:
+            throughput[result["hour"]] = result["throughput"]
+    else:
+        history = await OrderStatusHistory.filter(timestamp__gte=start, timestamp__lt=end).using_db(connection)
+        durations = status_history_durations(await OrderStatusHistory.filter(
+            order_id__in={status.order_id for status in history},  # type: ignore[attr-defined]
+            timestamp__gte=start
+        ).using_db(connection))
+        for status in history:
+            hour_start = status.timestamp.astimezone(timezone.utc).replace(
+                minute=0, second=0, microsecond=0, tzinfo=None
+            )
+            totals = status_totals.setdefault((hour_start, status.status), {"count": 0, "total_duration": 0})
+            totals["count"] += 1
+            totals["total_duration"] += durations[status.id] or 0
+        for order in await Order.filter(
+            created_at__gte=start, created_at__lt=end
+        ).using_db(connection).values("created_at"):
+            hour_start = order["created_at"].astimezone(timezone.utc).replace(
+                minute=0, second=0, microsecond=0, tzinfo=None
+            )
+            throughput[hour_start] += 1
+
+    status_rows = [
+        {
+            "date": hour_start.date(),
+            "hour": hour_start.hour,
+            "status": status,
+            "count": totals["count"],
+            "total_duration": totals["total_duration"],
+            "avg_duration": totals["total_duration"] / totals["count"]
+        }
+        for (hour_start, status), totals in sorted(status_totals.items())
+    ]
+    # like aggregate_hourly_metrics, hours without orders get a zero throughput row
+    order_rows = []
+    hour_start = start.astimezone(timezone.utc).replace(tzinfo=None)
+    while hour_start < end.astimezone(timezone.utc).replace(tzinfo=None):
+        order_rows.append({"date": hour_start.date(), "hour": hour_start.hour, "throughput": throughput[hour_start]})
+        hour_start += timedelta(hours=1)
+
+    return status_rows, order_rows
+
+
+def _backfill_chunks(from_date: date, to_date: date) -> list[tuple[str, str]]:
+    """Split the inclusive date range into [start, end) date pairs of HOURLY_METRICS_BACKFILL_CHUNK_DAYS days"""
+    chunks = []
+    chunk_start, range_end = from_date, to_date + timedelta(days=1)
+    while chunk_start < range_end:
+        chunk_end = min(chunk_start + timedelta(days=settings.hourly_metrics_backfill_chunk_days), range_end)
+        chunks.append((chunk_start.isoformat(), chunk_end.isoformat()))
+        chunk_start = chunk_end
+    return chunks
+
+
+def _oldest_rebuildable_date() -> date | None:
+    """
+    First date whose orders and status history are all still in the database: archival deletes closed orders
+    created before its cutoff with their history, and the history retention never drops months after that cutoff
+    """
+    if not settings.order_archive_enabled:
+        return None
+    archive_cutoff = datetime.now(timezone.utc) - timedelta(days=settings.order_archive_after_days)
+    return archive_cutoff.date() + timedelta(days=1)
+
+
+@tortoise_task
+async def backfill_hourly_metrics(from_date: str, to_date: str) -> str:
+    """
+    Rebuild the hourly metrics of every hour from from_date to to_date (inclusive) in parallel.
+    The range is split into chunks that run as separate tasks on any worker, and a chord callback
+    reports the result once all of them are done.
+    """
+    try:
+        start_date, end_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+        if start_date > end_date:
+            raise ValueError("from_date must be before or equal to to_date")
+        # a rescan of archived days would replace their metrics with those of the orders left
+        oldest_date = _oldest_rebuildable_date()
+        if oldest_date is not None and start_date < oldest_date:
+            raise ValueError(f"Orders before {oldest_date.isoformat()} may be archived, from_date must not be earlier")
+
+        chunks = _backfill_chunks(start_date, end_date)
+        backfill_id = uuid4().hex
+        await set_job_status("hourly_metrics_backfill", {
+            "status": "running",
+            "from_date": from_date,
+            "to_date": to_date,
+            "chunks": len(chunks),
+            "completed_chunks": 0
+        })
+
+        chord(
+            backfill_hourly_metrics_chunk.s(chunk_start, chunk_end, backfill_id, len(chunks))
+            for chunk_start, chunk_end in chunks
+        )(finish_hourly_metrics_backfill.s(from_date, to_date))
+
+        return f"Backfilling hourly metrics from {from_date} to {to_date} in {len(chunks)} chunks"
+
+    except Exception as e:
+        logger.error(f"Error starting hourly metrics backfill: {str(e)}")
+        await set_job_status("hourly_metrics_backfill", {
+            "status": "failed",
+            "error": str(e)
+        })
+        raise
+
+
+@tortoise_task
+async def backfill_hourly_metrics_chunk(chunk_start: str, chunk_end: str, backfill_id: str, chunks: int) -> int:
+    """Replace the hourly metrics of the dates in [chunk_start, chunk_end) and return the number of rows written"""
+    try:
+        start_date, end_date = date.fromisoformat(chunk_start), date.fromisoformat(chunk_end)
+        start = datetime.combine(start_date, time(), tzinfo=timezone.utc)
+        end = datetime.combine(end_date, time(), tzinfo=timezone.utc)
+
+        async with HourlyMetricsCounters().rewriting(start, end) as connection:
+            status_rows, order_rows = await _hourly_metric_rows(connection, start, end)
+            # hours that lost all their history must not keep their old rows
+            await HourlyStatusMetric.filter(date__gte=start_date, date__lt=end_date).using_db(connection).delete()
+            await HourlyOrderMetric.filter(date__gte=start_date, date__lt=end_date).using_db(connection).delete()
+            await insert_many(connection, HourlyStatusMetric, status_rows)
+            await insert_many(connection, HourlyOrderMetric, order_rows)
+
+        progress_key = f"job_progress:hourly_metrics_backfill:{backfill_id}"
+        completed = await redis_client.incr(progress_key)
+        await redis_client.expire(progress_key, settings.redis_expiration_time)
+        if completed < chunks:
+            await set_job_status("hourly_metrics_backfill", {
+                "status": "running",
+                "chunks": chunks,
+                "completed_chunks": completed
+            })
+
+        return len(status_rows) + len(order_rows)
+
+    except Exception as e:
+        logger.error(f"Error backfilling hourly metrics from {chunk_start} to {chunk_end}: {str(e)}")
+        await set_job_status("hourly_metrics_backfill", {
+            "status": "failed",
+            "failed_chunk": [chunk_start, chunk_end],
+            "error": str(e)
+        })
+        raise
+
+
+@tortoise_task
+async def finish_hourly_metrics_backfill(rows: list[int], from_date: str, to_date: str) -> str:
+    """Roll the rebuilt hours up once every chunk is written, chunks sharing a week or month would race"""
+    try:
+        start_date, end_date = date.fromisoformat(from_date), date.fromisoformat(to_date)
+        async with in_transaction() as connection:
+            await refresh_metric_rollups(connection, start_date, end_date)
+        await AnalyticsCache().invalidate(
+            start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)
+        )
+
+        await set_job_status("hourly_metrics_backfill", {
+            "status": "completed",
+            "from_date": from_date,
+            "to_date": to_date,
+            "chunks": len(rows),
+            "completed_chunks": len(rows),
+            "written_rows": sum(rows)
+        })
+
+        return f"Backfilled hourly metrics from {from_date} to {to_date}"
+
+    except Exception as e:
+        logger.error(f"Error rolling up backfilled hourly metrics: {str(e)}")
+        await set_job_status("hourly_metrics_backfill", {
+            "status": "failed",
+            "error": str(e)
+        })
+        raise
+
+
+@tortoise_task
+async def flush_hourly_metrics() -> str:
+    """Merge the hourly counters collected in Redis since the last flush into the metric tables"""
+    try:
+        counters = HourlyMetricsCounters()
+        if not counters.enabled:
+            return "Incremental hourly metrics are disabled"
+
+        await set_job_status("hourly_metrics_flush", {"status": "running"})
+
+        merged = await counters.flush()
+
+        await set_job_status("hourly_metrics_flush", {
+            "status": "completed",
+            "merged_counters": merged
+        })
+
+        return f"Merged {merged} hourly counters"
+
+    except Exception as e:
+        logger.error(f"Error flushing hourly metrics: {str(e)}")
+        await set_job_status("hourly_metrics_flush", {
+            "status": "failed",
+            "error": str(e)
+        })
+        raise
+
+
 @tortoise_task
 async def update_customer_metrics(customer_id: int | None = None) -> str:
     """Update customer lifetime metrics for a specific customer or all customers"""
+    if settings.customer_metrics_incremental and not customer_id:
+        return await _update_changed_customer_metrics()
+
+    # the incremental runs read their watermark from the job status, other runs must not drop it
+    watermark = (await get_job_status("customer_metrics") or {}).get("watermark")
     try:
-        await set_job_status("customer_metrics", {"status": "running"})
+        await set_job_status("customer_metrics", {"status": "running", "watermark": watermark})
 
         if customer_id:
             customers = await Customer.filter(id=customer_id).prefetch_related("orders")
@@ -137,7 +390,8 @@ async def update_customer_metrics(customer_id: int | None = None) -> str:
 
             await set_job_status("customer_metrics", {
                 "status": "completed",
-                "processed_customers": processed_count
+                "processed_customers": processed_count,
+                "watermark": watermark
             })
 
             return f"Updated metrics for {processed_count} customers"
@@ -147,7 +401,8 @@ async def update_customer_metrics(customer_id: int | None = None) -> str:
 
         await set_job_status("customer_metrics", {
             "status": "completed",
-            "processed_customers": processed_count
+            "processed_customers": processed_count,
+            "watermark": watermark
         })
 
         return f"Updated metrics for {processed_count} customers"
@@ -156,48 +411,185 @@ async def update_customer_metrics(customer_id: int | None = None) -> str:
         logger.error(f"Error updating customer metrics: {str(e)}")
         await set_job_status("customer_metrics", {
             "status": "failed",
-            "error": str(e)
+            "error": str(e),
+            "watermark": watermark
+        })
+        raise
+
+
+def _order_frequency_days(order_count: int, first_order_at: datetime, last_order_at: datetime) -> float | None:
+    if order_count < 2:
+        return None
+
+    total_days = (last_order_at - first_order_at).days
+    return total_days / (order_count - 1) if total_days > 0 else 0
+
+
+async def _update_changed_customer_metrics() -> str:
+    """
+    Recompute the lifetime metrics of customers with orders created since the watermark of the last successful
+    run, grouping their orders, archived ones included, by customer in the database, batch by batch in customer
+    id order.
+    Without a watermark every customer is recomputed. The watermark is the run's start time, stored with the
+    job status, and the next run looks back CUSTOMER_METRICS_WATERMARK_LAG seconds before it for orders that
+    were committed late.
+    """
+    previous = await get_job_status("customer_metrics") or {}
+    watermark = previous.get("watermark")
+    try:
+        await set_job_status("customer_metrics", {"status": "running", "watermark": watermark})
+        started_at = datetime.now(timezone.utc)
+
+        changed_since = None
+        if watermark:
+            changed_since = datetime.fromisoformat(watermark) - timedelta(
+                seconds=settings.customer_metrics_watermark_lag
+            )
+
+        processed_count = 0
+        last_customer_id = 0
+        while True:
+            results = await _customer_order_totals(
+                last_customer_id, changed_since, settings.customer_metrics_batch_size
+            )
+            if not results:
+                break
+
+            await upsert_many(
+                connections.get("default"),
+                CustomerLifetimeMetric,
+                [
+                    {
+                        **result,
+                        "avg_order_frequency_days": _order_frequency_days(
+                            result["order_count"], result["first_order_at"], result["last_order_at"]
+                        )
+                    }
+                    for result in results
+                ],
+                on_conflict=("customer_id",),
+                on_conflict_update=("order_count", "first_order_at", "last_order_at", "avg_order_frequency_days")
+            )
+            processed_count += len(results)
+            last_customer_id = results[-1]["customer_id"]
+
+        await set_job_status("customer_metrics", {
+            "status": "completed",
+            "processed_customers": processed_count,
+            "watermark": started_at.isoformat()
+        })
+
+        return f"Updated metrics for {processed_count} customers"
+
+    except Exception as e:
+        logger.error(f"Error updating customer metrics: {str(e)}")
+        # the next run starts again from the last successful one
+        await set_job_status("customer_metrics", {
+            "status": "failed",
+            "error": str(e),
+            "watermark": watermark
         })
         raise
 
 
+async def _customer_order_totals(
+        after_customer_id: int,
+        changed_since: datetime | None,
+        limit: int
+) -> list[dict[str, Any]]:
+    """
+    order_count, first_order_at and last_order_at of the next customers after after_customer_id, in customer id
+    order, counting archived orders too; with changed_since only customers with orders created since then
+    """
+    connection = connections.get("default")
+    if is_postgres(connection):
+        _, results = await connection.execute_query(
+            CUSTOMER_ORDER_TOTALS_SQL, [after_customer_id, changed_since, limit]
+        )
+        return [dict(result) for result in results]
+
+    # the ORM has no UNION, so live and archived orders are grouped apart; the first customers of the union are
+    # among the first of each side
+    changed = Q()
+    if changed_since:
+        changed = Q(customer_id__in=Subquery(
+            Order.filter(created_at__gte=changed_since).values("customer_id")
+        )) | Q(customer_id__in=Subquery(
+            ArchivedOrder.filter(created_at__gte=changed_since).values("customer_id")
+        ))
+    totals: dict[int, dict[str, Any]] = {}
+    for orders in (
+        Order.filter(changed, customer_id__gt=after_customer_id).annotate(order_count=Count("id")),
+        ArchivedOrder.filter(changed, customer_id__gt=after_customer_id).annotate(order_count=Count("order_id"))
+    ):
+        for total in await orders.group_by("customer_id").annotate(
+            first_order_at=Min("created_at"),
+            last_order_at=Max("created_at")
+        ).order_by("customer_id").limit(limit).values(
+            "customer_id", "order_count", "first_order_at", "last_order_at"
+        ):
+            other = totals.get(total["customer_id"])
+            totals[total["customer_id"]] = total if other is None else _combine_totals(other, total)
+    return [totals[customer_id] for customer_id in sorted(totals)[:limit]]
+
+
+def _combine_totals(total: dict[str, Any], other: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "customer_id": total["customer_id"],
+        "order_count": total["order_count"] + other["order_count"],
+        "first_order_at": min(total["first_order_at"], other["first_order_at"]),
+        "last_order_at": max(total["last_order_at"], other["last_order_at"])
+    }
+
+
+async def _archived_order_totals(customer_ids: list[int]) -> dict[int, dict[str, Any]]:
+    """order_count, first_order_at and last_order_at of the archived orders of the customers"""
+    return {
+        archived["customer_id"]: archived
+        for archived in await ArchivedOrder.filter(
+            customer_id__in=customer_ids
+        ).group_by("customer_id").annotate(
+            order_count=Count("order_id"),
+            first_order_at=Min("created_at"),
+            last_order_at=Max("created_at")
+        ).values("customer_id", "order_count", "first_order_at", "last_order_at")
+    }
+
+
 async def _process_customer_batch(customers: list[Customer]) -> int:
     """Process a batch of customers and return count of processed records"""
-    processed_count = 0
-    metrics_to_update = []
-
+    # customers whose orders are all archived still have metrics
+    archived_totals = await _archived_order_totals([customer.id for customer in customers])
+    totals = []
     for customer in customers:
         orders = sorted(customer.orders, key=lambda o: o.created_at)
-        if not orders:
-            continue
-
-        order_count = len(orders)
-        first_order_at = orders[0].created_at
-        last_order_at = orders[-1].created_at
-
-        avg_frequency = None
-        if order_count > 1:
-            total_days = (last_order_at - first_order_at).days
-            avg_frequency = total_days / (order_count - 1) if total_days > 0 else 0
-
-        metrics_to_update.append({
-            "customer_id": customer.id,
-            "defaults": {
-                "order_count": order_count,
-                "first_order_at": first_order_at,
-                "last_order_at": last_order_at,
-                "avg_order_frequency_days": avg_frequency
+        total = archived_totals.get(customer.id)
+        if orders:
+            live_total = {
+                "customer_id": customer.id,
+                "order_count": len(orders),
+                "first_order_at": orders[0].created_at,
+                "last_order_at": orders[-1].created_at
             }
-        })
-        processed_count += 1
-
-    # bulk update in batches of 50
-    for i in range(0, len(metrics_to_update), 50):
-        batch = metrics_to_update[i:i + 50]
-        for metric in batch:
-            await CustomerLifetimeMetric.update_or_create(
-                customer_id=metric["customer_id"],
-                defaults=cast(dict[str, Any], metric["defaults"])
+            total = live_total if total is None else _combine_totals(live_total, total)
+        if total is not None:
+            totals.append(total)
+
+    metrics_to_update = [
+        {
+            **total,
+            "avg_order_frequency_days": _order_frequency_days(
+                total["order_count"], total["first_order_at"], total["last_order_at"]
             )
-
-    return processed_count
+        }
+        for total in totals
+    ]
+    await upsert_many(
+        connections.get("default"),
+        CustomerLifetimeMetric,
+        metrics_to_update,
+        on_conflict=("customer_id",),
+        on_conflict_update=("order_count", "first_order_at", "last_order_at", "avg_order_frequency_days")
+    )
+
+    return len(metrics_to_update)
@@ -0,0 +1,76 @@
+import asyncio
+import gzip
+import os
+from collections import defaultdict
+from datetime import date
+from pathlib import Path
+from typing import Any
+from uuid import uuid4
+
+from prometheus_client import Counter
+
+from app.api.v1.orders.schemas import Order
+from app.core.config import settings
+from app.domains.orders.models import ArchivedOrder
+
+ORDER_ARCHIVE_READS = Counter("oms_order_archive_reads_total", "Order reads served from the archive")
+ORDERS_ARCHIVED = Counter("oms_orders_archived_total", "Closed orders moved from the database to the archive")
+
+
+class OrderArchive:
+    """
+    Closed orders moved out of the database into gzip compressed NDJSON files under ORDER_ARCHIVE_PATH,
+    one directory per creation date. Every order is written as its own gzip member, so a read seeks to the
+    location recorded in order_archive and decompresses that order only.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return settings.order_archive_enabled
+
+    @staticmethod
+    def write(orders: list[Order]) -> list[dict[str, Any]]:
+        """Write the orders durably and return the order_archive rows locating each of them"""
+        by_date: dict[date, list[Order]] = defaultdict(list)
+        for order in orders:
+            by_date[order.created_at.date()].append(order)
+
+        locations: list[dict[str, Any]] = []
+        for created_date, group in sorted(by_date.items()):
+            path = f"created_date={created_date.isoformat()}/orders-{group[0].id}-{uuid4().hex[:8]}.ndjson.gz"
+            file_path = Path(settings.order_archive_path) / path
+            file_path.parent.mkdir(parents=True, exist_ok=True)
+
+            with file_path.open("wb") as file:
+                for order in group:
+                    member = gzip.compress(order.model_dump_json().encode() + b"\n")
+                    locations.append({
+                        "order_id": order.id,
+                        "path": path,
+                        "byte_offset": file.tell(),
+                        "byte_length": len(member),
+                    })
+                    file.write(member)
+                # the orders are deleted from the database once this returns
+                file.flush()
+                os.fsync(file.fileno())
+
+        return locations
+
+    @staticmethod
+    def _read(path: str, byte_offset: int, byte_length: int) -> bytes:
+        with (Path(settings.order_archive_path) / path).open("rb") as file:
+            file.seek(byte_offset)
+            return gzip.decompress(file.read(byte_length))
+
+    async def get(self, order_id: int) -> Order | None:
+        if not self.enabled:
+            return None
+
+        location = await ArchivedOrder.get_or_none(order_id=order_id)
+        if location is None:
+            return None
+
+        payload = await asyncio.to_thread(self._read, location.path, location.byte_offset, location.byte_length)
+        ORDER_ARCHIVE_READS.inc()
+        return Order.model_validate_json(payload)
@@ -0,0 +1,216 @@
+import logging
+from collections import OrderedDict
+from typing import Generic, TypeVar
+
+from prometheus_client import Counter
+from redis.exceptions import RedisError
+
+from app.api.v1.orders.schemas import Address, Customer, Order
+from app.core.cache import redis_client
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ORDER_CACHE_HITS = Counter("oms_order_cache_hits_total", "Order reads served from the cache")
+ORDER_CACHE_MISSES = Counter("oms_order_cache_misses_total", "Order reads that fell through to the database")
+ORDER_CACHE_EVICTIONS = Counter("oms_order_cache_evictions_total", "Cached orders removed after a write")
+ORDER_DUPLICATES = Counter(
+    "oms_order_duplicates_total", "Resubmitted orders answered with the original order", ["source"]
+)
+
+ORDER_LOOKUP_CACHE_HITS = Counter(
+    "oms_order_lookup_cache_hits_total", "Embedded customers and addresses resolved in process", ["kind"]
+)
+ORDER_LOOKUP_CACHE_MISSES = Counter(
+    "oms_order_lookup_cache_misses_total", "Embedded customers and addresses upserted in the database", ["kind"]
+)
+
+ChannelKey = tuple[str, str]
+K = TypeVar("K")
+V = TypeVar("V")
+
+
+# Stores a serialized order only if the order's version key still holds the version read before the order was
+# loaded, so a load that raced an invalidation cannot put the stale order back.
+# KEYS: order key, version key; ARGV: expected version ("" when there was none), payload, ttl
+FILL_ORDER_SCRIPT = """
+local version = redis.call('GET', KEYS[2]) or ''
+if version ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+"""
+
+
+class OrderCache:
+    """
+    Read-through cache of serialized Order payloads in Redis.
+    Every invalidation bumps a per-order version; reads return the version they saw and an order is only
+    cached if its version is unchanged when it is written.
+    Cache failures are logged and treated as misses so the database stays the source of truth.
+    """
+
+    fill_script = redis_client.register_script(FILL_ORDER_SCRIPT)
+
+    @staticmethod
+    def _key(order_id: int) -> str:
+        return f"order:{order_id}"
+
+    @staticmethod
+    def _version_key(order_id: int) -> str:
+        return f"order_version:{order_id}"
+
+    @property
+    def enabled(self) -> bool:
+        return settings.order_cache_enabled
+
+    async def get(self, order_id: int) -> tuple[Order | None, str | None]:
+        """The cached order, or None and the version to pass to set once the order is loaded"""
+        orders, versions = await self.get_many([order_id])
+        return orders.get(order_id), versions.get(order_id)
+
+    async def get_many(self, order_ids: list[int]) -> tuple[dict[int, Order], dict[int, str]]:
+        """
+        Fetch cached orders and the versions of the missed ones with a single MGET.
+        Misses have no version when the cache could not be read, and are then not cached either.
+        """
+        if not self.enabled or not order_ids:
+            return {}, {}
+
+        try:
+            values = await redis_client.mget([
+                key for order_id in order_ids for key in (self._key(order_id), self._version_key(order_id))
+            ])
+        except RedisError as e:
+            logger.warning(f"Error reading orders from cache: {str(e)}")
+            return {}, {}
+
+        orders: dict[int, Order] = {}
+        versions: dict[int, str] = {}
+        for index, order_id in enumerate(order_ids):
+            payload, version = values[2 * index], values[2 * index + 1]
+            if payload is not None:
+                orders[order_id] = Order.model_validate_json(payload)
+            else:
+                versions[order_id] = version or ""
+        ORDER_CACHE_HITS.inc(len(orders))
+        ORDER_CACHE_MISSES.inc(len(order_ids) - len(orders))
+        return orders, versions
+
+    async def set(self, orders: list[Order], versions: dict[int, str] | None = None) -> None:
+        """
+        Cache orders loaded after their versions were read; orders without a version are skipped.
+        Without versions the orders were just created and are cached unless one was invalidated already.
+        """
+        if not self.enabled or not orders:
+            return
+
+        try:
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                for order in orders:
+                    version = "" if versions is None else versions.get(order.id)
+                    if version is None:
+                        continue
+                    await self.fill_script(
+                        keys=[self._key(order.id), self._version_key(order.id)],
+                        args=[version, order.model_dump_json(), settings.order_cache_ttl],
+                        client=pipeline
+                    )
+                await pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Error writing orders to cache: {str(e)}")
+
+    async def invalidate(self, order_ids: list[int]) -> None:
+        if not self.enabled or not order_ids:
+            return
+
+        try:
+            async with redis_client.pipeline(transaction=True) as pipeline:
+                pipeline.delete(*(self._key(order_id) for order_id in order_ids))
+                for order_id in order_ids:
+                    pipeline.incr(self._version_key(order_id))
+                    # only has to outlive the reads in flight, a missing version is a version of its own
+                    pipeline.expire(self._version_key(order_id), settings.order_cache_ttl)
+                evicted, *_ = await pipeline.execute()
+            ORDER_CACHE_EVICTIONS.inc(evicted)
+        except RedisError as e:
+            logger.warning(f"Error invalidating cached orders {order_ids}: {str(e)}")
+
+
+class ChannelOrderIndex:
+    """
+    Maps (account_id, channel_order_id) to order ids in Redis, so channel retries are recognised
+    before any database round trip. The unique index on orders remains the source of truth.
+    """
+
+    @staticmethod
+    def _key(key: ChannelKey) -> str:
+        account_id, channel_order_id = key
+        return f"order_channel:{account_id}:{channel_order_id}"
+
+    @property
+    def enabled(self) -> bool:
+        return settings.order_dedup_enabled
+
+    async def get_many(self, keys: list[ChannelKey]) -> dict[ChannelKey, int]:
+        if not self.enabled or not keys:
+            return {}
+
+        try:
+            order_ids = await redis_client.mget([self._key(key) for key in keys])
+        except RedisError as e:
+            logger.warning(f"Error reading channel order ids: {str(e)}")
+            return {}
+
+        return {key: int(order_id) for key, order_id in zip(keys, order_ids, strict=True) if order_id is not None}
+
+    async def set(self, orders: list[Order]) -> None:
+        if not self.enabled or not orders:
+            return
+
+        try:
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                for order in orders:
+                    pipeline.set(
+                        self._key((order.account_id or "", order.channel_order_id)),
+                        order.id,
+                        ex=settings.order_dedup_ttl
+                    )
+                await pipeline.execute()
+        except RedisError as e:
+            logger.warning(f"Error writing channel order ids: {str(e)}")
+
+
+class LRUCache(Generic[K, V]):
+    """Small in-process least recently used mapping; entries are only dropped for capacity"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[K, V] = OrderedDict()
+
+    def get(self, key: K) -> V | None:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: K, value: V) -> None:
+        if self.max_size <= 0:
+            return
+
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: K) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+# phone -> (customer id, stored customer) and normalized address key -> (address id, stored address)
+customer_lookup: LRUCache[str, tuple[int, Customer]] = LRUCache(settings.order_lookup_cache_size)
+address_lookup: LRUCache[str, tuple[int, Address]] = LRUCache(settings.order_lookup_cache_size)
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+from collections.abc import AsyncIterator
+from datetime import datetime
+from typing import Any
+
+from prometheus_client import Counter, Gauge
+from redis.exceptions import RedisError
+
+from app.core.cache import redis_client
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+ORDER_EVENTS_PUBLISHED = Counter("oms_order_events_published_total", "Order status events published to Redis")
+ORDER_EVENTS_DROPPED = Counter(
+    "oms_order_events_dropped_total", "Order status events dropped because a subscriber queue was full"
+)
+ORDER_EVENT_SUBSCRIBERS = Gauge("oms_order_event_subscribers", "Live order event subscribers in this process")
+
+SubscriberKey = tuple[str | None, str | None]
+
+
+def order_status_event(
+        order_id: int,
+        account_id: str,
+        brand_id: str,
+        status: int,
+        timestamp: datetime
+) -> dict[str, Any]:
+    return {
+        "order_id": order_id,
+        "account_id": account_id,
+        "brand_id": brand_id,
+        "status": status,
+        "timestamp": timestamp.isoformat(),
+    }
+
+
+class OrderEventPublisher:
+    """
+    Publishes compact order status events on a Redis pub/sub channel.
+    Publishing is best effort: failures are logged and never fail the write that produced the event.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return settings.order_events_enabled
+
+    async def publish(self, events: list[dict[str, Any]]) -> None:
+        if not self.enabled or not events:
+            return
+
+        try:
+            async with redis_client.pipeline(transaction=False) as pipeline:
+                for event in events:
+                    pipeline.publish(settings.order_events_channel, json.dumps(event, separators=(",", ":")))
+                await pipeline.execute()
+            ORDER_EVENTS_PUBLISHED.inc(len(events))
+        except RedisError as e:
+            logger.warning(f"Error publishing order events: {str(e)}")
+
+
+class OrderEventBroker:
+    """
+    Fans order events out to the subscribers of this process.
+    A single pub/sub connection is shared by all subscribers, so an idle subscriber only costs a bounded queue.
+    Subscribers are indexed by their (account_id, brand_id) filter, which keeps dispatch proportional
+    to the number of matching subscribers rather than to all of them.
+    """
+
+    def __init__(self) -> None:
+        self._subscribers: dict[SubscriberKey, set[asyncio.Queue[str]]] = {}
+        self._listener: asyncio.Task[None] | None = None
+
+    def subscribe(self, account_id: str | None = None, brand_id: str | None = None) -> asyncio.Queue[str]:
+        queue: asyncio.Queue[str] = asyncio.Queue(maxsize=settings.order_events_queue_size)
+        self._subscribers.setdefault((account_id, brand_id), set()).add(queue)
+        ORDER_EVENT_SUBSCRIBERS.inc()
+
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+        return queue
+
+    def unsubscribe(
+            self,
+            queue: asyncio.Queue[str],
+            account_id: str | None = None,
+            brand_id: str | None = None
+    ) -> None:
+        key = (account_id, brand_id)
+        queues = self._subscribers.get(key)
+        if queues is None or queue not in queues:
+            return
+
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[key]
+        ORDER_EVENT_SUBSCRIBERS.dec()
+
+        if not self._subscribers and self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def stream(self, account_id: str | None = None, brand_id: str | None = None) -> AsyncIterator[str | None]:
+        """Yield event payloads for one subscriber, or None when nothing arrived within the heartbeat interval"""
+        queue = self.subscribe(account_id, brand_id)
+        try:
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=settings.order_events_heartbeat)
+                except TimeoutError:
+                    yield None
+        finally:
+            self.unsubscribe(queue, account_id, brand_id)
+
+    def dispatch(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+            account_id, brand_id = event["account_id"], event["brand_id"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning(f"Ignoring malformed order event: {payload}")
+            return
+
+        for key in {(None, None), (account_id, None), (None, brand_id), (account_id, brand_id)}:
+            for queue in self._subscribers.get(key, ()):
+                try:
+                    queue.put_nowait(payload)
+                except asyncio.QueueFull:
+                    ORDER_EVENTS_DROPPED.inc()
+
+    async def _listen(self) -> None:
+        while True:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            try:
+                await pubsub.subscribe(settings.order_events_channel)
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        self.dispatch(message["data"])
+            except RedisError as e:
+                logger.warning(f"Order event subscription failed, reconnecting: {str(e)}")
+            except Exception:
+                # anything else would end the listener for good and leave every subscriber waiting on heartbeats
+                logger.exception("Order event listener failed, reconnecting")
+            finally:
+                try:
+                    await pubsub.aclose()
+                except Exception as e:
+                    logger.warning(f"Failed to close order event subscription: {str(e)}")
+            await asyncio.sleep(settings.order_events_reconnect_delay)
+
+
+order_event_broker = OrderEventBroker()
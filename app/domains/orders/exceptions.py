@@ -0,0 +1,9 @@
+from app.api.v1.orders.schemas import Order
+
+
+class DuplicateOrderError(ValueError):
+    """An order with the same account_id and channel_order_id exists already"""
+
+    def __init__(self, order: Order) -> None:
+        super().__init__(f"Order {order.channel_order_id} of account {order.account_id} already exists")
+        self.order = order
@@ -0,0 +1,76 @@
+from uuid import uuid4
+
+from app.api.v1.orders.schemas import OrderCreate, OrderIngestionState, OrderIngestionStatus
+from app.core.cache import redis_client
+from app.core.config import settings
+
+
+class OrderIngestion:
+    """
+    Producer side of the asynchronous ingestion mode.
+    Validated orders are appended to a Redis Stream and tracked by a status key until the worker writes them.
+    """
+
+    @property
+    def enabled(self) -> bool:
+        return settings.order_ingestion_mode == "async"
+
+    @staticmethod
+    def _status_key(tracking_id: str) -> str:
+        return f"order_ingestion:{tracking_id}"
+
+    async def enqueue(self, order: OrderCreate) -> OrderIngestionStatus:
+        """Append the order to the ingestion stream; raises RedisError when it could not be queued"""
+        status = OrderIngestionStatus(tracking_id=str(uuid4()), status=OrderIngestionState.pending)
+
+        async with redis_client.pipeline(transaction=True) as pipeline:
+            pipeline.set(
+                self._status_key(status.tracking_id),
+                status.model_dump_json(),
+                ex=settings.order_ingestion_status_ttl
+            )
+            pipeline.xadd(
+                settings.order_ingestion_stream,
+                {"tracking_id": status.tracking_id, "order": order.model_dump_json()}
+            )
+            await pipeline.execute()
+
+        return status
+
+    async def get_status(self, tracking_id: str) -> OrderIngestionStatus | None:
+        payload = await redis_client.get(self._status_key(tracking_id))
+        if payload is None:
+            return None
+        return OrderIngestionStatus.model_validate_json(payload)
+
+    async def set_statuses(self, statuses: list[OrderIngestionStatus], message_ids: list[str]) -> None:
+        """Record the outcome of processed entries, then acknowledge and delete them from the stream"""
+        async with redis_client.pipeline(transaction=True) as pipeline:
+            for status in statuses:
+                pipeline.set(
+                    self._status_key(status.tracking_id),
+                    status.model_dump_json(),
+                    ex=settings.order_ingestion_status_ttl
+                )
+            pipeline.xack(settings.order_ingestion_stream, settings.order_ingestion_group, *message_ids)
+            pipeline.xdel(settings.order_ingestion_stream, *message_ids)
+            await pipeline.execute()
+
+    async def dead_letter(self, message_id: str, fields: dict[str, str], deliveries: int, error: str) -> None:
+        """Move an entry that keeps failing to the dead-letter stream and mark its order failed"""
+        tracking_id = fields.get("tracking_id", message_id)
+        status = OrderIngestionStatus(tracking_id=tracking_id, status=OrderIngestionState.failed, error=error)
+
+        async with redis_client.pipeline(transaction=True) as pipeline:
+            pipeline.xadd(
+                settings.order_ingestion_dead_letter_stream,
+                {**fields, "entry_id": message_id, "deliveries": deliveries, "error": error}
+            )
+            pipeline.set(
+                self._status_key(tracking_id),
+                status.model_dump_json(),
+                ex=settings.order_ingestion_status_ttl
+            )
+            pipeline.xack(settings.order_ingestion_stream, settings.order_ingestion_group, message_id)
+            pipeline.xdel(settings.order_ingestion_stream, message_id)
+            await pipeline.execute()
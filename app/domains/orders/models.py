@@ -18,6 +18,8 @@ class Address(Model):
     city = fields.CharField(max_length=100)
     street = fields.CharField(max_length=255)
     postal_code = fields.CharField(max_length=20)
+    # lowercased, whitespace-collapsed "postal_code|city|street", used to upsert embedded addresses
+    normalized_key = fields.CharField(max_length=400, null=True, unique=True)
     created_at = fields.DatetimeField(auto_now_add=True)
 
     class Meta:
@@ -36,11 +38,27 @@ class Order(Model):
         "orders.Address", related_name="orders"
     )
     created_at = fields.DatetimeField(auto_now_add=True)
+    # denormalized from the latest order_status_history row, kept in sync on every transition
+    current_status = fields.IntField(default=1)
+    current_status_since = fields.DatetimeField(auto_now_add=True)
+    # compact status history: comma separated "status:offset" entries, offsets in seconds since created_at
+    status_timeline = fields.TextField(default="")
+    # tracking id of orders written by the ingestion worker, makes redelivered stream entries idempotent
+    ingestion_id = fields.CharField(max_length=36, null=True, unique=True)
     items: fields.ReverseRelation["OrderItem"]
     status_history: fields.ReverseRelation["OrderStatusHistory"]
 
     class Meta:
         table = "orders"
+        unique_together = (("account_id", "channel_order_id"),)
+        indexes = [
+            Index(fields=["account_id", "created_at", "id"], name="idx_orders_account_created"),
+            Index(fields=["brand_id", "created_at", "id"], name="idx_orders_brand_created"),
+            Index(fields=["customer_id", "created_at", "id"], name="idx_orders_customer_created"),
+            Index(fields=["current_status", "created_at", "id"], name="idx_orders_status_created"),
+            Index(fields=["created_at", "id"], name="idx_orders_created"),
+            Index(fields=["pickup_time"], name="idx_orders_pickup_time"),
+        ]
 
 class OrderItem(Model):
     id = fields.IntField(primary_key=True)
@@ -54,6 +72,7 @@ class OrderItem(Model):
     class Meta:
         table = "order_items"
 
+# append-only log of transitions: a status lasts until the order's next row, see status_history_durations
 class OrderStatusHistory(Model):
     id = fields.IntField(primary_key=True)
     order: ForeignKeyRelation[Order] = fields.ForeignKeyField(
@@ -61,8 +80,49 @@ class OrderStatusHistory(Model):
     )
     status = fields.IntField()
     timestamp = fields.DatetimeField(auto_now_add=True)
-    duration = fields.IntField(null=True)
 
     class Meta:
         table = "order_status_history"
-        indexes = [Index(fields=["order_id", "timestamp"])]
+        # range partitioned by month on timestamp on Postgres, see migration 7
+        indexes = [
+            Index(fields=["order_id", "timestamp"]),
+            Index(fields=["timestamp"], name="idx_status_history_timestamp"),
+        ]
+
+# order events appended in the transaction of the write that produced them, relayed by app.domains.orders.outbox
+class OrderOutboxEvent(Model):
+    id = fields.BigIntField(primary_key=True)
+    # id of the writing transaction, filled by the column default on Postgres
+    transaction_id = fields.BigIntField(null=True)
+    event_type = fields.CharField(max_length=32)
+    order_id = fields.IntField()
+    payload = fields.TextField()
+    created_at = fields.DatetimeField(auto_now_add=True)
+
+    class Meta:
+        table = "order_outbox"
+        indexes = [Index(fields=["transaction_id", "id"], name="idx_order_outbox_position")]
+
+class StreamConsumerOffset(Model):
+    consumer = fields.CharField(max_length=100, primary_key=True)
+    # "<transaction_id>-<outbox id>" of the last stream entry whose effects were committed
+    last_entry_id = fields.CharField(max_length=41)
+    updated_at = fields.DatetimeField(auto_now=True)
+
+    class Meta:
+        table = "stream_consumer_offsets"
+
+# location of a closed order moved to the archive: a gzip member inside one of its files
+class ArchivedOrder(Model):
+    order_id = fields.IntField(primary_key=True)
+    path = fields.CharField(max_length=255)
+    byte_offset = fields.BigIntField()
+    byte_length = fields.IntField()
+    archived_at = fields.DatetimeField(auto_now_add=True)
+    # kept from the order so customer lifetime metrics still count it
+    customer_id = fields.IntField(null=True)
+    created_at = fields.DatetimeField(null=True)
+
+    class Meta:
+        table = "order_archive"
+        indexes = [Index(fields=["customer_id", "created_at"], name="idx_order_archive_customer_created")]
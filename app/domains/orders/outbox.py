@@ -0,0 +1,217 @@
+import asyncio
+import contextlib
+import json
+import logging
+import signal
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+
+from prometheus_client import Counter, Gauge, start_http_server
+from redis.exceptions import RedisError, ResponseError
+from tortoise import BaseDBAsyncClient, Tortoise, connections
+
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import TORTOISE_ORM, insert_many
+from app.core.logger import setup_logger
+from app.domains.orders.models import StreamConsumerOffset
+
+logger = logging.getLogger(__name__)
+
+ORDER_OUTBOX_RELAYED = Counter("oms_order_outbox_relayed_total", "Outbox events published to the Redis Stream")
+ORDER_OUTBOX_POSITION = Gauge("oms_order_outbox_position", "Transaction id of the last relayed outbox event")
+
+ORDER_CREATED = "order_created"
+STATUS_CHANGED = "status_changed"
+
+# A stream entry id is "<transaction_id>-<outbox id>". Only events of transactions older than every running one
+# are relayed, so no event can commit behind the relay's position and entry ids only ever grow.
+# A long running transaction anywhere in the database holds the relay back until it ends.
+SELECT_OUTBOX_EVENTS_SQL = """
+    SELECT "id", "transaction_id", "event_type", "payload"
+    FROM "order_outbox"
+    WHERE ("transaction_id", "id") > ($1, $2)
+        AND "transaction_id" < pg_snapshot_xmin(pg_current_snapshot())::text::bigint
+    ORDER BY "transaction_id", "id"
+    LIMIT $3
+"""
+
+PRUNE_OUTBOX_EVENTS_SQL = """
+    DELETE FROM "order_outbox"
+    WHERE "created_at" < $1 AND ("transaction_id", "id") <= ($2, $3)
+"""
+
+StreamPosition = tuple[int, int]
+
+
+def format_event_timestamp(timestamp: datetime) -> str:
+    return timestamp.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def order_created_event(
+        order_id: int,
+        account_id: str,
+        brand_id: str,
+        created_at: datetime
+) -> dict[str, Any]:
+    """Outbox row for a created order; the order enters RECEIVED at created_at"""
+    return {
+        "event_type": ORDER_CREATED,
+        "order_id": order_id,
+        "payload": json.dumps({
+            "order_id": order_id,
+            "account_id": account_id,
+            "brand_id": brand_id,
+            "created_at": format_event_timestamp(created_at),
+        }, separators=(",", ":")),
+        "created_at": created_at,
+    }
+
+
+def status_changed_event(
+        order_id: int,
+        previous_status: int,
+        previous_status_since: datetime,
+        status: int,
+        timestamp: datetime,
+        duration: int
+) -> dict[str, Any]:
+    """Outbox row for a status transition; duration is the time spent in previous_status"""
+    return {
+        "event_type": STATUS_CHANGED,
+        "order_id": order_id,
+        "payload": json.dumps({
+            "order_id": order_id,
+            "previous_status": previous_status,
+            "previous_status_since": format_event_timestamp(previous_status_since),
+            "status": status,
+            "timestamp": format_event_timestamp(timestamp),
+            "duration": duration,
+        }, separators=(",", ":")),
+        "created_at": timestamp,
+    }
+
+
+def parse_stream_position(entry_id: str) -> StreamPosition:
+    transaction_id, event_id = entry_id.split("-")
+    return int(transaction_id), int(event_id)
+
+
+async def get_consumer_position(connection: BaseDBAsyncClient, consumer: str) -> StreamPosition:
+    """Last outbox stream entry whose effects the consumer has committed"""
+    offset = await StreamConsumerOffset.filter(consumer=consumer).using_db(connection).first()
+    return parse_stream_position(offset.last_entry_id) if offset else (0, 0)
+
+
+async def set_consumer_position(connection: BaseDBAsyncClient, consumer: str, position: StreamPosition) -> None:
+    """Store the consumer's position; called in the transaction that commits the effects of the entries"""
+    await insert_many(connection, StreamConsumerOffset, [{
+        "consumer": consumer,
+        "last_entry_id": f"{position[0]}-{position[1]}",
+        "updated_at": datetime.now(timezone.utc),
+    }], on_conflict=("consumer",), on_conflict_update=("last_entry_id", "updated_at"))
+
+
+class OrderOutboxRelay:
+    """
+    Publishes order_outbox rows to a Redis Stream in commit order, using the outbox position as entry id.
+    The relay resumes from the stream's last generated id, and an entry that was published already is refused
+    by Redis, so every event appears in the stream once. Outbox rows are kept for replays until they are
+    older than ORDER_OUTBOX_RETENTION_DAYS and have been relayed.
+    """
+
+    def __init__(self) -> None:
+        self.stopping = asyncio.Event()
+        self.pruned_at = 0.0
+
+    @staticmethod
+    async def last_published() -> StreamPosition:
+        try:
+            info = await redis_client.xinfo_stream(settings.order_outbox_stream)
+        except ResponseError as e:
+            if "no such key" not in str(e):
+                raise
+            return 0, 0
+        return parse_stream_position(info["last-generated-id"])
+
+    @staticmethod
+    async def relay_batch(position: StreamPosition) -> StreamPosition:
+        """Publish the events after position and return the position of the last one"""
+        _, rows = await connections.get("default").execute_query(
+            SELECT_OUTBOX_EVENTS_SQL, [*position, settings.order_outbox_batch_size]
+        )
+        if not rows:
+            return position
+
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            for row in rows:
+                pipeline.xadd(
+                    settings.order_outbox_stream,
+                    {"type": row["event_type"], "payload": row["payload"]},
+                    id=f"{row['transaction_id']}-{row['id']}",
+                    maxlen=settings.order_outbox_stream_maxlen,
+                    approximate=True,
+                )
+            results = await pipeline.execute(raise_on_error=False)
+
+        for result in results:
+            if isinstance(result, ResponseError) and "equal or smaller" not in str(result):
+                raise result
+
+        ORDER_OUTBOX_RELAYED.inc(len(rows))
+        ORDER_OUTBOX_POSITION.set(rows[-1]["transaction_id"])
+        return rows[-1]["transaction_id"], rows[-1]["id"]
+
+    async def prune(self, position: StreamPosition) -> None:
+        if time.monotonic() - self.pruned_at < settings.order_outbox_prune_interval:
+            return
+
+        created_before = datetime.now(timezone.utc) - timedelta(days=settings.order_outbox_retention_days)
+        await connections.get("default").execute_query(PRUNE_OUTBOX_EVENTS_SQL, [created_before, *position])
+        self.pruned_at = time.monotonic()
+
+    async def run(self) -> None:
+        logger.info(f"Order outbox relay publishing to {settings.order_outbox_stream}")
+
+        position: StreamPosition | None = None
+        while not self.stopping.is_set():
+            try:
+                if position is None:
+                    position = await self.last_published()
+
+                relayed = await self.relay_batch(position)
+                await self.prune(relayed)
+                if relayed == position:
+                    with contextlib.suppress(TimeoutError):
+                        await asyncio.wait_for(self.stopping.wait(), settings.order_outbox_poll_interval)
+                position = relayed
+            except RedisError as e:
+                # the stream may have been lost with Redis, resume from what it holds now
+                logger.warning(f"Order outbox relay lost Redis, retrying: {str(e)}")
+                position = None
+                await asyncio.sleep(1)
+            except Exception as e:
+                logger.exception(f"Order outbox relay failed: {str(e)}")
+                await asyncio.sleep(1)
+
+
+async def run_relay() -> None:
+    relay = OrderOutboxRelay()
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, relay.stopping.set)
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        await relay.run()
+    finally:
+        await Tortoise.close_connections()
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    setup_logger()
+    start_http_server(settings.order_outbox_metrics_port)
+    asyncio.run(run_relay())
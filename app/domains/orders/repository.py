@@ -1,120 +1,993 @@
+import base64
+import binascii
+import json
+import math
+from collections import defaultdict
+from collections.abc import AsyncIterator, Iterable, Sequence
+from datetime import datetime, timedelta
+from itertools import pairwise
+from typing import Any, NamedTuple
+
+from tortoise import connections, timezone
+from tortoise.exceptions import IntegrityError
+from tortoise.expressions import Q
+from tortoise.queryset import QuerySet
 from tortoise.transactions import in_transaction
 
-from app.api.v1.orders.schemas import Address, Customer, Order, OrderCreate, OrderItem, OrderStatus, OrderStatusEnum
+from app.api.v1.orders.schemas import (
+    Address,
+    Customer,
+    Order,
+    OrderCreate,
+    OrderItem,
+    OrderPage,
+    OrderStatus,
+    OrderStatusEnum,
+    OrderSummary,
+    OrderView,
+)
+from app.core.config import settings
+from app.core.database import insert_many, is_postgres, sql_parameter
+from app.domains.orders.cache import (
+    ORDER_LOOKUP_CACHE_HITS,
+    ORDER_LOOKUP_CACHE_MISSES,
+    address_lookup,
+    customer_lookup,
+)
+from app.domains.orders.exceptions import DuplicateOrderError
+from app.domains.orders.models import Address as AddressModel
+from app.domains.orders.models import ArchivedOrder, OrderOutboxEvent, OrderStatusHistory
+from app.domains.orders.models import Customer as CustomerModel
 from app.domains.orders.models import Order as OrderModel
 from app.domains.orders.models import OrderItem as OrderItemModel
-from app.domains.orders.models import OrderStatusHistory
+from app.domains.orders.outbox import order_created_event, status_changed_event
+
+ALLOWED_STATUS_TRANSITIONS: dict[OrderStatusEnum, set[OrderStatusEnum]] = {
+    OrderStatusEnum.RECEIVED: {OrderStatusEnum.PREPARING, OrderStatusEnum.READY_FOR_PICKUP, OrderStatusEnum.CANCELED},
+    OrderStatusEnum.PREPARING: {OrderStatusEnum.READY_FOR_PICKUP, OrderStatusEnum.CANCELED},
+    OrderStatusEnum.READY_FOR_PICKUP: {OrderStatusEnum.COMPLETED, OrderStatusEnum.CANCELED},
+    OrderStatusEnum.COMPLETED: set(),
+    OrderStatusEnum.CANCELED: set(),
+}
+
+# timestamps are rendered in UTC so the JSON does not depend on the session time zone
+_UTC_TIMESTAMP_FORMAT = """'YYYY-MM-DD"T"HH24:MI:SS.US"Z"'"""
+
+# $1/$2 requested order ids and statuses, $3/$4 allowed (from, to) status pairs, $5 transition timestamp,
+# $6 whether to append status_changed events to the outbox.
+# Returns one row per existing requested order, with a NULL history_id when its transition is not allowed.
+UPDATE_ORDER_STATUSES_SQL = f"""
+    WITH "requested" AS (
+        SELECT * FROM unnest($1::int[], $2::int[]) AS "r" ("order_id", "status")
+    ), "target" AS (
+        SELECT "orders"."id", "orders"."created_at", "orders"."current_status", "orders"."current_status_since",
+               "requested"."status"
+        FROM "orders" JOIN "requested" ON "requested"."order_id" = "orders"."id"
+        ORDER BY "orders"."id"
+        FOR UPDATE OF "orders"
+    ), "allowed" AS (
+        SELECT "target".* FROM "target"
+        JOIN unnest($3::int[], $4::int[]) AS "t" ("from_status", "to_status")
+            ON "t"."from_status" = "target"."current_status" AND "t"."to_status" = "target"."status"
+    ), "updated" AS (
+        UPDATE "orders" SET "current_status" = "allowed"."status", "current_status_since" = $5::timestamptz,
+            "status_timeline" = CONCAT_WS(
+                ',',
+                NULLIF("orders"."status_timeline", ''),
+                "allowed"."status" || ':' || FLOOR(EXTRACT(EPOCH FROM $5::timestamptz - "orders"."created_at"))::int
+            )
+        FROM "allowed"
+        WHERE "orders"."id" = "allowed"."id"
+    ), "inserted" AS (
+        INSERT INTO "order_status_history" ("order_id", "status", "timestamp")
+        SELECT "id", "status", $5::timestamptz FROM "allowed"
+        RETURNING "id", "order_id"
+    ), "outboxed" AS (
+        -- mirrors status_changed_event
+        INSERT INTO "order_outbox" ("event_type", "order_id", "payload", "created_at")
+        SELECT 'status_changed', "allowed"."id", json_build_object(
+            'order_id', "allowed"."id",
+            'previous_status', "allowed"."current_status",
+            'previous_status_since', to_char(
+                "allowed"."current_status_since" AT TIME ZONE 'UTC', {_UTC_TIMESTAMP_FORMAT}
+            ),
+            'status', "allowed"."status",
+            'timestamp', to_char($5::timestamptz AT TIME ZONE 'UTC', {_UTC_TIMESTAMP_FORMAT}),
+            'duration', FLOOR(EXTRACT(EPOCH FROM $5::timestamptz - "allowed"."current_status_since"))::int
+        )::text, $5::timestamptz
+        FROM "allowed"
+        WHERE $6::bool
+    )
+    SELECT "target"."id" AS "order_id",
+           "target"."created_at",
+           "target"."current_status" AS "previous_status",
+           "target"."current_status_since",
+           "inserted"."id" AS "history_id",
+           FLOOR(EXTRACT(EPOCH FROM $5::timestamptz - "target"."current_status_since"))::int AS "duration"
+    FROM "target"
+    LEFT JOIN "inserted" ON "inserted"."order_id" = "target"."id"
+"""
+
+# mirrors status_history_durations
+_STATUS_HISTORY_JSON = f"""
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', "history"."id",
+                'order_id', "history"."order_id",
+                'status', "history"."status",
+                'timestamp', to_char("history"."timestamp" AT TIME ZONE 'UTC', {_UTC_TIMESTAMP_FORMAT}),
+                'duration', NULLIF("history"."duration", 0)
+            ) ORDER BY "history"."id")
+            FROM (
+                SELECT "order_status_history".*,
+                       FLOOR(EXTRACT(EPOCH FROM LEAD("timestamp") OVER (
+                           ORDER BY "timestamp", "id"
+                       ) - "timestamp"))::int AS "duration"
+                FROM "order_status_history" WHERE "order_status_history"."order_id" = "orders"."id"
+            ) AS "history"
+        ), '[]'::json)
+"""
+
+# mirrors parse_status_timeline
+_STATUS_TIMELINE_JSON = f"""
+        COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', NULL,
+                'order_id', "orders"."id",
+                'status', "entry"."status",
+                'timestamp', to_char(
+                    ("orders"."created_at" + make_interval(secs => "entry"."offset")) AT TIME ZONE 'UTC',
+                    {_UTC_TIMESTAMP_FORMAT}
+                ),
+                'duration', NULLIF("entry"."next_offset" - "entry"."offset", 0)
+            ) ORDER BY "entry"."position")
+            FROM (
+                SELECT ROW_NUMBER() OVER (ORDER BY "timeline"."ordinality") AS "position",
+                       split_part("timeline"."value", ':', 1)::int AS "status",
+                       split_part("timeline"."value", ':', 2)::int AS "offset",
+                       LEAD(split_part("timeline"."value", ':', 2)::int) OVER (
+                           ORDER BY "timeline"."ordinality"
+                       ) AS "next_offset"
+                FROM unnest(string_to_array("orders"."status_timeline", ',')) WITH ORDINALITY
+                    AS "timeline" ("value", "ordinality")
+                WHERE "timeline"."value" <> ''
+            ) AS "entry"
+        ), '[]'::json)
+"""
+
+# the complete order as a single JSON document shaped like the Order schema
+_GET_ORDER_JSON_SQL = """
+    SELECT json_build_object(
+        'id', "orders"."id",
+        'account_id', "orders"."account_id",
+        'brand_id', "orders"."brand_id",
+        'channel_order_id', "orders"."channel_order_id",
+        'customer', json_build_object('name', "customers"."name", 'phoneNumber', "customers"."phone"),
+        'delivery_address', json_build_object(
+            'city', "addresses"."city", 'street', "addresses"."street", 'postalCode', "addresses"."postal_code"
+        ),
+        'pickup_time', to_char("orders"."pickup_time" AT TIME ZONE 'UTC', {timestamp_format}),
+        'created_at', to_char("orders"."created_at" AT TIME ZONE 'UTC', {timestamp_format}),
+        'status', "orders"."current_status",
+        'items', COALESCE((
+            SELECT json_agg(json_build_object(
+                'id', "order_items"."id",
+                'order_id', "order_items"."order_id",
+                'name', "order_items"."name",
+                'plu', "order_items"."plu",
+                'quantity', "order_items"."quantity"
+            ) ORDER BY "order_items"."id")
+            FROM "order_items" WHERE "order_items"."order_id" = "orders"."id"
+        ), '[]'::json),
+        'status_history', {status_history}
+    )::text AS "order"
+    FROM "orders"
+    JOIN "customers" ON "customers"."id" = "orders"."customer_id"
+    JOIN "addresses" ON "addresses"."id" = "orders"."address_id"
+    WHERE "orders"."id" = $1
+"""
+GET_ORDER_JSON_SQL = _GET_ORDER_JSON_SQL.format(
+    timestamp_format=_UTC_TIMESTAMP_FORMAT, status_history=_STATUS_HISTORY_JSON
+)
+GET_ORDER_TIMELINE_JSON_SQL = _GET_ORDER_JSON_SQL.format(
+    timestamp_format=_UTC_TIMESTAMP_FORMAT, status_history=_STATUS_TIMELINE_JSON
+)
+
+ORDER_FIELDS = set(Order.model_fields)
+# Order fields read straight from an orders column of the same name
+ORDER_COLUMN_FIELDS = {"id", "account_id", "brand_id", "channel_order_id", "pickup_time", "created_at"}
+ORDER_FIELD_RELATIONS = {"customer": "customer", "delivery_address": "address"}
+ORDER_FIELD_PREFETCHES = {"items": "items", "status_history": "status_history"}
+
+
+class OrderReferences(NamedTuple):
+    customer_id: int
+    customer: Customer
+    address_id: int
+    address: Address
+
+
+class StatusTransition(NamedTuple):
+    previous_status: int
+    # None when the transition is not allowed
+    history_id: int | None
+    created_at: datetime
+    previous_status_since: datetime
+    duration: int | None
+
+
+def normalize_address_key(address: Address) -> str:
+    """Lowercased "postal_code|city|street" with whitespace collapsed, so spelling variants map to one address"""
+    return "|".join(" ".join(value.split()).lower() for value in (address.postalCode, address.city, address.street))
+
+
+def encode_cursor(created_at: datetime, order_id: int) -> str:
+    """Encode the keyset position (created_at, id) of the last order on a page"""
+    payload = json.dumps([created_at.isoformat(), order_id]).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        payload = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, order_id = json.loads(payload)
+        return datetime.fromisoformat(created_at), int(order_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def timeline_offset(created_at: datetime, timestamp: datetime) -> int:
+    """Whole seconds from the creation of an order to one of its status transitions"""
+    return math.floor((timestamp - created_at).total_seconds())
+
+
+def status_history_durations(history: Iterable[OrderStatusHistory]) -> dict[int, int | None]:
+    """
+    Whole seconds each history row's status lasted, keyed by row id. The history is append-only,
+    so a status lasts until the next row of its order; current statuses have no duration yet.
+    """
+    ordered = sorted(
+        history, key=lambda status: (status.order_id, status.timestamp, status.id)  # type: ignore[attr-defined]
+    )
+    durations: dict[int, int | None] = {status.id: None for status in ordered}
+    for status, following in pairwise(ordered):
+        if following.order_id == status.order_id:  # type: ignore[attr-defined]
+            durations[status.id] = timeline_offset(status.timestamp, following.timestamp)
+    return durations
+
+
+def parse_status_timeline(order_id: int, created_at: datetime, timeline: str) -> list[OrderStatus]:
+    """
+    Rebuild the status history from an orders.status_timeline of comma separated "status:offset" entries.
+    The timeline does not keep history row ids, so entries have none; timestamps and durations have second
+    precision.
+    """
+    entries = [(int(status), int(offset)) for status, offset in (
+        entry.split(":") for entry in timeline.split(",") if entry
+    )]
+    return [OrderStatus(
+        id=None,
+        order_id=order_id,
+        status=OrderStatusEnum(status),
+        timestamp=created_at + timedelta(seconds=offset),
+        duration=(entries[position][1] - offset or None) if position < len(entries) else None
+    ) for position, (status, offset) in enumerate(entries, start=1)]
 
 
 class OrderRepository:
     @staticmethod
-    def _order_storage_to_order_schema(order: OrderModel) -> Order:
-        return Order(
-            id=order.id,
-            account_id=order.account_id,
-            brand_id=order.brand_id,
-            channel_order_id=order.channel_order_id,
-            customer=Customer(
+    def _order_storage_to_order_fields(order: OrderModel, fields: set[str]) -> dict[str, Any]:
+        """Map the requested Order fields; relations outside the requested fields do not need to be loaded"""
+        values: dict[str, Any] = {}
+        for field in fields & ORDER_COLUMN_FIELDS:
+            values[field] = getattr(order, field)
+        if "status" in fields:
+            values["status"] = OrderStatusEnum(order.current_status)
+        if "customer" in fields:
+            values["customer"] = Customer(
                 name=order.customer.name,
                 phoneNumber=order.customer.phone
-            ),
-            delivery_address=Address(
+            )
+        if "delivery_address" in fields:
+            values["delivery_address"] = Address(
                 city=order.address.city,
                 street=order.address.street,
                 postalCode=order.address.postal_code
-            ),
-            pickup_time=order.pickup_time,
-            items=[OrderItem(
+            )
+        if "items" in fields:
+            values["items"] = [OrderItem(
                 id=item.id,
                 order_id=order.id,
                 name=item.name,
                 plu=item.plu,
                 quantity=item.quantity
-            ) for item in order.items],
-            status_history=[OrderStatus(
+            ) for item in order.items]
+        if "status_history" in fields and settings.order_status_timeline_reads:
+            values["status_history"] = parse_status_timeline(order.id, order.created_at, order.status_timeline)
+        elif "status_history" in fields:
+            durations = status_history_durations(order.status_history)
+            values["status_history"] = [OrderStatus(
                 id=status.id,
                 order_id=order.id,
                 status=status.status,
                 timestamp=status.timestamp,
-                duration=status.duration or None
-            ) for status in order.status_history],
+                duration=durations[status.id] or None
+            ) for status in order.status_history]
+        return values
+
+    def _order_storage_to_order_schema(self, order: OrderModel) -> Order:
+        return Order(**self._order_storage_to_order_fields(order, ORDER_FIELDS))
+
+    @staticmethod
+    def _prefetches(fields: set[str] = ORDER_FIELDS) -> list[str]:
+        """Relations to prefetch for the Order fields; the status history comes from the timeline when it is read"""
+        return [
+            relation for field, relation in ORDER_FIELD_PREFETCHES.items()
+            if field in fields and not (field == "status_history" and settings.order_status_timeline_reads)
+        ]
+
+    @staticmethod
+    def _order_storage_to_order_summary(order: OrderModel) -> OrderSummary:
+        return OrderSummary(
+            id=order.id,
+            account_id=order.account_id,
+            brand_id=order.brand_id,
+            channel_order_id=order.channel_order_id,
+            customer_id=order.customer_id,  # type: ignore[attr-defined]
+            address_id=order.address_id,  # type: ignore[attr-defined]
+            pickup_time=order.pickup_time,
             created_at=order.created_at,
-            status=order.status_history[-1].status if order.status_history else None
+            status=order.current_status
         )
 
-    async def get_order(self, order_id: int) -> Order | None:
-        order = await OrderModel.get_or_none(id=order_id).prefetch_related(
-            "items",
-            "status_history"
+    @staticmethod
+    def filter_orders(
+            account_id: str | None = None,
+            brand_id: str | None = None,
+            customer_id: int | None = None,
+            status: OrderStatusEnum | None = None,
+            created_from: datetime | None = None,
+            created_to: datetime | None = None,
+            pickup_from: datetime | None = None,
+            pickup_to: datetime | None = None,
+    ) -> QuerySet[OrderModel]:
+        """Build an orders query from the listing filters, each backed by an index on orders"""
+        query = OrderModel.all()
+
+        if account_id is not None:
+            query = query.filter(account_id=account_id)
+        if brand_id is not None:
+            query = query.filter(brand_id=brand_id)
+        if customer_id is not None:
+            query = query.filter(customer_id=customer_id)
+        if status is not None:
+            query = query.filter(current_status=status.value)
+        if created_from is not None:
+            query = query.filter(created_at__gte=created_from)
+        if created_to is not None:
+            query = query.filter(created_at__lt=created_to)
+        if pickup_from is not None:
+            query = query.filter(pickup_time__gte=pickup_from)
+        if pickup_to is not None:
+            query = query.filter(pickup_time__lt=pickup_to)
+
+        return query
+
+    async def list_orders(
+            self,
+            query: QuerySet[OrderModel],
+            cursor: str | None = None,
+            limit: int = 50,
+            view: OrderView = OrderView.summary,
+    ) -> OrderPage:
+        """
+        Return a page of orders, newest first, using keyset pagination on (created_at, id)
+        so that deep pages cost the same as the first one
+        """
+        if cursor is not None:
+            created_at, order_id = decode_cursor(cursor)
+            query = query.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=order_id))
+
+        query = query.order_by("-created_at", "-id").limit(limit + 1)
+        if view == OrderView.full:
+            query = query.prefetch_related(*self._prefetches()).select_related("customer", "address")
+
+        orders = await query
+        next_cursor = None
+        if len(orders) > limit:
+            orders = orders[:limit]
+            next_cursor = encode_cursor(orders[-1].created_at, orders[-1].id)
+
+        items: list[OrderSummary | Order] = [
+            self._order_storage_to_order_schema(order) if view == OrderView.full
+            else self._order_storage_to_order_summary(order)
+            for order in orders
+        ]
+        return OrderPage(items=items, next_cursor=next_cursor)
+
+    async def iter_orders(self, query: QuerySet[OrderModel], chunk_size: int) -> AsyncIterator[list[Order]]:
+        """
+        Yield complete orders, oldest first, in chunks of at most chunk_size.
+        Each chunk is a keyset range on (created_at, id) with its own prefetch, so memory stays flat
+        and the first chunk is available before the whole range has been read.
+        """
+        position: tuple[datetime, int] | None = None
+        while True:
+            chunk_query = query
+            if position is not None:
+                created_at, order_id = position
+                chunk_query = chunk_query.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=order_id)
+                )
+
+            orders = await chunk_query.order_by("created_at", "id").limit(chunk_size).prefetch_related(
+                *self._prefetches()
+            ).select_related(
+                "customer",
+                "address"
+            )
+            if not orders:
+                return
+
+            yield [self._order_storage_to_order_schema(order) for order in orders]
+
+            if len(orders) < chunk_size:
+                return
+            position = (orders[-1].created_at, orders[-1].id)
+
+    async def get_order(self, order_id: int, fields: set[str] | None = None) -> Order | None:
+        """
+        Load an order. The complete order is a single query on Postgres and three through the ORM elsewhere.
+        When fields is given only the joins and prefetches those fields need are issued,
+        and the returned Order has only those fields set; without relations it is a single primary key lookup.
+        """
+        if fields is None:
+            # on Postgres the order, its items and status history come back as one JSON row
+            connection = connections.get("default")
+            if is_postgres(connection):
+                sql = GET_ORDER_TIMELINE_JSON_SQL if settings.order_status_timeline_reads else GET_ORDER_JSON_SQL
+                _, rows = await connection.execute_query(sql, [order_id])
+                return Order.model_validate_json(rows[0]["order"]) if rows else None
+
+            order = await OrderModel.get_or_none(id=order_id).prefetch_related(
+                *self._prefetches()
+            ).select_related(
+                "customer",
+                "address"
+            )
+            return self._order_storage_to_order_schema(order) if order else None
+
+        query = OrderModel.filter(id=order_id)
+        relations = [relation for field, relation in ORDER_FIELD_RELATIONS.items() if field in fields]
+        prefetches = self._prefetches(fields)
+        if relations:
+            query = query.select_related(*relations)
+        if prefetches:
+            query = query.prefetch_related(*prefetches)
+        if not relations and not prefetches:
+            columns = {"id", *(fields & ORDER_COLUMN_FIELDS), *(["current_status"] if "status" in fields else [])}
+            if "status_history" in fields:
+                columns.update({"created_at", "status_timeline"})
+            query = query.only(*columns)
+
+        projected = await query.first()
+        if not projected:
+            return None
+
+        return Order.model_construct(**self._order_storage_to_order_fields(projected, fields))
+
+    @staticmethod
+    async def _get_customers_and_addresses(
+            customer_ids: set[int],
+            address_ids: set[int],
+    ) -> tuple[dict[int, Customer], dict[int, Address]]:
+        """Resolve the referenced customers and addresses with a single query"""
+        connection = connections.get("default")
+        values: list[Any] = []
+
+        def parameters(ids: set[int]) -> str:
+            placeholders = []
+            for value in ids:
+                values.append(value)
+                placeholders.append(sql_parameter(connection, len(values)))
+            return ", ".join(placeholders)
+
+        selects = []
+        if customer_ids:
+            selects.append(f"""
+                SELECT 'customer' AS "kind", "id", "name" AS "a", "phone" AS "b", NULL AS "c"
+                FROM "customers" WHERE "id" IN ({parameters(customer_ids)})
+            """)
+        if address_ids:
+            selects.append(f"""
+                SELECT 'address' AS "kind", "id", "city" AS "a", "street" AS "b", "postal_code" AS "c"
+                FROM "addresses" WHERE "id" IN ({parameters(address_ids)})
+            """)
+        if not selects:
+            return {}, {}
+
+        _, rows = await connection.execute_query(" UNION ALL ".join(selects), values)
+
+        customers: dict[int, Customer] = {}
+        addresses: dict[int, Address] = {}
+        for row in rows:
+            if row["kind"] == "customer":
+                customers[row["id"]] = Customer(name=row["a"], phoneNumber=row["b"])
+            else:
+                addresses[row["id"]] = Address(city=row["a"], street=row["b"], postalCode=row["c"])
+
+        return customers, addresses
+
+    async def get_orders(self, order_ids: list[int]) -> dict[int, Order]:
+        """Load many orders with one query per table: orders joined to customer/address, items, status history"""
+        if not order_ids:
+            return {}
+
+        orders = await OrderModel.filter(id__in=order_ids).prefetch_related(
+            *self._prefetches()
         ).select_related(
             "customer",
             "address"
         )
 
-        if not order:
-            return None
+        return {order.id: self._order_storage_to_order_schema(order) for order in orders}
 
-        return self._order_storage_to_order_schema(order)
+    @staticmethod
+    async def get_order_scopes(order_ids: list[int]) -> dict[int, tuple[str, str]]:
+        """Map order ids to their (account_id, brand_id)"""
+        if not order_ids:
+            return {}
+
+        rows = await OrderModel.filter(id__in=order_ids).values_list("id", "account_id", "brand_id")
+        return {order_id: (account_id, brand_id) for order_id, account_id, brand_id in rows}
+
+    @staticmethod
+    async def get_closed_order_ids(created_before: datetime, limit: int) -> list[int]:
+        """Ids of completed and canceled orders created before the given time, oldest ids first"""
+        return await OrderModel.filter(
+            current_status__in=[OrderStatusEnum.COMPLETED.value, OrderStatusEnum.CANCELED.value],
+            created_at__lt=created_before
+        ).order_by("id").limit(limit).values_list("id", flat=True)  # type: ignore[return-value]
+
+    @staticmethod
+    async def delete_archived_orders(locations: list[dict[str, Any]]) -> None:
+        """Record where archived orders were written, then delete them with their items and status history"""
+        if not locations:
+            return
+
+        order_ids = [location["order_id"] for location in locations]
+        async with in_transaction() as connection:
+            # customer lifetime metrics keep counting archived orders from these columns
+            orders = {
+                order["id"]: order
+                for order in await OrderModel.filter(id__in=order_ids).using_db(connection).values(
+                    "id", "customer_id", "created_at"
+                )
+            }
+            await insert_many(connection, ArchivedOrder, [
+                {
+                    **location,
+                    "archived_at": timezone.now(),
+                    "customer_id": orders[location["order_id"]]["customer_id"],
+                    "created_at": orders[location["order_id"]]["created_at"],
+                }
+                for location in locations
+                if location["order_id"] in orders
+            ], on_conflict=("order_id",))
+            await OrderModel.filter(id__in=order_ids).using_db(connection).delete()
 
     async def create_order(self, order: OrderCreate) -> Order:
-        async with in_transaction():
-            db_order = await OrderModel.create(
+        result = (await self.create_orders([order]))[0]
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
+    async def get_orders_by_channel_keys(self, keys: list[tuple[str, str]]) -> dict[tuple[str, str], Order]:
+        """Load orders by their (account_id, channel_order_id)"""
+        if not keys:
+            return {}
+
+        rows = await OrderModel.filter(
+            account_id__in={account_id for account_id, _ in keys},
+            channel_order_id__in={channel_order_id for _, channel_order_id in keys},
+        ).values_list("id", "account_id", "channel_order_id")
+        wanted = set(keys)
+        orders = await self.get_orders([order_id for order_id, *key in rows if tuple(key) in wanted])
+        return {(order.account_id or "", order.channel_order_id): order for order in orders.values()}
+
+    @staticmethod
+    async def get_ingested_order_ids(ingestion_ids: list[str]) -> dict[str, int]:
+        """Map ingestion tracking ids that were already written to their order ids"""
+        if not ingestion_ids:
+            return {}
+
+        rows = await OrderModel.filter(ingestion_id__in=ingestion_ids).values_list("ingestion_id", "id")
+        return dict(rows)
+
+    async def create_orders(
+            self,
+            orders: list[OrderCreate],
+            ingestion_ids: Sequence[str | None] | None = None
+    ) -> list[Order | ValueError]:
+        """
+        Create orders with one multi-row insert per table inside a single transaction.
+        The response is built from the submitted payloads and the ids/timestamps returned by the inserts,
+        so the number of round trips does not depend on the number of orders or items.
+        Embedded customers and addresses are upserted first; repeat ones are resolved from the in-process cache.
+        Orders referencing unknown customers or addresses are reported individually instead of failing the batch.
+        Orders whose (account_id, channel_order_id) exists already, or repeats an earlier order of the batch,
+        are reported as DuplicateOrderError carrying the original order.
+        Ingestion ids, when given, are stored alongside each order and are unique.
+        """
+        if not orders:
+            return []
+
+        references, cached_phones, cached_address_keys = await self._resolve_references(orders)
+        try:
+            return await self._insert_orders(orders, references, ingestion_ids)
+        except IntegrityError:
+            if not cached_phones and not cached_address_keys:
+                raise
+
+            # a cached customer or address may have been deleted since, resolve them from the database once more
+            for phone in cached_phones:
+                customer_lookup.discard(phone)
+            for address_key in cached_address_keys:
+                address_lookup.discard(address_key)
+            references, _, _ = await self._resolve_references(orders)
+            return await self._insert_orders(orders, references, ingestion_ids)
+
+    async def _resolve_references(
+            self,
+            orders: list[OrderCreate],
+    ) -> tuple[list[OrderReferences | ValueError], set[str], set[str]]:
+        """
+        Resolve the customer and address of every order. Referenced ids are loaded with one query,
+        embedded customers and addresses missing from the in-process cache are upserted with one statement each.
+        Also returns the phones and address keys that were served from the cache.
+        """
+        customers, addresses = await self._get_customers_and_addresses(
+            {order.customer_id for order in orders if order.customer is None and order.customer_id is not None},
+            {order.address_id for order in orders if order.delivery_address is None and order.address_id is not None},
+        )
+
+        by_phone: dict[str, tuple[int, Customer]] = {}
+        by_address_key: dict[str, tuple[int, Address]] = {}
+        new_customers: dict[str, Customer] = {}
+        new_addresses: dict[str, Address] = {}
+        for order in orders:
+            if order.customer is not None:
+                phone = order.customer.phoneNumber
+                cached_customer = customer_lookup.get(phone)
+                if cached_customer is not None:
+                    by_phone[phone] = cached_customer
+                else:
+                    new_customers.setdefault(phone, order.customer)
+            if order.delivery_address is not None:
+                address_key = normalize_address_key(order.delivery_address)
+                cached_address = address_lookup.get(address_key)
+                if cached_address is not None:
+                    by_address_key[address_key] = cached_address
+                else:
+                    new_addresses.setdefault(address_key, order.delivery_address)
+
+        cached_phones, cached_address_keys = set(by_phone), set(by_address_key)
+        ORDER_LOOKUP_CACHE_HITS.labels(kind="customer").inc(len(cached_phones))
+        ORDER_LOOKUP_CACHE_HITS.labels(kind="address").inc(len(cached_address_keys))
+        ORDER_LOOKUP_CACHE_MISSES.labels(kind="customer").inc(len(new_customers))
+        ORDER_LOOKUP_CACHE_MISSES.labels(kind="address").inc(len(new_addresses))
+
+        by_phone.update(await self._upsert_customers(list(new_customers.values())))
+        by_address_key.update(await self._upsert_addresses(new_addresses))
+
+        references: list[OrderReferences | ValueError] = []
+        for order in orders:
+            if order.customer is not None:
+                customer_id, customer = by_phone[order.customer.phoneNumber]
+            elif order.customer_id is None:
+                references.append(ValueError("Either customer_id or customer is required"))
+                continue
+            elif order.customer_id not in customers:
+                references.append(ValueError(f"Customer with ID {order.customer_id} not found"))
+                continue
+            else:
+                customer_id, customer = order.customer_id, customers[order.customer_id]
+
+            if order.delivery_address is not None:
+                address_id, address = by_address_key[normalize_address_key(order.delivery_address)]
+            elif order.address_id is None:
+                references.append(ValueError("Either address_id or delivery_address is required"))
+                continue
+            elif order.address_id not in addresses:
+                references.append(ValueError(f"Address with ID {order.address_id} not found"))
+                continue
+            else:
+                address_id, address = order.address_id, addresses[order.address_id]
+
+            references.append(OrderReferences(customer_id, customer, address_id, address))
+
+        return references, cached_phones, cached_address_keys
+
+    @staticmethod
+    async def _upsert_customers(customers: list[Customer]) -> dict[str, tuple[int, Customer]]:
+        """Insert customers by their unique phone; existing customers are kept as they are"""
+        if not customers:
+            return {}
+
+        # the no-op update makes RETURNING yield existing rows as well
+        rows = await insert_many(connections.get("default"), CustomerModel, [{
+            "name": customer.name,
+            "phone": customer.phoneNumber,
+            "created_at": timezone.now(),
+        } for customer in customers], returning=("id", "name", "phone"), on_conflict=("phone",),
+            on_conflict_update=("phone",))
+
+        resolved: dict[str, tuple[int, Customer]] = {}
+        for row in rows:
+            resolved[row["phone"]] = (row["id"], Customer(name=row["name"], phoneNumber=row["phone"]))
+            customer_lookup.set(row["phone"], resolved[row["phone"]])
+        return resolved
+
+    @staticmethod
+    async def _upsert_addresses(addresses: dict[str, Address]) -> dict[str, tuple[int, Address]]:
+        """Insert addresses by their normalized key; existing addresses are kept as they are"""
+        if not addresses:
+            return {}
+
+        rows = await insert_many(connections.get("default"), AddressModel, [{
+            "city": address.city,
+            "street": address.street,
+            "postal_code": address.postalCode,
+            "normalized_key": address_key,
+            "created_at": timezone.now(),
+        } for address_key, address in addresses.items()],
+            returning=("id", "city", "street", "postal_code", "normalized_key"),
+            on_conflict=("normalized_key",), on_conflict_update=("normalized_key",))
+
+        resolved: dict[str, tuple[int, Address]] = {}
+        for row in rows:
+            address = Address(city=row["city"], street=row["street"], postalCode=row["postal_code"])
+            resolved[row["normalized_key"]] = (row["id"], address)
+            address_lookup.set(row["normalized_key"], resolved[row["normalized_key"]])
+        return resolved
+
+    async def _insert_orders(
+            self,
+            orders: list[OrderCreate],
+            references: list[OrderReferences | ValueError],
+            ingestion_ids: Sequence[str | None] | None = None
+    ) -> list[Order | ValueError]:
+        results: list[Order | ValueError] = []
+        valid_orders: list[tuple[int, OrderCreate]] = []
+        valid_references: dict[int, OrderReferences] = {}
+        repeated: dict[int, tuple[str, str]] = {}
+        seen: set[tuple[str, str]] = set()
+        ingestion_ids = ingestion_ids or [None] * len(orders)
+        for index, (order, reference) in enumerate(zip(orders, references, strict=True)):
+            key = (order.account_id, order.channel_order_id)
+            if isinstance(reference, ValueError):
+                results.append(reference)
+            elif key in seen:
+                results.append(ValueError("Order was not processed"))
+                repeated[index] = key
+            else:
+                results.append(ValueError("Order was not processed"))
+                valid_orders.append((index, order))
+                valid_references[index] = reference
+                seen.add(key)
+
+        if not valid_orders:
+            return results
+
+        async with in_transaction() as connection:
+            now = timezone.now()
+            inserted = await insert_many(connection, OrderModel, [{
+                "account_id": order.account_id,
+                "brand_id": order.brand_id,
+                "channel_order_id": order.channel_order_id,
+                "customer_id": valid_references[index].customer_id,
+                "address_id": valid_references[index].address_id,
+                "pickup_time": order.pickup_time,
+                "created_at": now,
+                "current_status": OrderStatusEnum.RECEIVED.value,
+                "current_status_since": now,
+                "status_timeline": f"{OrderStatusEnum.RECEIVED.value}:0",
+                "ingestion_id": ingestion_ids[index],
+            } for index, order in valid_orders],
+                returning=("id", "created_at", "pickup_time", "account_id", "channel_order_id"),
+                on_conflict=("account_id", "channel_order_id"))
+
+            # conflicting rows are skipped by the insert, so the returned rows are matched back by key
+            inserted_by_key = {(row["account_id"], row["channel_order_id"]): row for row in inserted}
+            created_orders = [
+                (index, order, inserted_by_key[(order.account_id, order.channel_order_id)])
+                for index, order in valid_orders if (order.account_id, order.channel_order_id) in inserted_by_key
+            ]
+
+            created_items = await insert_many(connection, OrderItemModel, [{
+                "order_id": created_order["id"],
+                "name": item.name,
+                "plu": item.plu,
+                "quantity": item.quantity,
+            } for _, order, created_order in created_orders for item in order.items],
+                returning=("id", "order_id", "name", "plu", "quantity"))
+
+            created_statuses = await insert_many(connection, OrderStatusHistory, [{
+                "order_id": created_order["id"],
+                "status": OrderStatusEnum.RECEIVED.value,
+                "timestamp": now,
+            } for _, _, created_order in created_orders], returning=("id", "order_id", "timestamp"))
+
+            if settings.order_outbox_enabled:
+                await insert_many(connection, OrderOutboxEvent, [order_created_event(
+                    created_order["id"], order.account_id, order.brand_id, created_order["created_at"]
+                ) for _, order, created_order in created_orders])
+
+        # RETURNING does not promise the order of the VALUES, so rows are matched back by their columns;
+        # items of one order with the same columns are interchangeable
+        item_ids: defaultdict[tuple[int, str, str, int], list[int]] = defaultdict(list)
+        for row in created_items:
+            item_ids[(row["order_id"], row["name"], row["plu"], row["quantity"])].append(row["id"])
+        statuses_by_order = {row["order_id"]: row for row in created_statuses}
+        originals: dict[tuple[str, str], Order] = {}
+        for index, order, created_order in created_orders:
+            created_status = statuses_by_order[created_order["id"]]
+            results[index] = originals[(order.account_id, order.channel_order_id)] = Order(
+                id=created_order["id"],
                 account_id=order.account_id,
                 brand_id=order.brand_id,
                 channel_order_id=order.channel_order_id,
-                customer_id=order.customer_id,
-                address_id=order.address_id,
-                pickup_time=order.pickup_time,
-            )
-
-            for item in order.items:
-                await OrderItemModel.create(
-                    order=db_order,
+                customer=valid_references[index].customer,
+                delivery_address=valid_references[index].address,
+                pickup_time=created_order["pickup_time"],
+                created_at=created_order["created_at"],
+                items=[OrderItem(
+                    id=item_ids[(created_order["id"], item.name, item.plu, item.quantity)].pop(0),
+                    order_id=created_order["id"],
                     name=item.name,
                     plu=item.plu,
                     quantity=item.quantity
-                )
-
-            await OrderStatusHistory.create(
-                order=db_order,
-                status=OrderStatusEnum.RECEIVED.value,
+                ) for item in order.items],
+                status_history=[OrderStatus(
+                    id=created_status["id"],
+                    order_id=created_order["id"],
+                    status=OrderStatusEnum.RECEIVED,
+                    timestamp=created_status["timestamp"],
+                    duration=None
+                )],
+                status=OrderStatusEnum.RECEIVED
             )
 
-            complete_order = await OrderModel.get(id=db_order.id).prefetch_related(
-                "items",
-                "status_history"
-            ).select_related(
-                "customer",
-                "address"
-            )
+        conflicts = [
+            (index, (order.account_id, order.channel_order_id))
+            for index, order in valid_orders if (order.account_id, order.channel_order_id) not in originals
+        ]
+        originals.update(await self.get_orders_by_channel_keys([key for _, key in conflicts]))
+        for index, key in [*conflicts, *repeated.items()]:
+            if key in originals:
+                results[index] = DuplicateOrderError(originals[key])
+
+        return results
 
-            return self._order_storage_to_order_schema(complete_order)
+    async def update_order_status(self, order_id: int, new_status: OrderStatusEnum) -> OrderStatus:
+        result = (await self.update_order_statuses([(order_id, new_status)]))[0]
+        if isinstance(result, Exception):
+            raise result
+        return result
 
     @staticmethod
-    async def update_order_status(order_id: int, new_status: OrderStatusEnum) -> OrderStatus:
-        async with in_transaction():
-            order = await OrderModel.get_or_none(id=order_id)
-            if not order:
-                raise ValueError("Order not found")
-
-            new_status_entry = await OrderStatusHistory.create(
-                order=order,
-                status=new_status.value,
-            )
+    async def update_order_statuses(
+            updates: list[tuple[int, OrderStatusEnum]],
+    ) -> list[OrderStatus | KeyError | ValueError]:
+        """
+        Apply status transitions to many orders in one transaction. For each order a history row is appended,
+        the denormalized current status is moved
+        and the transition is appended to the order's status timeline and, when enabled, to the outbox.
+        On Postgres all transitions run as one set-based statement.
+        Unknown orders are reported as KeyError and disallowed transitions as ValueError.
+        """
+        results: list[OrderStatus | KeyError | ValueError] = []
+        requested: dict[int, OrderStatusEnum] = {}
+        for order_id, new_status in updates:
+            if order_id in requested:
+                results.append(ValueError(f"Duplicate status update for order {order_id}"))
+            else:
+                results.append(KeyError(order_id))
+                requested[order_id] = new_status
 
-            previous_status = await OrderStatusHistory.filter(
-                order=order
-            ).order_by("-timestamp").offset(1).first()
-
-            if previous_status:
-                duration = new_status_entry.timestamp - previous_status.timestamp
-                previous_status.duration = int(duration.total_seconds())
-                await previous_status.save()
-
-            return OrderStatus(
-                id=new_status_entry.id,
-                order_id=order_id,
-                status=new_status_entry.status,
-                timestamp=new_status_entry.timestamp,
-                duration=previous_status.duration if previous_status else None
-            )
+        if not requested:
+            return results
+
+        transitions: dict[int, StatusTransition] = {}
+        async with in_transaction() as connection:
+            now = timezone.now()
+            if is_postgres(connection):
+                allowed = [
+                    (source, target) for source, targets in ALLOWED_STATUS_TRANSITIONS.items() for target in targets
+                ]
+                _, rows = await connection.execute_query(UPDATE_ORDER_STATUSES_SQL, [
+                    list(requested.keys()),
+                    [status.value for status in requested.values()],
+                    [source.value for source, _ in allowed],
+                    [target.value for _, target in allowed],
+                    now,
+                    settings.order_outbox_enabled,
+                ])
+                for row in rows:
+                    transitions[row["order_id"]] = StatusTransition(
+                        row["previous_status"],
+                        row["history_id"],
+                        row["created_at"],
+                        row["current_status_since"],
+                        row["duration"]
+                    )
+            else:
+                orders = await OrderModel.filter(id__in=list(requested.keys())).only(
+                    "id", "created_at", "current_status", "current_status_since", "status_timeline"
+                )
+                events = []
+                for order in orders:
+                    target_status = requested[order.id]
+                    if target_status not in ALLOWED_STATUS_TRANSITIONS[OrderStatusEnum(order.current_status)]:
+                        transitions[order.id] = StatusTransition(
+                            order.current_status, None, order.created_at, order.current_status_since, None
+                        )
+                        continue
+
+                    elapsed = int((now - order.current_status_since).total_seconds())
+                    timeline = [entry for entry in order.status_timeline.split(",") if entry]
+                    timeline.append(f"{target_status.value}:{timeline_offset(order.created_at, now)}")
+                    await OrderModel.filter(id=order.id).update(
+                        current_status=target_status.value,
+                        current_status_since=now,
+                        status_timeline=",".join(timeline)
+                    )
+                    history = await OrderStatusHistory.create(
+                        order_id=order.id,
+                        status=target_status.value,
+                        timestamp=now
+                    )
+                    transitions[order.id] = StatusTransition(
+                        order.current_status,
+                        history.id,
+                        order.created_at,
+                        order.current_status_since,
+                        elapsed
+                    )
+                    events.append(status_changed_event(
+                        order.id, order.current_status, order.current_status_since, target_status.value, now, elapsed
+                    ))
+
+                if settings.order_outbox_enabled:
+                    await insert_many(connection, OrderOutboxEvent, events)
+
+        for index, (order_id, new_status) in enumerate(updates):
+            if not isinstance(results[index], KeyError) or order_id not in transitions:
+                continue
+
+            transition = transitions[order_id]
+            if transition.history_id is None:
+                results[index] = ValueError(
+                    f"Invalid status transition from {OrderStatusEnum(transition.previous_status).name} "
+                    f"to {new_status.name}"
+                )
+            elif settings.order_status_timeline_reads:
+                # reported the way the timeline will rebuild it
+                offset = timeline_offset(transition.created_at, now)
+                results[index] = OrderStatus(
+                    id=transition.history_id,
+                    order_id=order_id,
+                    status=new_status,
+                    timestamp=transition.created_at + timedelta(seconds=offset),
+                    duration=offset - timeline_offset(transition.created_at, transition.previous_status_since)
+                )
+            else:
+                results[index] = OrderStatus(
+                    id=transition.history_id,
+                    order_id=order_id,
+                    status=new_status,
+                    timestamp=now,
+                    duration=transition.duration
+                )
+
+        return results
@@ -1,18 +1,271 @@
+import csv
+import io
+import json
+import logging
+from collections.abc import AsyncIterator, Sequence
+from datetime import datetime
+
 from fastapi import Depends
+from redis.exceptions import RedisError
 
-from app.api.v1.orders.schemas import Order, OrderCreate, OrderStatus, OrderStatusEnum
+from app.api.v1.orders.schemas import (
+    Order,
+    OrderCreate,
+    OrderExportFormat,
+    OrderIngestionStatus,
+    OrderPage,
+    OrderStatus,
+    OrderStatusEnum,
+    OrderView,
+)
+from app.core.config import settings
+from app.domains.orders.archive import OrderArchive
+from app.domains.orders.cache import ORDER_DUPLICATES, ChannelOrderIndex, OrderCache
+from app.domains.orders.events import OrderEventPublisher, order_event_broker, order_status_event
+from app.domains.orders.exceptions import DuplicateOrderError
+from app.domains.orders.ingestion import OrderIngestion
 from app.domains.orders.repository import OrderRepository
 
+logger = logging.getLogger(__name__)
+
+EXPORT_CSV_COLUMNS = [
+    "id", "account_id", "brand_id", "channel_order_id", "customer_name", "customer_phone",
+    "city", "street", "postal_code", "pickup_time", "created_at", "status", "items", "status_history",
+]
+
 
 class OrderService:
-    def __init__(self, repository: OrderRepository = Depends()):
+    def __init__(
+            self,
+            repository: OrderRepository = Depends(),
+            cache: OrderCache = Depends(),
+            events: OrderEventPublisher = Depends(),
+            ingestion: OrderIngestion = Depends(),
+            channel_index: ChannelOrderIndex = Depends(),
+            archive: OrderArchive = Depends()
+    ):
         self.repository = repository
+        self.cache = cache
+        self.events = events
+        self.ingestion = ingestion
+        self.channel_index = channel_index
+        self.archive = archive
+
+    async def get_order(self, order_id: int, fields: set[str] | None = None) -> Order | None:
+        """
+        Read through the cache. Projected reads use a cached full order when there is one,
+        but are never cached themselves. Orders missing from the database are looked up in the archive.
+        """
+        cached, version = await self.cache.get(order_id)
+        if cached is not None:
+            return cached
+
+        order = await self.repository.get_order(order_id, fields)
+        if order is None:
+            order = await self.archive.get(order_id)
+            fields = None
+        if order is not None and fields is None and version is not None:
+            await self.cache.set([order], {order_id: version})
+        return order
+
+    async def get_orders(self, order_ids: list[int]) -> list[Order | None]:
+        """Resolve orders in request order, serving cache hits and loading only the misses from the database"""
+        unique_ids = list(dict.fromkeys(order_ids))
+        orders, versions = await self.cache.get_many(unique_ids)
+
+        missing_ids = [order_id for order_id in unique_ids if order_id not in orders]
+        if missing_ids:
+            loaded = await self.repository.get_orders(missing_ids)
+            await self.cache.set(list(loaded.values()), versions)
+            orders.update(loaded)
 
-    async def get_order(self, order_id: int) -> Order | None:
-        return await self.repository.get_order(order_id)
+        return [orders.get(order_id) for order_id in order_ids]
+
+    async def list_orders(
+            self,
+            account_id: str | None = None,
+            brand_id: str | None = None,
+            customer_id: int | None = None,
+            status: OrderStatusEnum | None = None,
+            created_from: datetime | None = None,
+            created_to: datetime | None = None,
+            pickup_from: datetime | None = None,
+            pickup_to: datetime | None = None,
+            cursor: str | None = None,
+            limit: int = 50,
+            view: OrderView = OrderView.summary,
+    ) -> OrderPage:
+        query = self.repository.filter_orders(
+            account_id, brand_id, customer_id, status, created_from, created_to, pickup_from, pickup_to
+        )
+        return await self.repository.list_orders(query, cursor, limit, view)
+
+    async def export_orders(
+            self,
+            export_format: OrderExportFormat,
+            account_id: str | None = None,
+            brand_id: str | None = None,
+            customer_id: int | None = None,
+            status: OrderStatusEnum | None = None,
+            created_from: datetime | None = None,
+            created_to: datetime | None = None,
+            pickup_from: datetime | None = None,
+            pickup_to: datetime | None = None,
+    ) -> AsyncIterator[str]:
+        """Serialize matching orders chunk by chunk as NDJSON lines or CSV rows"""
+        query = self.repository.filter_orders(
+            account_id, brand_id, customer_id, status, created_from, created_to, pickup_from, pickup_to
+        )
+
+        if export_format == OrderExportFormat.csv:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_CSV_COLUMNS)
+            yield buffer.getvalue()
+
+        async for orders in self.repository.iter_orders(query, settings.order_export_chunk_size):
+            if export_format == OrderExportFormat.ndjson:
+                yield "".join(f"{order.model_dump_json()}\n" for order in orders)
+                continue
+
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for order in orders:
+                payload = order.model_dump(mode="json")
+                writer.writerow([
+                    order.id,
+                    order.account_id,
+                    order.brand_id,
+                    order.channel_order_id,
+                    order.customer.name if order.customer else None,
+                    order.customer.phoneNumber if order.customer else None,
+                    order.delivery_address.city if order.delivery_address else None,
+                    order.delivery_address.street if order.delivery_address else None,
+                    order.delivery_address.postalCode if order.delivery_address else None,
+                    payload["pickup_time"],
+                    payload["created_at"],
+                    payload["status"],
+                    json.dumps(payload["items"]),
+                    json.dumps(payload["status_history"]),
+                ])
+            yield buffer.getvalue()
+
+    async def stream_events(self, account_id: str | None = None, brand_id: str | None = None) -> AsyncIterator[str]:
+        """Frame live order status events as Server-Sent Events, with a comment line as keep-alive"""
+        async for payload in order_event_broker.stream(account_id, brand_id):
+            if payload is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: order_status\ndata: {payload}\n\n"
 
     async def create_order(self, order: OrderCreate) -> Order:
-        return await self.repository.create_order(order)
+        """Raises DuplicateOrderError with the original order when the channel order exists already"""
+        result = (await self.create_orders([order]))[0]
+        if isinstance(result, ValueError):
+            raise result
+        return result
+
+    async def submit_order(self, order: OrderCreate) -> Order | OrderIngestionStatus:
+        """
+        In the asynchronous ingestion mode the order is queued for the ingestion worker and its tracking status
+        is returned. When it cannot be queued, or in the default mode, the order is written synchronously.
+        """
+        if self.ingestion.enabled:
+            original = (await self._find_duplicates([order]))[0]
+            if original is not None:
+                raise DuplicateOrderError(original)
+
+            try:
+                return await self.ingestion.enqueue(order)
+            except RedisError as e:
+                logger.warning(f"Error queueing order {order.channel_order_id}, writing it synchronously: {str(e)}")
+
+        return await self.create_order(order)
+
+    async def get_ingestion_status(self, tracking_id: str) -> OrderIngestionStatus | None:
+        return await self.ingestion.get_status(tracking_id)
+
+    async def create_orders(
+            self,
+            orders: list[OrderCreate],
+            ingestion_ids: Sequence[str | None] | None = None
+    ) -> list[Order | ValueError]:
+        """
+        Retried channel orders found in the channel index are answered from the order cache without touching
+        the orders table; the rest go to the repository, whose unique index catches the remaining duplicates.
+        """
+        originals = await self._find_duplicates(orders)
+        results: list[Order | ValueError] = [
+            DuplicateOrderError(original) if original is not None else ValueError("Order was not processed")
+            for original in originals
+        ]
+
+        remaining = [index for index, original in enumerate(originals) if original is None]
+        written = await self.repository.create_orders(
+            [orders[index] for index in remaining],
+            [ingestion_ids[index] for index in remaining] if ingestion_ids else None
+        )
+        for index, result in zip(remaining, written, strict=True):
+            results[index] = result
+
+        created = [result for result in written if isinstance(result, Order)]
+        duplicates = [result.order for result in written if isinstance(result, DuplicateOrderError)]
+        ORDER_DUPLICATES.labels(source="database").inc(len(duplicates))
+
+        await self.cache.set(created)
+        await self.channel_index.set(created + duplicates)
+        await self._publish_created(created)
+        return results
+
+    async def _find_duplicates(self, orders: list[OrderCreate]) -> list[Order | None]:
+        """Resolve orders already known to the channel index to their originals"""
+        known = await self.channel_index.get_many([(order.account_id, order.channel_order_id) for order in orders])
+        if not known:
+            return [None] * len(orders)
+
+        originals = dict(zip(known, await self.get_orders(list(known.values())), strict=True))
+        duplicates = [originals.get((order.account_id, order.channel_order_id)) for order in orders]
+        ORDER_DUPLICATES.labels(source="redis").inc(sum(original is not None for original in duplicates))
+        return duplicates
 
     async def update_status(self, order_id: int, new_status: OrderStatusEnum) -> OrderStatus:
-        return await self.repository.update_order_status(order_id, new_status)
+        status = await self.repository.update_order_status(order_id, new_status)
+        await self.cache.invalidate([order_id])
+        await self._publish_status_changes([status])
+        return status
+
+    async def update_statuses(
+            self,
+            updates: list[tuple[int, OrderStatusEnum]]
+    ) -> list[OrderStatus | KeyError | ValueError]:
+        results = await self.repository.update_order_statuses(updates)
+        changed = [result for result in results if isinstance(result, OrderStatus)]
+        await self.cache.invalidate([status.order_id for status in changed])
+        await self._publish_status_changes(changed)
+        return results
+
+    async def _publish_created(self, orders: list[Order]) -> None:
+        if not self.events.enabled:
+            return
+
+        await self.events.publish([
+            order_status_event(
+                order.id,
+                order.account_id or "",
+                order.brand_id or "",
+                order.status.value if order.status else OrderStatusEnum.RECEIVED.value,
+                order.created_at,
+            )
+            for order in orders
+        ])
+
+    async def _publish_status_changes(self, statuses: list[OrderStatus]) -> None:
+        """Status rows do not carry the order's account and brand, so they are looked up for the event filters"""
+        if not self.events.enabled or not statuses:
+            return
+
+        scopes = await self.repository.get_order_scopes([status.order_id for status in statuses])
+        await self.events.publish([
+            order_status_event(status.order_id, *scopes[status.order_id], status.status.value, status.timestamp)
+            for status in statuses if status.order_id in scopes
+        ])
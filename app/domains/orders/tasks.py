@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import re
+from collections.abc import Iterable
+from datetime import date, datetime, timedelta, timezone
+
+from tortoise import BaseDBAsyncClient, connections
+from tortoise.transactions import in_transaction
+
+from app.core.cache import set_job_status
+from app.core.celery import tortoise_task
+from app.core.config import settings
+from app.core.database import is_postgres
+from app.domains.orders.archive import ORDERS_ARCHIVED, OrderArchive
+from app.domains.orders.repository import OrderRepository
+
+logger = logging.getLogger(__name__)
+
+STATUS_HISTORY_TABLE = "order_status_history"
+# monthly partitions are named order_status_history_pYYYYMM
+STATUS_HISTORY_PARTITION = re.compile(rf"^{STATUS_HISTORY_TABLE}_p(\d{{4}})(\d{{2}})$")
+# rows outside every monthly partition, see migration 12
+STATUS_HISTORY_DEFAULT_PARTITION = f"{STATUS_HISTORY_TABLE}_default"
+
+# Rows of the month that went to the default partition because the partition was missing are moved into the
+# new partition before it is attached, attaching would fail otherwise. Attaching only takes a SHARE UPDATE
+# EXCLUSIVE lock on order_status_history, transitions only wait while the default partition is checked.
+CREATE_STATUS_HISTORY_PARTITION_SQL = f"""
+    CREATE TABLE "{{name}}" (LIKE "{STATUS_HISTORY_TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS);
+    WITH "moved" AS (
+        DELETE FROM "{STATUS_HISTORY_DEFAULT_PARTITION}"
+        WHERE "timestamp" >= '{{start}} UTC' AND "timestamp" < '{{end}} UTC'
+        RETURNING "id", "status", "timestamp", "order_id"
+    )
+    INSERT INTO "{{name}}" ("id", "status", "timestamp", "order_id") SELECT * FROM "moved";
+    ALTER TABLE "{STATUS_HISTORY_TABLE}" ATTACH PARTITION "{{name}}"
+        FOR VALUES FROM ('{{start}} UTC') TO ('{{end}} UTC');
+"""
+
+LIST_STATUS_HISTORY_PARTITIONS_SQL = f"""
+    SELECT "child"."relname" AS "name"
+    FROM "pg_inherits"
+    JOIN "pg_class" AS "parent" ON "parent"."oid" = "pg_inherits"."inhparent"
+    JOIN "pg_class" AS "child" ON "child"."oid" = "pg_inherits"."inhrelid"
+    WHERE "parent"."relname" = '{STATUS_HISTORY_TABLE}'
+"""
+
+# archival only takes closed orders, an order left open past the cutoff keeps its history
+PARTITION_HAS_LIVE_ORDERS_SQL = """
+    SELECT 1 FROM "{name}" AS "history" JOIN "orders" ON "orders"."id" = "history"."order_id" LIMIT 1
+"""
+
+
+def add_months(month: date, months: int) -> date:
+    """First day of the month that is the given number of months after (or before) month"""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def status_history_partition_name(month: date) -> str:
+    return f"{STATUS_HISTORY_TABLE}_p{month:%Y%m}"
+
+
+async def create_status_history_partition(month: date) -> None:
+    async with in_transaction() as connection:
+        await connection.execute_script(CREATE_STATUS_HISTORY_PARTITION_SQL.format(
+            name=status_history_partition_name(month),
+            start=month.isoformat(),
+            end=add_months(month, 1).isoformat()
+        ))
+
+
+async def expired_status_history_partitions(
+        connection: BaseDBAsyncClient,
+        names: Iterable[str],
+        oldest_kept: date
+) -> list[str]:
+    """Monthly partitions before oldest_kept whose history only belongs to orders no longer in the database"""
+    expired = []
+    for name in sorted(names):
+        match = STATUS_HISTORY_PARTITION.match(name)
+        if match is None or date(int(match[1]), int(match[2]), 1) >= oldest_kept:
+            continue
+
+        _, live = await connection.execute_query(PARTITION_HAS_LIVE_ORDERS_SQL.format(name=name))
+        if live:
+            logger.warning(f"Keeping status history partition {name}, it holds history of orders not archived")
+            continue
+        expired.append(name)
+    return expired
+
+
+@tortoise_task
+async def maintain_status_history_partitions() -> str:
+    """
+    Create the monthly order_status_history partitions ahead of time and, when a retention is configured,
+    detach and drop partitions that fell out of it and out of the order archival window and hold no history of
+    orders still in the database, so only history of archived orders goes. Dropping a partition replaces deleting
+    its rows one by one.
+    """
+    try:
+        connection = connections.get("default")
+        if not is_postgres(connection):
+            return "Status history partitions are only maintained on Postgres"
+
+        await set_job_status("status_history_partitions", {"status": "running"})
+
+        this_month = datetime.now(timezone.utc).date().replace(day=1)
+        _, rows = await connection.execute_query(LIST_STATUS_HISTORY_PARTITIONS_SQL)
+        existing = {row["name"] for row in rows}
+
+        created = []
+        for offset in range(settings.status_history_partitions_ahead + 1):
+            month = add_months(this_month, offset)
+            name = status_history_partition_name(month)
+            if name not in existing:
+                await create_status_history_partition(month)
+            created.append(name)
+
+        dropped = []
+        if settings.status_history_retention_months > 0 and not settings.order_archive_enabled:
+            logger.warning("Status history retention needs order archival, history of live orders is kept")
+        elif settings.status_history_retention_months > 0:
+            # orders younger than the archive cutoff are still in the database, and so is their history
+            archive_cutoff = datetime.now(timezone.utc) - timedelta(days=settings.order_archive_after_days)
+            oldest_kept = min(
+                add_months(this_month, -settings.status_history_retention_months),
+                archive_cutoff.date().replace(day=1)
+            )
+            for name in await expired_status_history_partitions(connection, existing, oldest_kept):
+                await connection.execute_script(
+                    f'ALTER TABLE "{STATUS_HISTORY_TABLE}" DETACH PARTITION "{name}"; DROP TABLE "{name}"'
+                )
+                dropped.append(name)
+                logger.info(f"Dropped status history partition {name}")
+
+        _, counts = await connection.execute_query(
+            f'SELECT COUNT(*) AS "rows" FROM "{STATUS_HISTORY_DEFAULT_PARTITION}"'
+        )
+        if counts[0]["rows"]:
+            logger.warning(
+                f"{counts[0]['rows']} status history rows are outside the monthly partitions, "
+                f"in {STATUS_HISTORY_DEFAULT_PARTITION}"
+            )
+
+        await set_job_status("status_history_partitions", {
+            "status": "completed",
+            "ensured_partitions": created,
+            "dropped_partitions": sorted(dropped),
+            "default_partition_rows": counts[0]["rows"]
+        })
+
+        return f"Ensured {len(created)} and dropped {len(dropped)} status history partitions"
+
+    except Exception as e:
+        logger.error(f"Error maintaining status history partitions: {str(e)}")
+        await set_job_status("status_history_partitions", {
+            "status": "failed",
+            "error": str(e)
+        })
+        raise
+
+
+@tortoise_task
+async def archive_closed_orders() -> str:
+    """
+    Move completed and canceled orders older than ORDER_ARCHIVE_AFTER_DAYS to the archive, batch by batch.
+    Each batch is written to disk before its orders are deleted, so an interrupted run loses nothing
+    and the next run continues with the orders still in the database.
+    """
+    try:
+        archive = OrderArchive()
+        if not archive.enabled:
+            return "Order archival is disabled"
+
+        await set_job_status("order_archive", {"status": "running"})
+
+        repository = OrderRepository()
+        created_before = datetime.now(timezone.utc) - timedelta(days=settings.order_archive_after_days)
+        archived = 0
+        while True:
+            order_ids = await repository.get_closed_order_ids(created_before, settings.order_archive_batch_size)
+            if not order_ids:
+                break
+
+            orders = await repository.get_orders(order_ids)
+            locations = await asyncio.to_thread(archive.write, list(orders.values()))
+            await repository.delete_archived_orders(locations)
+            ORDERS_ARCHIVED.inc(len(locations))
+            archived += len(locations)
+
+            if len(order_ids) < settings.order_archive_batch_size:
+                break
+
+        await set_job_status("order_archive", {
+            "status": "completed",
+            "created_before": created_before.isoformat(),
+            "archived_orders": archived
+        })
+
+        return f"Archived {archived} orders"
+
+    except Exception as e:
+        logger.error(f"Error archiving orders: {str(e)}")
+        await set_job_status("order_archive", {
+            "status": "failed",
+            "error": str(e)
+        })
+        raise
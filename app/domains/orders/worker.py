@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import signal
+import socket
+from uuid import uuid4
+
+from prometheus_client import Counter, Gauge, start_http_server
+from pydantic import ValidationError
+from redis.exceptions import RedisError, ResponseError
+from tortoise import Tortoise
+
+from app.api.v1.orders.schemas import Order, OrderCreate, OrderIngestionState, OrderIngestionStatus
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import TORTOISE_ORM
+from app.core.logger import setup_logger
+from app.domains.orders.archive import OrderArchive
+from app.domains.orders.cache import ChannelOrderIndex, OrderCache
+from app.domains.orders.events import OrderEventPublisher
+from app.domains.orders.exceptions import DuplicateOrderError
+from app.domains.orders.ingestion import OrderIngestion
+from app.domains.orders.repository import OrderRepository
+from app.domains.orders.service import OrderService
+
+logger = logging.getLogger(__name__)
+
+ORDER_INGESTION_PROCESSED = Counter(
+    "oms_order_ingestion_processed_total", "Stream entries written by the ingestion worker", ["result"]
+)
+ORDER_INGESTION_DEAD_LETTERED = Counter(
+    "oms_order_ingestion_dead_lettered_total", "Stream entries moved to the dead-letter stream after repeated failures"
+)
+ORDER_INGESTION_LAG = Gauge("oms_order_ingestion_lag", "Stream entries not yet delivered to the consumer group")
+ORDER_INGESTION_PENDING = Gauge(
+    "oms_order_ingestion_pending", "Stream entries delivered to the consumer group but not yet acknowledged"
+)
+
+
+class OrderIngestionWorker:
+    """
+    Consumer group worker draining the ingestion stream into the database in batches.
+    Delivery is at least once: entries are acknowledged only after their orders are committed,
+    and entries left pending by a crashed consumer or a failed batch are claimed again after an idle timeout.
+    Writes are idempotent because each order stores its tracking id, so redelivered entries are skipped.
+    Entries delivered ORDER_INGESTION_MAX_DELIVERIES times are written one by one, so an entry that cannot be
+    written fails alone and is moved to the dead-letter stream.
+    """
+
+    def __init__(self, consumer: str, ingestion: OrderIngestion | None = None) -> None:
+        self.consumer = consumer
+        self.ingestion = ingestion or OrderIngestion()
+        self.service = OrderService(
+            OrderRepository(), OrderCache(), OrderEventPublisher(), self.ingestion, ChannelOrderIndex(), OrderArchive()
+        )
+        self.stopping = asyncio.Event()
+
+    async def ensure_group(self) -> None:
+        try:
+            await redis_client.xgroup_create(
+                settings.order_ingestion_stream, settings.order_ingestion_group, id="0", mkstream=True
+            )
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read_batch(self) -> tuple[list[tuple[str, dict[str, str]]], dict[str, int]]:
+        """
+        Claim entries stuck with another consumer first, otherwise wait for new ones.
+        Returns the entries and how often the claimed ones have been delivered; new entries were delivered once.
+        """
+        _, claimed, *_ = await redis_client.xautoclaim(
+            settings.order_ingestion_stream,
+            settings.order_ingestion_group,
+            self.consumer,
+            min_idle_time=settings.order_ingestion_claim_idle_ms,
+            count=settings.order_ingestion_batch_size,
+        )
+        if claimed:
+            return claimed, await self.delivery_counts([message_id for message_id, _ in claimed])
+
+        streams = await redis_client.xreadgroup(
+            settings.order_ingestion_group,
+            self.consumer,
+            {settings.order_ingestion_stream: ">"},
+            count=settings.order_ingestion_batch_size,
+            block=settings.order_ingestion_block_ms,
+        )
+        return [message for _, messages in streams for message in messages], {}
+
+    async def delivery_counts(self, message_ids: list[str]) -> dict[str, int]:
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            for message_id in message_ids:
+                pipeline.xpending_range(
+                    settings.order_ingestion_stream, settings.order_ingestion_group, message_id, message_id, 1
+                )
+            pending = await pipeline.execute()
+
+        return {entry["message_id"]: entry["times_delivered"] for entries in pending for entry in entries}
+
+    async def process_batch(self, messages: list[tuple[str, dict[str, str]]], deliveries: dict[str, int]) -> None:
+        """Write the entries, isolating the ones that already failed too often"""
+        exhausted = [
+            message for message in messages
+            if deliveries.get(message[0], 1) >= settings.order_ingestion_max_deliveries
+        ]
+        for message_id, fields in exhausted:
+            try:
+                await self.process([(message_id, fields)])
+            except RedisError:
+                raise
+            except Exception as e:
+                logger.exception(f"Moving order ingestion entry {message_id} to the dead-letter stream: {str(e)}")
+                await self.ingestion.dead_letter(message_id, fields, deliveries[message_id], str(e))
+                ORDER_INGESTION_DEAD_LETTERED.inc()
+                ORDER_INGESTION_PROCESSED.labels(result="failed").inc()
+
+        exhausted_ids = {message_id for message_id, _ in exhausted}
+        remaining = [message for message in messages if message[0] not in exhausted_ids]
+        if remaining:
+            await self.process(remaining)
+
+    async def process(self, messages: list[tuple[str, dict[str, str]]]) -> None:
+        statuses: list[OrderIngestionStatus] = []
+        pending: list[tuple[str, OrderCreate]] = []
+        for message_id, fields in messages:
+            tracking_id = fields.get("tracking_id", message_id)
+            try:
+                pending.append((tracking_id, OrderCreate.model_validate_json(fields["order"])))
+            except (KeyError, ValidationError) as e:
+                statuses.append(OrderIngestionStatus(
+                    tracking_id=tracking_id, status=OrderIngestionState.failed, error=str(e)
+                ))
+
+        written = await self.service.repository.get_ingested_order_ids([tracking_id for tracking_id, _ in pending])
+        statuses.extend(
+            OrderIngestionStatus(tracking_id=tracking_id, status=OrderIngestionState.completed, order_id=order_id)
+            for tracking_id, order_id in written.items()
+        )
+        pending = [(tracking_id, order) for tracking_id, order in pending if tracking_id not in written]
+
+        results = await self.service.create_orders(
+            [order for _, order in pending],
+            [tracking_id for tracking_id, _ in pending]
+        )
+        for (tracking_id, _), result in zip(pending, results, strict=True):
+            # a channel retry resolves to the order written for the first submission
+            original = result.order if isinstance(result, DuplicateOrderError) else result
+            if isinstance(original, Order):
+                statuses.append(OrderIngestionStatus(
+                    tracking_id=tracking_id, status=OrderIngestionState.completed, order_id=original.id
+                ))
+            else:
+                statuses.append(OrderIngestionStatus(
+                    tracking_id=tracking_id, status=OrderIngestionState.failed, error=str(result)
+                ))
+
+        await self.ingestion.set_statuses(statuses, [message_id for message_id, _ in messages])
+
+        for status in statuses:
+            ORDER_INGESTION_PROCESSED.labels(result=status.status.value).inc()
+
+    async def update_metrics(self) -> None:
+        """Acknowledged entries are deleted, so everything in the stream is either undelivered or pending"""
+        async with redis_client.pipeline(transaction=False) as pipeline:
+            pipeline.xlen(settings.order_ingestion_stream)
+            pipeline.xpending(settings.order_ingestion_stream, settings.order_ingestion_group)
+            length, summary = await pipeline.execute()
+
+        ORDER_INGESTION_PENDING.set(summary["pending"])
+        ORDER_INGESTION_LAG.set(length - summary["pending"])
+
+    async def run(self) -> None:
+        await self.ensure_group()
+        logger.info(f"Order ingestion worker {self.consumer} consuming {settings.order_ingestion_stream}")
+
+        while not self.stopping.is_set():
+            try:
+                messages, deliveries = await self.read_batch()
+                if messages:
+                    await self.process_batch(messages, deliveries)
+                await self.update_metrics()
+            except RedisError as e:
+                logger.warning(f"Order ingestion worker lost Redis, retrying: {str(e)}")
+                await asyncio.sleep(1)
+            except Exception as e:
+                # entries stay pending and are claimed again once idle
+                logger.exception(f"Order ingestion batch failed: {str(e)}")
+                await asyncio.sleep(1)
+
+
+async def run_worker() -> None:
+    worker = OrderIngestionWorker(consumer=f"{socket.gethostname()}-{uuid4().hex[:8]}")
+
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, worker.stopping.set)
+
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        await worker.run()
+    finally:
+        await Tortoise.close_connections()
+        await redis_client.aclose()
+
+
+if __name__ == "__main__":
+    setup_logger()
+    start_http_server(settings.order_ingestion_metrics_port)
+    asyncio.run(run_worker())
@@ -0,0 +1,39 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # rollups of the hourly metrics already aggregated; later ones are refreshed by the aggregation tasks
+    return """
+        CREATE TABLE IF NOT EXISTS "analytics_status_metric_rollups" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "granularity" VARCHAR(5) NOT NULL,
+    "period_start" DATE NOT NULL,
+    "status" INT NOT NULL,
+    "count" INT NOT NULL,
+    "total_duration" BIGINT NOT NULL,
+    "avg_duration" DOUBLE PRECISION NOT NULL,
+    CONSTRAINT "uid_analytics_s_granula_99ab22" UNIQUE ("granularity", "period_start", "status")
+);
+CREATE TABLE IF NOT EXISTS "analytics_order_metric_rollups" (
+    "id" SERIAL NOT NULL PRIMARY KEY,
+    "granularity" VARCHAR(5) NOT NULL,
+    "period_start" DATE NOT NULL,
+    "throughput" INT NOT NULL,
+    CONSTRAINT "uid_analytics_o_granula_5fa4a3" UNIQUE ("granularity", "period_start")
+);
+INSERT INTO "analytics_status_metric_rollups"
+    ("granularity", "period_start", "status", "count", "total_duration", "avg_duration")
+SELECT "granularity", date_trunc("granularity", "date"::timestamp)::date, "status", SUM("count"),
+    SUM("total_duration"), COALESCE(SUM("total_duration")::float / NULLIF(SUM("count"), 0), 0)
+FROM "analytics_hourly_status_metrics" CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS "g" ("granularity")
+GROUP BY 1, 2, 3;
+INSERT INTO "analytics_order_metric_rollups" ("granularity", "period_start", "throughput")
+SELECT "granularity", date_trunc("granularity", "date"::timestamp)::date, SUM("throughput")
+FROM "analytics_hourly_order_metrics" CROSS JOIN (VALUES ('day'), ('week'), ('month')) AS "g" ("granularity")
+GROUP BY 1, 2;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "analytics_order_metric_rollups";
+DROP TABLE IF EXISTS "analytics_status_metric_rollups";"""
@@ -0,0 +1,22 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # order_status_history becomes append-only, durations are derived from the order's next row when read
+    return """
+        ALTER TABLE "order_status_history" DROP COLUMN "duration";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "order_status_history" ADD "duration" INT;
+UPDATE "order_status_history" SET "duration" = "durations"."duration"
+FROM (
+    SELECT "id", "timestamp",
+           FLOOR(EXTRACT(EPOCH FROM LEAD("timestamp") OVER (
+               PARTITION BY "order_id" ORDER BY "timestamp", "id"
+           ) - "timestamp"))::int AS "duration"
+    FROM "order_status_history"
+) AS "durations"
+WHERE "durations"."id" = "order_status_history"."id" AND "durations"."timestamp" = "order_status_history"."timestamp"
+    AND "durations"."duration" IS NOT NULL;"""
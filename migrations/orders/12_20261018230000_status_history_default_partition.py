@@ -0,0 +1,19 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # catches transitions outside the monthly partitions, e.g. while beat is down, instead of failing them;
+    # maintain_status_history_partitions moves the rows into the month partitions it creates
+    return """
+        CREATE TABLE IF NOT EXISTS "order_status_history_default" PARTITION OF "order_status_history" DEFAULT;"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM "order_status_history_default") THEN
+        RAISE EXCEPTION 'order_status_history_default holds rows, create the partitions they belong to first';
+    END IF;
+END $$;
+DROP TABLE "order_status_history_default";"""
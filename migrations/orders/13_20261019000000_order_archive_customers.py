@@ -0,0 +1,16 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # orders archived before this migration get their customer from scripts/backfill_archived_order_customers.py
+    return """
+        ALTER TABLE "order_archive" ADD "customer_id" INT;
+ALTER TABLE "order_archive" ADD "created_at" TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS "idx_order_archive_customer_created" ON "order_archive" ("customer_id", "created_at");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_order_archive_customer_created";
+ALTER TABLE "order_archive" DROP COLUMN "created_at";
+ALTER TABLE "order_archive" DROP COLUMN "customer_id";"""
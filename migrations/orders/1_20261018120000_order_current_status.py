@@ -0,0 +1,20 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "orders" ADD "current_status" INT NOT NULL DEFAULT 1;
+ALTER TABLE "orders" ADD "current_status_since" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP;
+UPDATE "orders" SET "current_status" = "latest"."status", "current_status_since" = "latest"."timestamp"
+FROM (
+    SELECT DISTINCT ON ("order_id") "order_id", "status", "timestamp"
+    FROM "order_status_history"
+    ORDER BY "order_id", "timestamp" DESC
+) AS "latest"
+WHERE "latest"."order_id" = "orders"."id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "orders" DROP COLUMN "current_status";
+ALTER TABLE "orders" DROP COLUMN "current_status_since";"""
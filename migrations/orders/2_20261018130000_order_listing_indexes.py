@@ -0,0 +1,21 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE INDEX IF NOT EXISTS "idx_orders_account_created" ON "orders" ("account_id", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_orders_brand_created" ON "orders" ("brand_id", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_orders_customer_created" ON "orders" ("customer_id", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_orders_status_created" ON "orders" ("current_status", "created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_orders_created" ON "orders" ("created_at", "id");
+CREATE INDEX IF NOT EXISTS "idx_orders_pickup_time" ON "orders" ("pickup_time");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP INDEX IF EXISTS "idx_orders_account_created";
+DROP INDEX IF EXISTS "idx_orders_brand_created";
+DROP INDEX IF EXISTS "idx_orders_customer_created";
+DROP INDEX IF EXISTS "idx_orders_status_created";
+DROP INDEX IF EXISTS "idx_orders_created";
+DROP INDEX IF EXISTS "idx_orders_pickup_time";"""
@@ -0,0 +1,31 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # channel retries may already have stored duplicates. They are not removed here: the migration fails with
+    # their count until they were reviewed and moved aside by scripts/move_duplicate_channel_orders.py
+    return """
+        DO $$
+DECLARE
+    "duplicates" BIGINT;
+BEGIN
+    SELECT COUNT(*) INTO "duplicates"
+    FROM "orders" AS "duplicate"
+    WHERE EXISTS (
+        SELECT 1 FROM "orders" AS "original"
+        WHERE "original"."account_id" = "duplicate"."account_id"
+            AND "original"."channel_order_id" = "duplicate"."channel_order_id"
+            AND "original"."id" < "duplicate"."id"
+    );
+    IF "duplicates" > 0 THEN
+        RAISE EXCEPTION '% orders repeat the account_id and channel_order_id of an earlier order', "duplicates"
+            USING HINT = 'Review them with python -m scripts.move_duplicate_channel_orders and move them aside '
+                || 'with --apply, then migrate again.';
+    END IF;
+END $$;
+ALTER TABLE "orders" ADD CONSTRAINT "uid_orders_account_35b05b" UNIQUE ("account_id", "channel_order_id");"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "orders" DROP CONSTRAINT IF EXISTS "uid_orders_account_35b05b";"""
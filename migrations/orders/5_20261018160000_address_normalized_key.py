@@ -0,0 +1,25 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # mirrors normalize_address_key; only the earliest of already duplicated addresses gets the key
+    return """
+        ALTER TABLE "addresses" ADD "normalized_key" VARCHAR(400) UNIQUE;
+UPDATE "addresses" SET "normalized_key" = "keys"."normalized_key"
+FROM (
+    SELECT DISTINCT ON ("normalized_key") "id", "normalized_key"
+    FROM (
+        SELECT "id",
+               LOWER(TRIM(REGEXP_REPLACE("postal_code", '\\s+', ' ', 'g'))) || '|' ||
+               LOWER(TRIM(REGEXP_REPLACE("city", '\\s+', ' ', 'g'))) || '|' ||
+               LOWER(TRIM(REGEXP_REPLACE("street", '\\s+', ' ', 'g'))) AS "normalized_key"
+        FROM "addresses"
+    ) AS "normalized"
+    ORDER BY "normalized_key", "id"
+) AS "keys"
+WHERE "keys"."id" = "addresses"."id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "addresses" DROP COLUMN "normalized_key";"""
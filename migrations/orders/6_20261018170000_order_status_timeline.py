@@ -0,0 +1,24 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # mirrors timeline_offset: whole seconds between the order creation and each transition
+    return """
+        ALTER TABLE "orders" ADD "status_timeline" TEXT NOT NULL DEFAULT '';
+UPDATE "orders" SET "status_timeline" = "timelines"."status_timeline"
+FROM (
+    SELECT "orders"."id",
+           string_agg(
+               "order_status_history"."status" || ':' ||
+               FLOOR(EXTRACT(EPOCH FROM "order_status_history"."timestamp" - "orders"."created_at"))::int,
+               ',' ORDER BY "order_status_history"."id"
+           ) AS "status_timeline"
+    FROM "orders" JOIN "order_status_history" ON "order_status_history"."order_id" = "orders"."id"
+    GROUP BY "orders"."id"
+) AS "timelines"
+WHERE "timelines"."id" = "orders"."id";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "orders" DROP COLUMN "status_timeline";"""
@@ -0,0 +1,70 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # order_status_history becomes range partitioned by month on "timestamp"; the primary key has to include
+    # the partition key. Partitions cover the existing rows and three months ahead, later ones are created by
+    # app.domains.orders.tasks.maintain_status_history_partitions.
+    # orders stays a plain table: order_items and order_status_history reference orders.id, and a partitioned
+    # orders would need created_at in its primary key and in the (account_id, channel_order_id) and
+    # ingestion_id unique constraints. Its created_at range scans are served by idx_orders_created.
+    # The hourly aggregation reads one partition through the new timestamp index.
+    return """
+        ALTER TABLE "order_status_history" RENAME TO "order_status_history_unpartitioned";
+ALTER TABLE "order_status_history_unpartitioned"
+    RENAME CONSTRAINT "order_status_history_pkey" TO "order_status_history_unpartitioned_pkey";
+ALTER INDEX "idx_order_statu_order_i_7965a8" RENAME TO "idx_order_statu_unpartitioned";
+CREATE TABLE "order_status_history" (
+    "id" INT NOT NULL DEFAULT nextval('order_status_history_id_seq'),
+    "status" INT NOT NULL,
+    "timestamp" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "duration" INT,
+    "order_id" INT NOT NULL REFERENCES "orders" ("id") ON DELETE CASCADE,
+    PRIMARY KEY ("id", "timestamp")
+) PARTITION BY RANGE ("timestamp");
+ALTER SEQUENCE "order_status_history_id_seq" OWNED BY "order_status_history"."id";
+CREATE INDEX "idx_order_statu_order_i_7965a8" ON "order_status_history" ("order_id", "timestamp");
+CREATE INDEX "idx_status_history_timestamp" ON "order_status_history" ("timestamp");
+DO $$
+DECLARE
+    "month" DATE;
+BEGIN
+    FOR "month" IN
+        SELECT generate_series(
+            date_trunc('month', LEAST(MIN("timestamp"), now()) AT TIME ZONE 'UTC'),
+            date_trunc('month', GREATEST(MAX("timestamp"), now() + INTERVAL '3 months') AT TIME ZONE 'UTC'),
+            INTERVAL '1 month'
+        )::date
+        FROM "order_status_history_unpartitioned"
+    LOOP
+        EXECUTE format(
+            'CREATE TABLE %I PARTITION OF "order_status_history" FOR VALUES FROM (%L) TO (%L)',
+            'order_status_history_p' || to_char("month", 'YYYYMM'),
+            "month" || ' UTC',
+            ("month" + INTERVAL '1 month')::date || ' UTC'
+        );
+    END LOOP;
+END $$;
+INSERT INTO "order_status_history" ("id", "status", "timestamp", "duration", "order_id")
+SELECT "id", "status", "timestamp", "duration", "order_id" FROM "order_status_history_unpartitioned";
+DROP TABLE "order_status_history_unpartitioned";"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        ALTER TABLE "order_status_history" RENAME TO "order_status_history_partitioned";
+ALTER INDEX "idx_order_statu_order_i_7965a8" RENAME TO "idx_order_statu_partitioned";
+ALTER TABLE "order_status_history_partitioned"
+    RENAME CONSTRAINT "order_status_history_pkey" TO "order_status_history_partitioned_pkey";
+CREATE TABLE "order_status_history" (
+    "id" INT NOT NULL DEFAULT nextval('order_status_history_id_seq') PRIMARY KEY,
+    "status" INT NOT NULL,
+    "timestamp" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    "duration" INT,
+    "order_id" INT NOT NULL REFERENCES "orders" ("id") ON DELETE CASCADE
+);
+ALTER SEQUENCE "order_status_history_id_seq" OWNED BY "order_status_history"."id";
+CREATE INDEX "idx_order_statu_order_i_7965a8" ON "order_status_history" ("order_id", "timestamp");
+INSERT INTO "order_status_history" ("id", "status", "timestamp", "duration", "order_id")
+SELECT "id", "status", "timestamp", "duration", "order_id" FROM "order_status_history_partitioned";
+DROP TABLE "order_status_history_partitioned";"""
@@ -0,0 +1,17 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        CREATE TABLE IF NOT EXISTS "order_archive" (
+    "order_id" INT NOT NULL PRIMARY KEY,
+    "path" VARCHAR(255) NOT NULL,
+    "byte_offset" BIGINT NOT NULL,
+    "byte_length" INT NOT NULL,
+    "archived_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "order_archive";"""
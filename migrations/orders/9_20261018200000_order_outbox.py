@@ -0,0 +1,27 @@
+from tortoise import BaseDBAsyncClient
+
+
+async def upgrade(db: BaseDBAsyncClient) -> str:
+    # transaction_id orders the outbox by commit visibility, see app.domains.orders.outbox;
+    # there is no foreign key to orders, events outlive archived orders
+    return """
+        CREATE TABLE IF NOT EXISTS "order_outbox" (
+    "id" BIGSERIAL NOT NULL PRIMARY KEY,
+    "transaction_id" BIGINT NOT NULL DEFAULT pg_current_xact_id()::text::bigint,
+    "event_type" VARCHAR(32) NOT NULL,
+    "order_id" INT NOT NULL,
+    "payload" TEXT NOT NULL,
+    "created_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+CREATE INDEX IF NOT EXISTS "idx_order_outbox_position" ON "order_outbox" ("transaction_id", "id");
+CREATE TABLE IF NOT EXISTS "stream_consumer_offsets" (
+    "consumer" VARCHAR(100) NOT NULL PRIMARY KEY,
+    "last_entry_id" VARCHAR(41) NOT NULL,
+    "updated_at" TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP
+);"""
+
+
+async def downgrade(db: BaseDBAsyncClient) -> str:
+    return """
+        DROP TABLE IF EXISTS "stream_consumer_offsets";
+DROP TABLE IF EXISTS "order_outbox";"""
@@ -0,0 +1,66 @@
+"""
+Data fix for migration 13, which adds the customer and creation time of archived orders to ``order_archive`` so
+customer lifetime metrics keep counting them.
+
+Orders archived before that migration have neither. This reads each of them back from the archive files, finds
+its customer by phone number and fills both columns, batch by batch.
+
+    DATABASE_URL=postgres://... ORDER_ARCHIVE_PATH=... poetry run python -m scripts.backfill_archived_order_customers
+"""
+import asyncio
+import logging
+
+from app.api.v1.orders.schemas import Order
+from app.core.database import TORTOISE_ORM
+from app.domains.orders.archive import OrderArchive
+from app.domains.orders.models import ArchivedOrder, Customer
+from tortoise import Tortoise
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 500
+
+
+async def backfill_customers() -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        filled = 0
+        last_order_id = 0
+        while True:
+            locations = await ArchivedOrder.filter(
+                customer_id=None, order_id__gt=last_order_id
+            ).order_by("order_id").limit(BATCH_SIZE)
+            if not locations:
+                break
+
+            orders = {
+                location.order_id: Order.model_validate_json(await asyncio.to_thread(
+                    OrderArchive._read, location.path, location.byte_offset, location.byte_length
+                ))
+                for location in locations
+            }
+            phones = {order.customer.phoneNumber for order in orders.values() if order.customer}
+            customer_ids = dict(await Customer.filter(phone__in=phones).values_list("phone", "id"))
+
+            for location in locations:
+                order = orders[location.order_id]
+                location.created_at = order.created_at
+                location.customer_id = customer_ids.get(order.customer.phoneNumber) if order.customer else None
+                if location.customer_id is None:
+                    logger.warning(f"Archived order {location.order_id} has no customer left in the database")
+            await ArchivedOrder.bulk_update(locations, fields=["customer_id", "created_at"])
+
+            filled += len(locations)
+            last_order_id = locations[-1].order_id
+            logger.info(f"Filled {filled} archived orders")
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(backfill_customers())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Throughput benchmark for writing analytics summary rows on Postgres.
+
+Writes HourlyStatusMetric rows three ways and reports rows per second for a fresh insert and for
+overwriting the same rows again:
+
+- ``update_or_create`` per row, what the aggregation tasks used to do (a SELECT plus an INSERT or UPDATE)
+- ``insert_many`` with ON CONFLICT DO UPDATE, multi-row VALUES statements chunked by the parameter limit
+- ``upsert_many``, one statement unnesting one array parameter per column
+
+The per row path is only measured at the smallest size. The table is emptied before and after each run.
+
+    DATABASE_URL=postgres://... poetry run python -m scripts.bench_analytics_upsert
+"""
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from datetime import date, timedelta
+from typing import Any
+
+from app.core.database import TORTOISE_ORM, insert_many, is_postgres, upsert_many
+from app.domains.analytics.models import HourlyStatusMetric
+from tortoise import Tortoise, connections
+
+logger = logging.getLogger(__name__)
+
+CONFLICT = ("date", "hour", "status")
+UPDATED = ("count", "total_duration", "avg_duration")
+
+
+def metric_rows(size: int, count: int) -> list[dict[str, Any]]:
+    start = date(2000, 1, 1)
+    return [
+        {
+            "date": start + timedelta(days=index // 120),
+            "hour": index // 5 % 24,
+            "status": index % 5 + 1,
+            "count": count,
+            "total_duration": count * 60,
+            "avg_duration": 60.0,
+        }
+        for index in range(size)
+    ]
+
+
+async def update_or_create(rows: list[dict[str, Any]]) -> None:
+    for row in rows:
+        await HourlyStatusMetric.update_or_create(
+            date=row["date"],
+            hour=row["hour"],
+            status=row["status"],
+            defaults={column: row[column] for column in UPDATED},
+        )
+
+
+async def multi_row_insert(rows: list[dict[str, Any]]) -> None:
+    await insert_many(
+        connections.get("default"), HourlyStatusMetric, rows, on_conflict=CONFLICT, on_conflict_update=UPDATED
+    )
+
+
+async def unnest_upsert(rows: list[dict[str, Any]]) -> None:
+    await upsert_many(
+        connections.get("default"), HourlyStatusMetric, rows, on_conflict=CONFLICT, on_conflict_update=UPDATED
+    )
+
+
+async def measure(name: str, write: Callable[[list[dict[str, Any]]], Awaitable[None]], size: int) -> None:
+    await HourlyStatusMetric.all().delete()
+    for phase, count in (("insert", 1), ("update", 2)):
+        rows = metric_rows(size, count)
+        start = time.perf_counter()
+        await write(rows)
+        elapsed = time.perf_counter() - start
+        logger.info(f"{name} {phase} {size} rows: {elapsed:.2f}s, {size / elapsed:,.0f} rows/s")
+
+    if await HourlyStatusMetric.filter(count=2).count() != size:
+        raise SystemExit(f"{name} did not write every row")
+    await HourlyStatusMetric.all().delete()
+
+
+async def bench(sizes: tuple[int, ...] = (10000, 100000)) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        if not is_postgres(connections.get("default")):
+            raise SystemExit("DATABASE_URL must point to Postgres")
+        if await HourlyStatusMetric.exists():
+            raise SystemExit("analytics_hourly_status_metrics must be empty, the benchmark deletes its rows")
+
+        for size in sizes:
+            if size == sizes[0]:
+                await measure("update_or_create", update_or_create, size)
+            await measure("insert_many", multi_row_insert, size)
+            await measure("upsert_many", unnest_upsert, size)
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Latency benchmark for loading a complete order on Postgres.
+
+Compares the ORM path (the order with customer and address joined, then one prefetch query each for
+items and status history) with the single JSON aggregation query ``OrderRepository.get_order`` issues
+on Postgres. A throwaway order is created for the run and removed afterwards.
+
+    DATABASE_URL=postgres://... poetry run python -m scripts.bench_order_hydration
+"""
+import asyncio
+import logging
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from datetime import datetime, timedelta, timezone
+
+from app.core.database import TORTOISE_ORM, is_postgres
+from app.domains.orders.models import Address, Customer, Order, OrderItem, OrderStatusHistory
+from app.domains.orders.repository import OrderRepository
+from tortoise import Tortoise, connections
+
+logger = logging.getLogger(__name__)
+
+
+async def create_order(item_count: int = 10, status_count: int = 5) -> Order:
+    customer, _ = await Customer.get_or_create(defaults={"name": "Bench Customer"}, phone="000-000-0000")
+    address, _ = await Address.get_or_create(
+        defaults={"postal_code": "00000"}, city="Bench City", street="1 Bench Street"
+    )
+    created_at = datetime.now(timezone.utc)
+    order = await Order.create(
+        account_id="bench-account",
+        brand_id="bench-brand",
+        channel_order_id=f"bench-{created_at.timestamp()}",
+        customer=customer,
+        address=address,
+        pickup_time=created_at + timedelta(minutes=30),
+        current_status=status_count,
+    )
+    await OrderItem.bulk_create([
+        OrderItem(order=order, name=f"Item {index}", plu=f"PLU-{index}", quantity=index + 1)
+        for index in range(item_count)
+    ])
+    await OrderStatusHistory.bulk_create([
+        OrderStatusHistory(
+            order=order,
+            status=status,
+            timestamp=created_at + timedelta(minutes=5 * status),
+        )
+        for status in range(1, status_count + 1)
+    ])
+    return order
+
+
+async def measure(call: Callable[[], Awaitable[object]], number: int) -> list[float]:
+    for _ in range(min(number, 50)):
+        await call()
+
+    timings = []
+    for _ in range(number):
+        start = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    percentiles = statistics.quantiles(timings, n=100)
+    logger.info(f"{name}: p50 {percentiles[49] * 1e3:.3f}ms, p99 {percentiles[98] * 1e3:.3f}ms")
+
+
+async def bench(number: int = 2000) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        if not is_postgres(connections.get("default")):
+            raise SystemExit("DATABASE_URL must point to Postgres")
+
+        repository = OrderRepository()
+        order = await create_order()
+
+        async def orm_path() -> object:
+            stored = await Order.get(id=order.id).prefetch_related(
+                "items", "status_history"
+            ).select_related("customer", "address")
+            return repository._order_storage_to_order_schema(stored)
+
+        async def json_path() -> object:
+            return await repository.get_order(order.id)
+
+        if await orm_path() != await json_path():
+            raise SystemExit("ORM and JSON aggregation paths returned different orders")
+
+        report("orm (3 queries)", await measure(orm_path, number))
+        report("json_agg (1 query)", await measure(json_path, number))
+
+        await order.delete()
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(bench())
+
+
+if __name__ == "__main__":
+    main()
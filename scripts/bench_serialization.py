@@ -0,0 +1,102 @@
+"""
+Microbenchmark for response serialization.
+
+Compares FastAPI's default path for a handler returning a model or dicts (re-validation against
+``response_model`` in ``serialize_response``, then ``JSONResponse`` rendering with ``json.dumps``)
+with ``PydanticJSONResponse`` encoding the already validated content directly.
+
+    poetry run python -m scripts.bench_serialization
+"""
+import asyncio
+import logging
+import timeit
+from datetime import datetime, timedelta
+from typing import Any
+
+from app.api.v1.analytics.schemas import HourlyStatusMetric
+from app.api.v1.orders.schemas import Address, Customer, Order, OrderItem, OrderStatus, OrderStatusEnum
+from app.core.responses import PydanticJSONResponse
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+
+logger = logging.getLogger(__name__)
+
+
+def build_order(item_count: int = 10) -> Order:
+    created_at = datetime(2026, 1, 1, 12, 0, 0)
+    return Order(
+        id=1,
+        account_id="account-1",
+        brand_id="brand-1",
+        channel_order_id="channel-1",
+        customer=Customer(name="John Doe", phoneNumber="123-456-7890"),
+        delivery_address=Address(city="New York", street="123 Broadway", postalCode="10001"),
+        pickup_time=created_at + timedelta(minutes=30),
+        created_at=created_at,
+        items=[
+            OrderItem(id=index, order_id=1, name=f"Item {index}", plu=f"PLU-{index}", quantity=index + 1)
+            for index in range(item_count)
+        ],
+        status=OrderStatusEnum.READY_FOR_PICKUP,
+        status_history=[
+            OrderStatus(
+                id=index,
+                order_id=1,
+                status=status,
+                timestamp=created_at + timedelta(minutes=5 * index),
+                duration=300 if index < 2 else None,
+            )
+            for index, status in enumerate(
+                [OrderStatusEnum.RECEIVED, OrderStatusEnum.PREPARING, OrderStatusEnum.READY_FOR_PICKUP]
+            )
+        ],
+    )
+
+
+def build_metrics(row_count: int = 5000) -> list[dict[str, Any]]:
+    return [
+        {
+            "date": f"2026-01-{index % 28 + 1:02d}",
+            "hour": index % 24,
+            "status": index % 5 + 1,
+            "count": index,
+            "total_duration": index * 60,
+            "average_duration": 60.0,
+        }
+        for index in range(row_count)
+    ]
+
+
+def bench(name: str, content: Any, response_model: Any, number: int) -> None:
+    field = create_model_field(name="Response", type_=response_model, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def default_path() -> bytes:
+        serialized = loop.run_until_complete(
+            serialize_response(field=field, response_content=content, is_coroutine=True)
+        )
+        return JSONResponse(serialized).body
+
+    def fast_path() -> bytes:
+        return PydanticJSONResponse(content).body
+
+    default_seconds = timeit.timeit(default_path, number=number) / number
+    fast_seconds = timeit.timeit(fast_path, number=number) / number
+    loop.close()
+
+    logger.info(
+        f"{name}: default {default_seconds * 1e6:,.1f}us, fast {fast_seconds * 1e6:,.1f}us, "
+        f"saved {(default_seconds - fast_seconds) * 1e6:,.1f}us per request "
+        f"({default_seconds / fast_seconds:.1f}x)"
+    )
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    bench("order (10 items)", build_order(), Order, number=5000)
+    bench("status metrics (5,000 rows)", build_metrics(), list[HourlyStatusMetric], number=50)
+
+
+if __name__ == "__main__":
+    main()
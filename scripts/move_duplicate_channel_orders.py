@@ -0,0 +1,85 @@
+"""
+Data fix for migration 4, which refuses to add the (account_id, channel_order_id) unique constraint while
+channel retries have stored the same order more than once.
+
+Lists every order that repeats the account_id and channel_order_id of an earlier order. With ``--apply`` the
+duplicates, their items and their status history are copied to the side tables ``duplicate_channel_orders``,
+``duplicate_channel_order_items`` and ``duplicate_channel_order_status_history`` and then deleted, in one
+transaction. The earliest order of each channel order is kept.
+
+    DATABASE_URL=postgres://... poetry run python -m scripts.move_duplicate_channel_orders [--apply]
+"""
+import argparse
+import asyncio
+import logging
+
+from app.core.database import TORTOISE_ORM, is_postgres
+from tortoise import Tortoise, connections
+from tortoise.transactions import in_transaction
+
+logger = logging.getLogger(__name__)
+
+SELECT_DUPLICATES_SQL = """
+    SELECT "duplicate"."id", "duplicate"."account_id", "duplicate"."channel_order_id",
+        MIN("original"."id") AS "original_id"
+    FROM "orders" AS "duplicate"
+    JOIN "orders" AS "original"
+        ON "original"."account_id" = "duplicate"."account_id"
+        AND "original"."channel_order_id" = "duplicate"."channel_order_id"
+        AND "original"."id" < "duplicate"."id"
+    GROUP BY "duplicate"."id"
+    ORDER BY "duplicate"."id"
+"""
+
+# side table, source table and the column holding the order id
+SIDE_TABLES = (
+    ("duplicate_channel_orders", "orders", "id"),
+    ("duplicate_channel_order_items", "order_items", "order_id"),
+    ("duplicate_channel_order_status_history", "order_status_history", "order_id"),
+)
+
+
+async def move_duplicates(apply: bool) -> None:
+    await Tortoise.init(config=TORTOISE_ORM)
+    try:
+        if not is_postgres(connections.get("default")):
+            raise SystemExit("DATABASE_URL must point to Postgres")
+
+        async with in_transaction() as connection:
+            _, duplicates = await connection.execute_query(SELECT_DUPLICATES_SQL)
+            for duplicate in duplicates:
+                logger.info(
+                    f"Order {duplicate['id']} repeats order {duplicate['original_id']} "
+                    f"({duplicate['account_id']}, {duplicate['channel_order_id']})"
+                )
+            logger.info(f"{len(duplicates)} duplicate orders")
+            if not apply or not duplicates:
+                return
+
+            order_ids = [duplicate["id"] for duplicate in duplicates]
+            for side_table, table, column in SIDE_TABLES:
+                await connection.execute_script(
+                    f'CREATE TABLE IF NOT EXISTS "{side_table}" AS SELECT * FROM "{table}" WITH NO DATA'
+                )
+                await connection.execute_query(
+                    f'INSERT INTO "{side_table}" SELECT * FROM "{table}" WHERE "{column}" = ANY($1::int[])',
+                    [order_ids]
+                )
+            # items and status history follow by ON DELETE CASCADE
+            await connection.execute_query('DELETE FROM "orders" WHERE "id" = ANY($1::int[])', [order_ids])
+            logger.info(f"Moved {len(order_ids)} duplicate orders to {SIDE_TABLES[0][0]}")
+    finally:
+        await Tortoise.close_connections()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Move orders repeating a channel order id to side tables")
+    parser.add_argument("--apply", action="store_true", help="move the duplicates, otherwise only list them")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    asyncio.run(move_duplicates(args.apply))
+
+
+if __name__ == "__main__":
+    main()
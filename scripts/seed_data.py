@@ -82,15 +82,10 @@ async def seed_data() -> None:
             current_status = order_statuses[status - 1]
             current_time = last_status_time + timedelta(minutes=random.randint(5, 30))
 
-            duration = None
-            if status > 1:
-                duration = int((current_time - last_status_time).total_seconds())
-
             await OrderStatusHistory.create(
                 order=order,
                 status=current_status,
-                timestamp=current_time,
-                duration=duration
+                timestamp=current_time
             )
 
             last_status_time = current_time
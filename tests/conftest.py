@@ -1,5 +1,13 @@
+import os
 from collections.abc import AsyncGenerator
 
+# tests run against a fresh in-memory database whose ids are reused, so cached orders would leak between tests
+os.environ.setdefault("ORDER_CACHE_ENABLED", "false")
+os.environ.setdefault("ORDER_DEDUP_ENABLED", "false")
+os.environ.setdefault("ANALYTICS_CACHE_ENABLED", "false")
+# no Redis is available to publish order status events to
+os.environ.setdefault("ORDER_EVENTS_ENABLED", "false")
+
 import pytest_asyncio
 from app.core.database import TORTOISE_ORM_TEST
 from app.main import app as _app
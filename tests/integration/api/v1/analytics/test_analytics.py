@@ -0,0 +1,452 @@
+import asyncio
+import json
+import time
+from collections.abc import AsyncGenerator
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import is_postgres, upsert_many
+from app.domains.analytics import tasks
+from app.domains.analytics.cache import AnalyticsCache
+from app.domains.analytics.incremental import (
+    HOURLY_DELTAS_KEY,
+    HOURLY_POSITION_KEY,
+    HOURLY_REWRITE_SKIPPED_KEY,
+    HOURLY_REWRITES_KEY,
+    HourlyMetricsConsumer,
+    HourlyMetricsCounters,
+    hourly_deltas,
+    merge_hourly_deltas,
+)
+from app.domains.analytics.models import (
+    CustomerLifetimeMetric,
+    HourlyOrderMetric,
+    HourlyStatusMetric,
+    OrderMetricRollup,
+    StatusMetricRollup,
+)
+from app.domains.analytics.rollups import refresh_metric_rollups
+from app.domains.analytics.tasks import (
+    _hourly_metric_rows,
+    _process_customer_batch,
+    _update_changed_customer_metrics,
+)
+from app.domains.orders.models import Address, ArchivedOrder, Customer, Order, OrderStatusHistory
+from app.domains.orders.outbox import order_created_event, status_changed_event
+from httpx import AsyncClient
+from pytest_asyncio import fixture as async_fixture
+from tortoise import connections
+
+
+@async_fixture(autouse=True)
+async def cleanup_db() -> AsyncGenerator[None, None]:
+    """Automatically cleanup database after each test."""
+    yield
+    await HourlyStatusMetric.all().delete()
+    await HourlyOrderMetric.all().delete()
+    await CustomerLifetimeMetric.all().delete()
+    await StatusMetricRollup.all().delete()
+    await OrderMetricRollup.all().delete()
+    await Order.all().delete()
+    await OrderStatusHistory.all().delete()
+    await Customer.all().delete()
+    await Address.all().delete()
+    await ArchivedOrder.all().delete()
+
+
+def stream_entries(events: list[dict]) -> list[tuple[str, dict[str, str]]]:
+    return [
+        (f"1-{index}", {"type": event["event_type"], "payload": event["payload"]})
+        for index, event in enumerate(events, start=1)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_hourly_counters_merge_into_metrics(client: AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    created_at = datetime(2026, 10, 18, 9, 50, tzinfo=timezone.utc)
+    preparing_at = created_at + timedelta(minutes=20)
+    entries = stream_entries([
+        order_created_event(1, "acct123", "brand123", created_at),
+        order_created_event(2, "acct123", "brand123", created_at),
+        status_changed_event(1, 1, created_at, 2, preparing_at, 1200),
+    ])
+    deltas = {field: str(value) for field, value in hourly_deltas(entries)[0].items()}
+    assert deltas == {
+        "2026-10-18T09:count:1": "2",
+        "2026-10-18T09:throughput": "2",
+        "2026-10-18T09:duration:1": "1200",
+        "2026-10-18T10:count:2": "1",
+    }
+
+    # merging adds to the rows already there
+    await merge_hourly_deltas(connections.get("default"), deltas)
+    await merge_hourly_deltas(connections.get("default"), {"2026-10-18T09:count:1": "2", "position": "1-4"})
+    received = await HourlyStatusMetric.get(date=created_at.date(), hour=9, status=1)
+    assert (received.count, received.total_duration, received.avg_duration) == (4, 1200, 300)
+    assert (await HourlyOrderMetric.get(date=created_at.date(), hour=9)).throughput == 2
+
+    # the endpoints add the counters not flushed yet
+    monkeypatch.setattr(settings, "analytics_incremental_enabled", True)
+
+    async def pending(_self: HourlyMetricsCounters) -> dict[str, str]:
+        return {"2026-10-18T10:count:2": "1", "2026-10-18T10:throughput": "3", "2026-10-19T00:throughput": "1"}
+
+    monkeypatch.setattr(HourlyMetricsCounters, "pending", pending)
+    response = await client.get(
+        "/api/v1/analytics/status-metrics", params={"from_date": "2026-10-18", "to_date": "2026-10-18", "status": 2}
+    )
+    assert [(metric["hour"], metric["count"]) for metric in response.json()] == [(10, 2)]
+    response = await client.get(
+        "/api/v1/analytics/order-metrics", params={"from_date": "2026-10-18", "to_date": "2026-10-18"}
+    )
+    assert [(metric["hour"], metric["throughput"]) for metric in response.json()] == [(9, 2), (10, 3)]
+
+
+@pytest.mark.asyncio
+async def test_consumer_leaves_out_events_a_rescan_saw() -> None:
+    created_at = datetime(2026, 10, 18, 9, 50, tzinfo=timezone.utc)
+    events = [
+        order_created_event(1, "acct123", "brand123", created_at),
+        status_changed_event(1, 1, created_at, 2, created_at + timedelta(minutes=20), 1200),
+        order_created_event(2, "acct123", "brand123", created_at + timedelta(minutes=40)),
+        order_created_event(3, "acct123", "brand123", created_at + timedelta(hours=2)),
+    ]
+    # transactions 99 and 104 are visible in the rescan's snapshot, 102 was still running and 106 came later
+    entries = [
+        (entry_id, {"type": event["event_type"], "payload": event["payload"]})
+        for entry_id, event in zip(["99-1", "102-2", "104-3", "106-4"], events, strict=True)
+    ]
+    rewrite = {
+        "start": "2026-10-18T09",
+        "end": "2026-10-18T11",
+        "snapshot": "100:105:102",
+        "committed": False,
+        "since": time.time()
+    }
+    skipped_key = HOURLY_REWRITE_SKIPPED_KEY.format(rewrite_id="test")
+    await redis_client.hset(HOURLY_REWRITES_KEY, "test", json.dumps(rewrite))
+    try:
+        assert await HourlyMetricsConsumer.apply("0-0", entries)
+        assert await redis_client.hgetall(HOURLY_DELTAS_KEY) == {
+            "2026-10-18T10:count:2": "1",
+            "2026-10-18T09:duration:1": "1200",
+            "2026-10-18T11:count:1": "1",
+            "2026-10-18T11:throughput": "1",
+            "position": "106-4",
+        }
+        # kept to be put back should the rescan fail
+        assert await redis_client.hgetall(skipped_key) == {
+            "2026-10-18T09:count:1": "1",
+            "2026-10-18T09:throughput": "1",
+            "2026-10-18T10:count:1": "1",
+            "2026-10-18T10:throughput": "1",
+        }
+
+        # once committed and read past, the rescan is forgotten
+        await redis_client.hset(HOURLY_REWRITES_KEY, "test", json.dumps({**rewrite, "committed": True}))
+        later = [("107-5", {"type": events[0]["event_type"], "payload": events[0]["payload"]})]
+        assert await HourlyMetricsConsumer.apply("106-4", later)
+        assert await redis_client.hget(HOURLY_DELTAS_KEY, "2026-10-18T09:count:1") == "1"
+        assert not await redis_client.exists(HOURLY_REWRITES_KEY, skipped_key)
+    finally:
+        await redis_client.delete(HOURLY_DELTAS_KEY, HOURLY_POSITION_KEY, HOURLY_REWRITES_KEY, skipped_key)
+
+
+@pytest.mark.asyncio
+async def test_failed_rescan_puts_left_out_counters_back(monkeypatch: pytest.MonkeyPatch) -> None:
+    if not is_postgres(connections.get("default")):
+        pytest.skip("rescans record a Postgres snapshot")
+    monkeypatch.setattr(settings, "analytics_incremental_enabled", True)
+    created_at = datetime(2026, 10, 18, 9, 50, tzinfo=timezone.utc)
+    event = order_created_event(1, "acct123", "brand123", created_at)
+    entry = {"type": event["event_type"], "payload": event["payload"]}
+    try:
+        with pytest.raises(ValueError):
+            async with HourlyMetricsCounters().rewriting(created_at, created_at + timedelta(hours=1)):
+                # an event the rescan sees, read by the consumer while the rescan runs
+                assert await HourlyMetricsConsumer.apply("0-0", [("1-1", entry)])
+                assert await redis_client.hgetall(HOURLY_DELTAS_KEY) == {"position": "1-1"}
+                raise ValueError("rescan failed")
+
+        assert not await redis_client.exists(HOURLY_REWRITES_KEY)
+        assert await redis_client.hgetall(HOURLY_DELTAS_KEY) == {
+            "2026-10-18T09:count:1": "1",
+            "2026-10-18T09:throughput": "1",
+            "position": "1-1",
+        }
+    finally:
+        await redis_client.delete(HOURLY_DELTAS_KEY, HOURLY_POSITION_KEY, HOURLY_REWRITES_KEY)
+
+
+@pytest.mark.asyncio
+async def test_backfill_groups_history_by_hour_and_status() -> None:
+    customer = await Customer.create(name="Test Customer", phone="1234567890")
+    address = await Address.create(city="Test City", street="Test St", postal_code="12345")
+    start = datetime(2026, 10, 18, tzinfo=timezone.utc)
+    for index, created_at in enumerate([start + timedelta(hours=1, minutes=5), start + timedelta(hours=1, minutes=50)]):
+        order = await Order.create(
+            account_id="acct123",
+            brand_id="brand123",
+            channel_order_id=f"test{index}",
+            customer=customer,
+            address=address,
+            pickup_time=created_at,
+        )
+        # created_at is set on insert
+        await Order.filter(id=order.id).update(created_at=created_at)
+        duration = 600 * (index + 1)
+        await OrderStatusHistory.create(order=order, status=1, timestamp=created_at)
+        await OrderStatusHistory.create(order=order, status=2, timestamp=created_at + timedelta(seconds=duration))
+
+    status_rows, order_rows = await _hourly_metric_rows(connections.get("default"), start, start + timedelta(days=1))
+    assert [(row["hour"], row["status"], row["count"], row["total_duration"]) for row in status_rows] == [
+        (1, 1, 2, 1800),
+        (1, 2, 1, 0),
+        (2, 2, 1, 0),
+    ]
+    assert len(order_rows) == 24
+    assert [(row["hour"], row["throughput"]) for row in order_rows if row["throughput"]] == [(1, 2)]
+
+    # a status lasts until the order's next transition, also when that falls after the range
+    status_rows, _ = await _hourly_metric_rows(
+        connections.get("default"), start + timedelta(hours=1), start + timedelta(hours=2)
+    )
+    assert [(row["status"], row["count"], row["total_duration"]) for row in status_rows] == [(1, 2, 1800), (2, 1, 0)]
+
+
+@pytest.mark.asyncio
+async def test_upsert_many_inserts_and_overwrites() -> None:
+    connection = connections.get("default")
+    first_order_at = datetime(2026, 10, 1, 12, tzinfo=timezone.utc)
+    rows = [
+        {
+            "customer_id": customer_id,
+            "order_count": 1,
+            "first_order_at": first_order_at,
+            "last_order_at": first_order_at,
+            "avg_order_frequency_days": None
+        }
+        for customer_id in range(1, 4)
+    ]
+    conflict, updated = ("customer_id",), ("order_count", "last_order_at", "avg_order_frequency_days")
+    await upsert_many(connection, CustomerLifetimeMetric, rows, on_conflict=conflict, on_conflict_update=updated)
+    last_order_at = first_order_at + timedelta(days=4)
+    await upsert_many(connection, CustomerLifetimeMetric, [
+        {**rows[0], "order_count": 3, "last_order_at": last_order_at, "avg_order_frequency_days": 2},
+        {**rows[0], "customer_id": 4},
+    ], on_conflict=conflict, on_conflict_update=updated)
+
+    metrics = await CustomerLifetimeMetric.all().order_by("customer_id")
+    assert [(metric.customer_id, metric.order_count) for metric in metrics] == [(1, 3), (2, 1), (3, 1), (4, 1)]
+    assert metrics[0].first_order_at == first_order_at
+    assert metrics[0].last_order_at == last_order_at
+    assert metrics[0].avg_order_frequency_days == 2
+
+
+@pytest.mark.asyncio
+async def test_customer_metrics_recompute_changed_customers(monkeypatch: pytest.MonkeyPatch) -> None:
+    job_statuses: dict[str, dict] = {}
+
+    async def set_job_status(job_name: str, status_data: dict) -> None:
+        job_statuses[job_name] = status_data
+
+    async def get_job_status(job_name: str) -> dict | None:
+        return job_statuses.get(job_name)
+
+    monkeypatch.setattr(tasks, "set_job_status", set_job_status)
+    monkeypatch.setattr(tasks, "get_job_status", get_job_status)
+    monkeypatch.setattr(settings, "customer_metrics_batch_size", 1)
+
+    address = await Address.create(city="Test City", street="Test St", postal_code="12345")
+    customers = [await Customer.create(name="Test Customer", phone=f"12345678{index}") for index in range(3)]
+    first_order_at = datetime(2026, 10, 1, tzinfo=timezone.utc)
+
+    async def create_order(customer: Customer, created_at: datetime) -> None:
+        order = await Order.create(
+            account_id="acct123",
+            brand_id="brand123",
+            channel_order_id=f"test{await Order.all().count()}",
+            customer=customer,
+            address=address,
+            pickup_time=created_at
+        )
+        await Order.filter(id=order.id).update(created_at=created_at)
+
+    for customer in customers[:2]:
+        await create_order(customer, first_order_at)
+    await create_order(customers[0], first_order_at + timedelta(days=4))
+
+    # without a watermark every customer with orders is computed
+    assert await _update_changed_customer_metrics() == "Updated metrics for 2 customers"
+    metrics = await CustomerLifetimeMetric.all().order_by("customer_id")
+    assert [(metric.order_count, metric.avg_order_frequency_days) for metric in metrics] == [(2, 4), (1, None)]
+
+    # only customers with orders since the watermark are recomputed
+    job_statuses["customer_metrics"]["watermark"] = (first_order_at + timedelta(days=10)).isoformat()
+    await create_order(customers[1], first_order_at + timedelta(days=12))
+    await create_order(customers[2], first_order_at + timedelta(days=13))
+    await CustomerLifetimeMetric.filter(customer_id=customers[0].id).update(order_count=0)
+    assert await _update_changed_customer_metrics() == "Updated metrics for 2 customers"
+    metrics = await CustomerLifetimeMetric.all().order_by("customer_id")
+    assert [(metric.order_count, metric.avg_order_frequency_days) for metric in metrics] == [(0, 4), (2, 12), (1, None)]
+    assert job_statuses["customer_metrics"]["status"] == "completed"
+
+    # archived orders still count
+    await create_order(customers[1], first_order_at + timedelta(days=14))
+    archived = await Order.filter(customer_id=customers[1].id).order_by("created_at").first()
+    assert archived is not None
+    await ArchivedOrder.create(
+        order_id=archived.id,
+        path="archived.ndjson.gz",
+        byte_offset=0,
+        byte_length=1,
+        customer_id=customers[1].id,
+        created_at=archived.created_at
+    )
+    await archived.delete()
+    job_statuses["customer_metrics"]["watermark"] = (first_order_at + timedelta(days=14)).isoformat()
+    assert await _update_changed_customer_metrics() == "Updated metrics for 1 customers"
+    metric = await CustomerLifetimeMetric.get(customer_id=customers[1].id)
+    assert (metric.order_count, metric.first_order_at, metric.avg_order_frequency_days) == (3, first_order_at, 7)
+
+    # so do customers whose orders are all archived, and an archived order created since the watermark
+    archived = await Order.get(customer_id=customers[2].id)
+    archived_orders = [(archived.id, archived.created_at), (archived.id + 1000, first_order_at + timedelta(days=20))]
+    for order_id, created_at in archived_orders:
+        await ArchivedOrder.create(
+            order_id=order_id,
+            path="archived.ndjson.gz",
+            byte_offset=0,
+            byte_length=1,
+            customer_id=customers[2].id,
+            created_at=created_at
+        )
+    await archived.delete()
+    job_statuses["customer_metrics"]["watermark"] = (first_order_at + timedelta(days=18)).isoformat()
+    assert await _update_changed_customer_metrics() == "Updated metrics for 1 customers"
+    metric = await CustomerLifetimeMetric.get(customer_id=customers[2].id)
+    assert (metric.order_count, metric.last_order_at, metric.avg_order_frequency_days) == (
+        2, first_order_at + timedelta(days=20), 7
+    )
+
+    await CustomerLifetimeMetric.all().delete()
+    assert await _process_customer_batch(
+        await Customer.filter(id=customers[2].id).prefetch_related("orders")
+    ) == 1
+    assert (await CustomerLifetimeMetric.get(customer_id=customers[2].id)).order_count == 2
+
+
+@pytest.mark.asyncio
+async def test_metrics_read_from_rollups(client: AsyncClient) -> None:
+    connection = connections.get("default")
+    # a Monday, the Tuesday and Thursday of the same week, then the next Monday
+    days = [date(2026, 9, 28), date(2026, 9, 29), date(2026, 10, 1), date(2026, 10, 5)]
+    for day in days:
+        await HourlyStatusMetric.create(date=day, hour=10, status=1, count=2, total_duration=120, avg_duration=60)
+        await HourlyOrderMetric.create(date=day, hour=10, throughput=2)
+    await refresh_metric_rollups(connection, days[0], days[-1])
+
+    # weeks the range covers only partly count its days only
+    response = await client.get("/api/v1/analytics/status-metrics", params={
+        "from_date": "2026-09-29", "to_date": "2026-10-05", "granularity": "week"
+    })
+    assert [
+        (metric["date"], metric["hour"], metric["granularity"], metric["count"], metric["average_duration"])
+        for metric in response.json()
+    ] == [("2026-09-28", None, "week", 4, 60), ("2026-10-05", None, "week", 2, 60)]
+
+    # rewriting an hour refreshes the periods containing it
+    await HourlyOrderMetric.filter(date=days[1]).update(throughput=5)
+    await refresh_metric_rollups(connection, days[1], days[1])
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-09-01", "to_date": "2026-11-30", "granularity": "week"
+    })
+    assert [(metric["date"], metric["granularity"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-28", "week", 9), ("2026-10-05", "week", 2)
+    ]
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-01-01", "to_date": "2027-12-31", "granularity": "month"
+    })
+    assert [(metric["date"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-01", 7), ("2026-10-01", 4)
+    ]
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-09-29", "to_date": "2026-10-01", "granularity": "month"
+    })
+    assert [(metric["date"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-01", 5), ("2026-10-01", 2)
+    ]
+
+    # without a granularity the range length picks the table, and the rows say which one they came from
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-09-29", "to_date": "2026-10-05"
+    })
+    assert [(metric["date"], metric["granularity"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-29", "day", 5), ("2026-10-01", "day", 2), ("2026-10-05", "day", 2)
+    ]
+    await OrderMetricRollup.filter(granularity="week", period_start=days[0]).update(throughput=42)
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-01-01", "to_date": "2026-12-31"
+    })
+    assert [(metric["date"], metric["granularity"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-28", "week", 42), ("2026-10-05", "week", 2)
+    ]
+    await refresh_metric_rollups(connection, days[0], days[0])
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-01-01", "to_date": "2026-12-31", "hour": 10
+    })
+    assert [(metric["date"], metric["hour"], metric["throughput"]) for metric in response.json()] == [
+        ("2026-09-28", 10, 2), ("2026-09-29", 10, 5), ("2026-10-01", 10, 2), ("2026-10-05", 10, 2)
+    ]
+
+    response = await client.get("/api/v1/analytics/order-metrics", params={
+        "from_date": "2026-09-29", "to_date": "2026-10-05", "hour": 10, "granularity": "day"
+    })
+    assert response.status_code == 400
+
+    # periods whose hourly rows are gone lose their rollups
+    await HourlyOrderMetric.filter(date=days[3]).delete()
+    await refresh_metric_rollups(connection, days[3], days[3])
+    assert not await OrderMetricRollup.filter(period_start=days[3]).exists()
+    assert (await OrderMetricRollup.get(granularity="month", period_start=date(2026, 10, 1))).throughput == 2
+
+
+@pytest.mark.asyncio
+async def test_analytics_cache_coalesces_identical_reads(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "analytics_cache_enabled", True)
+    loads = 0
+
+    async def load() -> list[dict]:
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return [{"date": "2026-10-18", "hour": 9, "throughput": 2}]
+
+    cache = AnalyticsCache()
+    day = date(2026, 10, 18)
+    await cache.invalidate([day])
+    first, second = await asyncio.gather(
+        cache.get_or_load("order_metrics", "hour", day, day, None, None, load),
+        AnalyticsCache().get_or_load("order_metrics", "hour", day, day, None, None, load),
+    )
+    assert loads == 1
+    assert first == second
+    # callers get their own rows to merge pending counters into
+    assert first is not second and first[0] is not second[0]
+    # later reads are served from the cache
+    assert await cache.get_or_load("order_metrics", "hour", day, day, None, None, load) == first
+    assert loads == 1
+
+    # a response loaded across an invalidation is not cached
+    async def load_during_invalidation() -> list[dict]:
+        nonlocal loads
+        loads += 1
+        await cache.invalidate([day])
+        return [{"date": "2026-10-18", "hour": 9, "throughput": 2}]
+
+    await cache.get_or_load("order_metrics", "hour", day, day, 9, None, load_during_invalidation)
+    await cache.get_or_load("order_metrics", "hour", day, day, 9, None, load_during_invalidation)
+    assert loads == 3
+    await cache.invalidate([day])
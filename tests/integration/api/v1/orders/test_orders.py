@@ -1,9 +1,36 @@
+import asyncio
+import csv
+import io
+import json
+import logging
+import pathlib
 from collections.abc import AsyncGenerator
+from datetime import date, datetime
 
 import pytest
-from app.domains.orders.models import Address, Customer, Order, OrderItem, OrderStatusHistory
+from app.api.v1.orders.schemas import Order as OrderSchema
+from app.api.v1.orders.schemas import OrderCreate
+from app.core.cache import redis_client
+from app.core.config import settings
+from app.core.database import is_postgres
+from app.domains.orders.archive import OrderArchive
+from app.domains.orders.cache import OrderCache, address_lookup, customer_lookup
+from app.domains.orders.events import OrderEventBroker, order_status_event
+from app.domains.orders.models import (
+    Address,
+    ArchivedOrder,
+    Customer,
+    Order,
+    OrderItem,
+    OrderOutboxEvent,
+    OrderStatusHistory,
+)
+from app.domains.orders.repository import OrderRepository, status_history_durations
+from app.domains.orders.tasks import expired_status_history_partitions
+from app.domains.orders.worker import OrderIngestionWorker
 from httpx import AsyncClient
 from pytest_asyncio import fixture as async_fixture
+from tortoise import connections
 
 
 @async_fixture
@@ -29,6 +56,51 @@ async def cleanup_db() -> AsyncGenerator[None, None]:
     await Order.all().delete()
     await OrderItem.all().delete()
     await OrderStatusHistory.all().delete()
+    await ArchivedOrder.all().delete()
+    await OrderOutboxEvent.all().delete()
+    # ids are reused by the in-memory database, so cached lookups must not outlive a test
+    customer_lookup.clear()
+    address_lookup.clear()
+
+@async_fixture
+async def order_cache(monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[OrderCache, None]:
+    """The Redis order cache, enabled for one test and emptied around it since order ids are reused"""
+
+    async def clear() -> None:
+        keys = [key async for key in redis_client.scan_iter("order:*")]
+        keys += [key async for key in redis_client.scan_iter("order_version:*")]
+        if keys:
+            await redis_client.delete(*keys)
+
+    monkeypatch.setattr(settings, "order_cache_enabled", True)
+    await clear()
+    yield OrderCache()
+    await clear()
+
+@async_fixture
+async def ingestion_worker(monkeypatch: pytest.MonkeyPatch) -> AsyncGenerator[OrderIngestionWorker, None]:
+    """
+    Asynchronous ingestion on streams of its own. Entries are claimed again as soon as they are pending
+    and written one by one on their second delivery.
+    """
+
+    async def clear() -> None:
+        keys = [key async for key in redis_client.scan_iter("order_ingestion:*")]
+        await redis_client.delete(
+            settings.order_ingestion_stream, settings.order_ingestion_dead_letter_stream, *keys
+        )
+
+    monkeypatch.setattr(settings, "order_ingestion_mode", "async")
+    monkeypatch.setattr(settings, "order_ingestion_stream", "test_order_ingestion")
+    monkeypatch.setattr(settings, "order_ingestion_dead_letter_stream", "test_order_ingestion_dead_letter")
+    monkeypatch.setattr(settings, "order_ingestion_claim_idle_ms", 0)
+    monkeypatch.setattr(settings, "order_ingestion_block_ms", 10)
+    monkeypatch.setattr(settings, "order_ingestion_max_deliveries", 2)
+    await clear()
+    worker = OrderIngestionWorker("test-worker")
+    await worker.ensure_group()
+    yield worker
+    await clear()
 
 @pytest.mark.asyncio
 async def test_endpoint(client: AsyncClient) -> None:
@@ -65,6 +137,58 @@ async def test_create_order(client: AsyncClient, customer: Customer, address: Ad
     assert len(data["items"]) == 1
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("item_count", [1, 25])
+async def test_create_order_query_count_is_constant(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        caplog: pytest.LogCaptureFixture,
+        item_count: int,
+) -> None:
+    order_data = {
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": f"Item {i}", "plu": f"PLU{i}", "quantity": 1} for i in range(item_count)]
+    }
+
+    with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+        response = await client.post("/api/v1/orders/", json=order_data)
+
+    assert response.status_code == 201
+    data = response.json()
+    assert len(data["items"]) == item_count
+    assert all(item["id"] and item["order_id"] == data["id"] for item in data["items"])
+    assert data["status_history"][0]["status"] == 1
+    assert data["created_at"]
+
+    # customer/address lookup + one insert each for orders, items and status history
+    queries = [record for record in caplog.records if record.name == "tortoise.db_client"]
+    assert len(queries) == 4
+
+
+@pytest.mark.asyncio
+async def test_create_order_unknown_customer(client: AsyncClient, address: Address) -> None:
+    order_data = {
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": 999,
+        "address_id": address.id,
+        "items": []
+    }
+
+    response = await client.post("/api/v1/orders/", json=order_data)
+
+    assert response.status_code == 400
+    assert await Order.all().count() == 0
+
+
 @pytest.mark.asyncio
 async def test_get_order(client: AsyncClient, customer: Customer, address: Address) -> None:
     order = await Order.create(
@@ -104,3 +228,852 @@ async def test_update_order_status(client: AsyncClient, customer: Customer, addr
     status_history = await order.status_history.all()
     assert len(status_history) == 1
     assert status_history[0].status == 2
+
+
+
+@pytest.mark.asyncio
+async def test_update_order_status_tracks_current_status(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address
+) -> None:
+    order = await Order.create(
+        channel_order_id="test123",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address
+    )
+    await OrderStatusHistory.create(order=order, status=1)
+
+    for status in (2, 3, 4):
+        response = await client.put(f"/api/v1/orders/{order.id}/status", json={"status": status})
+        assert response.status_code == 201
+
+    await order.refresh_from_db()
+    assert order.current_status == 4
+
+    history = await order.status_history.all().order_by("timestamp")
+    assert [entry.status for entry in history] == [1, 2, 3, 4]
+    durations = status_history_durations(history)
+    assert all(durations[entry.id] is not None for entry in history[:-1])
+    assert durations[history[-1].id] is None
+
+    response = await client.get(f"/api/v1/orders/{order.id}")
+    assert response.json()["status"] == 4
+
+
+@pytest.mark.asyncio
+async def test_update_order_status_rejects_invalid_transition(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address
+) -> None:
+    order = await Order.create(
+        channel_order_id="test123",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address,
+        current_status=4
+    )
+
+    response = await client.put(f"/api/v1/orders/{order.id}/status", json={"status": 2})
+
+    assert response.status_code == 400
+    assert await order.status_history.all().count() == 0
+    await order.refresh_from_db()
+    assert order.current_status == 4
+
+
+@pytest.mark.asyncio
+async def test_update_order_status_unknown_order(client: AsyncClient) -> None:
+    response = await client.put("/api/v1/orders/999/status", json={"status": 2})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_create_orders_batch(client: AsyncClient, customer: Customer, address: Address) -> None:
+    valid_order = {
+        "channel_order_id": "batch1",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [
+            {"name": "Item 1", "plu": "PLU123", "quantity": 2},
+            {"name": "Item 2", "plu": "PLU456", "quantity": 1}
+        ]
+    }
+    batch = {
+        "orders": [
+            valid_order,
+            {**valid_order, "channel_order_id": "batch2", "items": []},
+            {**valid_order, "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 0}]},
+            {**valid_order, "customer_id": customer.id + 1000},
+            # bounded by the column sizes, Postgres would reject the whole multi-row insert
+            {**valid_order, "channel_order_id": "batch3", "items": [{"name": "I", "plu": "P" * 51, "quantity": 1}]},
+            {**valid_order, "channel_order_id": "batch4", "items": [{"name": "I", "plu": "P", "quantity": 2**31}]},
+        ]
+    }
+
+    response = await client.post("/api/v1/orders/batch", json=batch)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4, 5]
+    assert results[0]["error"] is None
+    assert results[0]["order"]["channel_order_id"] == "batch1"
+    assert len(results[0]["order"]["items"]) == 2
+    assert results[0]["order"]["status"] == 1
+    assert results[1]["order"]["channel_order_id"] == "batch2"
+    assert results[2]["order"] is None
+    assert "quantity" in results[2]["error"]
+    assert results[3]["order"] is None
+    assert "Customer" in results[3]["error"]
+    assert results[4]["order"] is None
+    assert "plu" in results[4]["error"]
+    assert results[5]["order"] is None
+    assert "quantity" in results[5]["error"]
+    assert await Order.all().count() == 2
+    assert await OrderStatusHistory.all().count() == 2
+
+
+@pytest.mark.asyncio
+async def test_create_orders_batch_rejects_empty_batch(client: AsyncClient) -> None:
+    response = await client.post("/api/v1/orders/batch", json={"orders": []})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_update_order_statuses_bulk(client: AsyncClient, customer: Customer, address: Address) -> None:
+    orders = [
+        await Order.create(
+            channel_order_id=f"test{index}",
+            account_id="acct123",
+            brand_id="brand123",
+            pickup_time="2023-10-01T12:00:00",
+            customer=customer,
+            address=address,
+            current_status=current_status
+        )
+        for index, current_status in enumerate((1, 2, 4))
+    ]
+
+    response = await client.put("/api/v1/orders/status", json={"updates": [
+        {"order_id": orders[0].id, "status": 2},
+        {"order_id": orders[1].id, "status": 3},
+        {"order_id": orders[2].id, "status": 2},
+        {"order_id": 999, "status": 2},
+        {"order_id": orders[0].id, "status": 3},
+    ]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["order_id"] for result in results] == [orders[0].id, orders[1].id, orders[2].id, 999, orders[0].id]
+    assert results[0]["status"]["status"] == 2
+    assert results[1]["status"]["status"] == 3
+    assert results[2]["status"] is None and "Invalid status transition" in results[2]["error"]
+    assert "not found" in results[3]["error"]
+    assert "Duplicate" in results[4]["error"]
+    assert [order.current_status for order in await Order.all().order_by("id")] == [2, 3, 4]
+    assert await OrderStatusHistory.all().count() == 2
+
+
+@pytest.mark.asyncio
+async def test_list_orders_keyset_pagination(client: AsyncClient, customer: Customer, address: Address) -> None:
+    orders = [
+        await Order.create(
+            channel_order_id=f"test{index}",
+            account_id="acct123" if index % 2 == 0 else "acct456",
+            brand_id="brand123",
+            pickup_time="2023-10-01T12:00:00",
+            customer=customer,
+            address=address
+        )
+        for index in range(5)
+    ]
+
+    seen: list[int] = []
+    cursor = None
+    while True:
+        params: dict[str, str | int] = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/api/v1/orders/", params=params)
+        assert response.status_code == 200
+        page = response.json()
+        assert len(page["items"]) <= 2
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == [order.id for order in reversed(orders)]
+
+    response = await client.get("/api/v1/orders/", params={"account_id": "acct456", "status": 1})
+    items = response.json()["items"]
+    assert [item["id"] for item in items] == [orders[3].id, orders[1].id]
+    assert "items" not in items[0]
+
+    response = await client.get("/api/v1/orders/", params={"view": "full", "limit": 1})
+    assert response.json()["items"][0]["customer"]["name"] == customer.name
+
+    response = await client.get("/api/v1/orders/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_export_orders(client: AsyncClient, customer: Customer, address: Address) -> None:
+    for index in range(3):
+        order = await Order.create(
+            channel_order_id=f"test{index}",
+            account_id="acct123",
+            brand_id="brand123",
+            pickup_time="2023-10-01T12:00:00",
+            customer=customer,
+            address=address
+        )
+        await OrderItem.create(order=order, name="Item 1", plu="PLU123", quantity=index + 1)
+
+    response = await client.get("/api/v1/orders/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["channel_order_id"] for line in lines] == ["test0", "test1", "test2"]
+    assert [line["items"][0]["quantity"] for line in lines] == [1, 2, 3]
+
+    response = await client.get("/api/v1/orders/export", params={"format": "csv", "brand_id": "brand123"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert [row["channel_order_id"] for row in rows] == ["test0", "test1", "test2"]
+    assert json.loads(rows[2]["items"])[0]["quantity"] == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_get_orders(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        caplog: pytest.LogCaptureFixture
+) -> None:
+    orders = []
+    for index in range(3):
+        order = await Order.create(
+            channel_order_id=f"test{index}",
+            account_id="acct123",
+            brand_id="brand123",
+            pickup_time="2023-10-01T12:00:00",
+            customer=customer,
+            address=address
+        )
+        await OrderItem.create(order=order, name="Item 1", plu="PLU123", quantity=1)
+        await OrderStatusHistory.create(order=order, status=1)
+        orders.append(order)
+
+    ids = [orders[2].id, 999, orders[0].id, orders[1].id]
+    with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+        response = await client.post("/api/v1/orders:batchGet", json={"ids": ids})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["id"] for result in results] == ids
+    assert [result["found"] for result in results] == [True, False, True, True]
+    assert results[1]["order"] is None
+    assert results[0]["order"]["channel_order_id"] == "test2"
+    assert len(results[3]["order"]["items"]) == 1
+
+    # orders joined to customer/address, then items and status history
+    queries = [record for record in caplog.records if record.name == "tortoise.db_client"]
+    assert len(queries) == 3
+
+
+@pytest.mark.asyncio
+async def test_get_order_fields_projection(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        caplog: pytest.LogCaptureFixture
+) -> None:
+    order = await Order.create(
+        channel_order_id="test123",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address,
+        current_status=2
+    )
+    await OrderItem.create(order=order, name="Item 1", plu="PLU123", quantity=1)
+
+    with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+        response = await client.get(f"/api/v1/orders/{order.id}", params={"fields": "id,status,pickup_time"})
+
+    assert response.status_code == 200
+    assert response.json() == {"id": order.id, "status": 2, "pickup_time": "2023-10-01T12:00:00Z"}
+    queries = [record for record in caplog.records if record.name == "tortoise.db_client"]
+    assert len(queries) == 1
+    assert "order_items" not in queries[0].getMessage()
+
+    response = await client.get(f"/api/v1/orders/{order.id}", params={"fields": "id,customer,items"})
+    data = response.json()
+    assert set(data) == {"id", "customer", "items"}
+    assert data["customer"]["name"] == customer.name
+    assert len(data["items"]) == 1
+
+    response = await client.get(f"/api/v1/orders/{order.id}", params={"fields": "id,unknown"})
+    assert response.status_code == 400
+
+    response = await client.get("/api/v1/orders/999", params={"fields": "id"})
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_order_hydrates_items_and_history(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        caplog: pytest.LogCaptureFixture
+) -> None:
+    order = await Order.create(
+        channel_order_id="test123",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address,
+        current_status=2
+    )
+    await OrderItem.create(order=order, name="Item 1", plu="PLU123", quantity=1)
+    await OrderItem.create(order=order, name="Item 2", plu="PLU456", quantity=3)
+    await OrderStatusHistory.create(order=order, status=1, timestamp="2023-10-01T11:00:00")
+    await OrderStatusHistory.create(order=order, status=2, timestamp="2023-10-01T11:10:00")
+
+    with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+        response = await client.get(f"/api/v1/orders/{order.id}")
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["customer"] == {"name": "Test Customer", "phoneNumber": "1234567890"}
+    assert data["delivery_address"] == {"city": "Test City", "street": "Test St", "postalCode": "12345"}
+    assert data["pickup_time"] == "2023-10-01T12:00:00Z"
+    assert data["status"] == 2
+    assert [(item["plu"], item["quantity"]) for item in data["items"]] == [("PLU123", 1), ("PLU456", 3)]
+    assert [
+        (status["status"], status["timestamp"], status["duration"]) for status in data["status_history"]
+    ] == [(1, "2023-10-01T11:00:00Z", 600), (2, "2023-10-01T11:10:00Z", None)]
+    # Postgres aggregates the order into a single JSON row, the ORM needs a query per relation
+    queries = [record for record in caplog.records if record.name == "tortoise.db_client"]
+    assert len(queries) == (1 if is_postgres(connections.get("default")) else 3)
+
+
+@pytest.mark.asyncio
+async def test_order_events_disabled(client: AsyncClient) -> None:
+    response = await client.get("/api/v1/orders/events")
+    assert response.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_order_event_broker_filters_subscribers() -> None:
+    broker = OrderEventBroker()
+    filters = [(None, None), ("acct123", None), (None, "brand456"), ("acct123", "brand123"), ("acct456", None)]
+    queues = [broker.subscribe(account_id, brand_id) for account_id, brand_id in filters]
+
+    event = order_status_event(1, "acct123", "brand123", 2, datetime(2023, 10, 1, 12, 0, 0))
+    broker.dispatch(json.dumps(event))
+    broker.dispatch("not json")
+
+    assert [queue.qsize() for queue in queues] == [1, 1, 0, 1, 0]
+    assert json.loads(queues[0].get_nowait()) == {
+        "order_id": 1,
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "status": 2,
+        "timestamp": "2023-10-01T12:00:00",
+    }
+
+    for queue, (account_id, brand_id) in zip(queues, filters, strict=True):
+        broker.unsubscribe(queue, account_id, brand_id)
+    assert broker._listener is None
+
+
+class FlakyPubSub:
+    """Stands in for a Redis pub/sub connection whose first subscription dies with an unexpected error"""
+
+    connections = 0
+
+    def __init__(self, **kwargs: object) -> None:
+        FlakyPubSub.connections += 1
+        self.connection = FlakyPubSub.connections
+
+    async def subscribe(self, channel: str) -> None:
+        pass
+
+    async def listen(self) -> AsyncGenerator[dict[str, str]]:
+        if self.connection == 1:
+            raise RuntimeError("connection reset")
+        yield {"type": "message", "data": json.dumps(order_status_event(1, "acct123", "brand123", 2, datetime.now()))}
+
+    async def aclose(self) -> None:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_order_event_listener_reconnects_after_unexpected_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr("app.domains.orders.events.redis_client.pubsub", FlakyPubSub)
+    monkeypatch.setattr(settings, "order_events_reconnect_delay", 0)
+    broker = OrderEventBroker()
+    queue = broker.subscribe()
+    try:
+        assert json.loads(await asyncio.wait_for(queue.get(), timeout=5))["order_id"] == 1
+        assert FlakyPubSub.connections >= 2
+    finally:
+        broker.unsubscribe(queue)
+
+
+@pytest.mark.asyncio
+async def test_create_orders_records_ingestion_ids(customer: Customer, address: Address) -> None:
+    repository = OrderRepository()
+    order = OrderCreate(
+        channel_order_id="ingest1",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time=datetime(2023, 10, 1, 12, 0, 0),
+        customer_id=customer.id,
+        address_id=address.id,
+        items=[],
+    )
+
+    results = await repository.create_orders(
+        [order, order.model_copy(update={"customer_id": customer.id + 1000})],
+        ["tracking-1", "tracking-2"]
+    )
+
+    assert isinstance(results[1], ValueError)
+    assert await repository.get_ingested_order_ids(["tracking-1", "tracking-2"]) == {"tracking-1": results[0].id}
+
+
+@pytest.mark.asyncio
+async def test_create_orders_match_inserted_rows_to_their_orders(customer: Customer, address: Address) -> None:
+    orders = [OrderCreate(
+        channel_order_id=f"batch{index}",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time=datetime(2023, 10, 1, 12, 0, 0),
+        customer_id=customer.id,
+        address_id=address.id,
+        items=[
+            {"name": f"Item {index}-{position}", "plu": f"PLU{position}", "quantity": position + 1}
+            for position in range(3)
+        ] + [{"name": "Extra", "plu": "PLU9", "quantity": 1}] * 2,
+    ) for index in range(3)]
+
+    results = await OrderRepository().create_orders(orders)
+
+    for result in results:
+        assert isinstance(result, OrderSchema)
+        stored_items = await OrderItem.filter(order_id=result.id).values("id", "name", "plu", "quantity")
+        assert sorted(
+            (item.id, item.name, item.plu, item.quantity) for item in result.items
+        ) == sorted((item["id"], item["name"], item["plu"], item["quantity"]) for item in stored_items)
+        stored_status = await OrderStatusHistory.get(order_id=result.id)
+        assert [status.id for status in result.status_history] == [stored_status.id]
+
+
+@pytest.mark.asyncio
+async def test_create_order_is_idempotent_per_channel_order(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address
+) -> None:
+    order_data = {
+        "channel_order_id": "retry1",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 2}]
+    }
+
+    created = await client.post("/api/v1/orders/", json=order_data)
+    retried = await client.post("/api/v1/orders/", json={**order_data, "items": []})
+
+    assert created.status_code == 201
+    assert retried.status_code == 200
+    assert retried.json() == created.json()
+
+    response = await client.post("/api/v1/orders/batch", json={"orders": [
+        order_data,
+        {**order_data, "channel_order_id": "retry2"},
+        {**order_data, "channel_order_id": "retry2"},
+        {**order_data, "account_id": "acct456"},
+    ]})
+
+    results = response.json()["results"]
+    assert [result["duplicate"] for result in results] == [True, False, True, False]
+    assert results[0]["order"]["id"] == created.json()["id"]
+    assert results[2]["order"]["id"] == results[1]["order"]["id"]
+    assert await Order.all().count() == 3
+    assert await OrderItem.all().count() == 3
+
+
+@pytest.mark.asyncio
+async def test_create_order_upserts_embedded_customer_and_address(
+        client: AsyncClient,
+        customer: Customer,
+        caplog: pytest.LogCaptureFixture
+) -> None:
+    order_data = {
+        "channel_order_id": "embedded1",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer": {"name": "Renamed Customer", "phoneNumber": customer.phone},
+        "delivery_address": {"city": "Helsinki", "street": "Huuvatie 1", "postalCode": "00100"},
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 1}]
+    }
+
+    first = await client.post("/api/v1/orders/", json=order_data)
+    with caplog.at_level(logging.DEBUG, logger="tortoise.db_client"):
+        second = await client.post("/api/v1/orders/", json={
+            **order_data,
+            "channel_order_id": "embedded2",
+            "delivery_address": {"city": " helsinki", "street": "Huuvatie  1 ", "postalCode": "00100"},
+        })
+
+    assert first.status_code == 201
+    assert second.status_code == 201
+    assert first.json()["customer"] == {"name": customer.name, "phoneNumber": customer.phone}
+    assert second.json()["customer"] == first.json()["customer"]
+    assert second.json()["delivery_address"] == first.json()["delivery_address"]
+    assert await Customer.all().count() == 1
+    assert await Address.all().count() == 1
+    # orders, items and status history only: repeat customers and addresses come from the lookup cache
+    queries = [record for record in caplog.records if record.name == "tortoise.db_client"]
+    assert len(queries) == 3
+
+    response = await client.post("/api/v1/orders/", json={
+        **order_data, "channel_order_id": "embedded3", "customer": None
+    })
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_status_history_read_from_timeline(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "order_status_timeline_reads", True)
+    response = await client.post("/api/v1/orders/", json={
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 1}]
+    })
+    created = response.json()
+    history = await OrderStatusHistory.filter(order_id=created["id"]).order_by("id").values_list("id", flat=True)
+    assert created["status_history"][0]["id"] == history[0]
+
+    response = await client.put(f"/api/v1/orders/{created['id']}/status", json={"status": 2})
+    assert response.status_code == 201
+    transition = response.json()
+    assert transition["id"] == (await OrderStatusHistory.get(order_id=created["id"], status=2)).id
+
+    order = await Order.get(id=created["id"])
+    assert order.status_timeline == "1:0,2:0"
+
+    response = await client.get(f"/api/v1/orders/{created['id']}")
+    data = response.json()
+    # the timeline keeps no history row ids
+    assert data["status_history"] == [
+        {"id": None, "order_id": created["id"], "status": 1, "timestamp": created["created_at"], "duration": None},
+        {**transition, "id": None, "duration": None},
+    ]
+
+    response = await client.get(f"/api/v1/orders/{created['id']}", params={"fields": "id,status_history"})
+    assert response.json()["status_history"] == data["status_history"]
+
+
+@pytest.mark.asyncio
+async def test_archived_order_is_served_from_archive(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        monkeypatch: pytest.MonkeyPatch,
+        tmp_path: pathlib.Path
+) -> None:
+    monkeypatch.setattr(settings, "order_archive_enabled", True)
+    monkeypatch.setattr(settings, "order_archive_path", str(tmp_path))
+    orders = [await Order.create(
+        channel_order_id=f"test{index}",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address,
+        current_status=status
+    ) for index, status in enumerate([4, 5, 4])]
+    for order in orders:
+        await OrderItem.create(order=order, name="Item 1", plu="PLU123", quantity=1)
+        await OrderStatusHistory.create(order=order, status=order.current_status)
+    await Order.filter(id__in=[orders[0].id, orders[1].id]).update(created_at=datetime(2023, 10, 1))
+
+    repository = OrderRepository()
+    expected = (await client.get(f"/api/v1/orders/{orders[1].id}")).json()
+    order_ids = await repository.get_closed_order_ids(datetime(2024, 1, 1), 10)
+    assert order_ids == [orders[0].id, orders[1].id]
+
+    archived = await repository.get_orders(order_ids)
+    await repository.delete_archived_orders(OrderArchive.write(list(archived.values())))
+    assert await Order.filter(id__in=order_ids).count() == 0
+    assert await OrderItem.filter(order_id__in=order_ids).count() == 0
+    assert [path.name for path in tmp_path.iterdir()] == ["created_date=2023-10-01"]
+
+    response = await client.get(f"/api/v1/orders/{orders[1].id}")
+    assert response.status_code == 200
+    assert response.json() == expected
+
+    response = await client.get(f"/api/v1/orders/{orders[0].id}", params={"fields": "id,status"})
+    assert response.json() == {"id": orders[0].id, "status": 4}
+
+    monkeypatch.setattr(settings, "order_archive_enabled", False)
+    response = await client.get(f"/api/v1/orders/{orders[1].id}")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_expired_status_history_partitions_keep_live_orders(customer: Customer, address: Address) -> None:
+    connection = connections.get("default")
+    live = await Order.create(
+        channel_order_id="test1",
+        account_id="acct123",
+        brand_id="brand123",
+        pickup_time="2023-10-01T12:00:00",
+        customer=customer,
+        address=address
+    )
+    # stand-ins for two monthly partitions past the retention: one holds history of an order left open,
+    # the other only history of an archived order
+    names = ["order_status_history_p202301", "order_status_history_p202302"]
+    for name in names:
+        await connection.execute_script(f'CREATE TABLE "{name}" AS SELECT * FROM "order_status_history" WHERE 1 = 0')
+    try:
+        await connection.execute_script(
+            f'INSERT INTO "{names[0]}" ("id", "status", "timestamp", "order_id") '
+            f"VALUES (1, 1, '2023-01-10 12:00:00', {live.id})"
+        )
+        await connection.execute_script(
+            f'INSERT INTO "{names[1]}" ("id", "status", "timestamp", "order_id") '
+            f"VALUES (2, 4, '2023-02-10 12:00:00', {live.id + 1000})"
+        )
+
+        existing = [*names, "order_status_history_p202612", "order_status_history_default"]
+        assert await expired_status_history_partitions(connection, existing, date(2026, 1, 1)) == [names[1]]
+    finally:
+        for name in names:
+            await connection.execute_script(f'DROP TABLE "{name}"')
+
+
+@pytest.mark.asyncio
+async def test_order_writes_append_outbox_events(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(settings, "order_outbox_enabled", True)
+    response = await client.post("/api/v1/orders/", json={
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": []
+    })
+    created = response.json()
+    await client.put(f"/api/v1/orders/{created['id']}/status", json={"status": 2})
+    # disallowed transitions leave no event
+    await client.put(f"/api/v1/orders/{created['id']}/status", json={"status": 1})
+
+    events = await OrderOutboxEvent.all().order_by("id")
+    assert [(event.event_type, event.order_id) for event in events] == [
+        ("order_created", created["id"]),
+        ("status_changed", created["id"]),
+    ]
+    order_created = json.loads(events[0].payload)
+    assert (order_created["account_id"], order_created["brand_id"]) == ("acct123", "brand123")
+    assert datetime.fromisoformat(order_created["created_at"]) == datetime.fromisoformat(created["created_at"])
+    status_changed = json.loads(events[1].payload)
+    assert (status_changed["previous_status"], status_changed["status"]) == (1, 2)
+    assert status_changed["previous_status_since"] == order_created["created_at"]
+
+
+@pytest.mark.asyncio
+async def test_order_cache_serves_reads_until_the_status_changes(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        order_cache: OrderCache
+) -> None:
+    response = await client.post("/api/v1/orders/", json={
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 1}]
+    })
+    order_id = response.json()["id"]
+
+    # created orders are cached, so a change behind the service's back is not seen
+    await Order.filter(id=order_id).update(brand_id="brand456")
+    response = await client.get(f"/api/v1/orders/{order_id}")
+    assert response.json()["brand_id"] == "brand123"
+
+    response = await client.put(f"/api/v1/orders/{order_id}/status", json={"status": 2})
+    assert response.status_code == 201
+    assert not await redis_client.exists(f"order:{order_id}")
+    assert await redis_client.get(f"order_version:{order_id}") == "1"
+
+    response = await client.get(f"/api/v1/orders/{order_id}")
+    data = response.json()
+    assert (data["brand_id"], [status["status"] for status in data["status_history"]]) == ("brand456", [1, 2])
+    cached, _ = await order_cache.get(order_id)
+    assert cached is not None and cached.brand_id == "brand456"
+
+
+@pytest.mark.asyncio
+async def test_order_cache_refuses_reads_that_raced_an_invalidation(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        order_cache: OrderCache
+) -> None:
+    response = await client.post("/api/v1/orders/", json={
+        "channel_order_id": "test123",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 1}]
+    })
+    order = OrderSchema.model_validate(response.json())
+    await redis_client.delete(f"order:{order.id}")
+
+    # a read misses, then a status change lands before the order it loaded is written back
+    cached, version = await order_cache.get(order.id)
+    assert (cached, version) == (None, "")
+    await order_cache.invalidate([order.id])
+    await order_cache.set([order], {order.id: version})
+    assert not await redis_client.exists(f"order:{order.id}")
+
+    # the next read sees the new version and may fill the cache
+    cached, version = await order_cache.get(order.id)
+    assert (cached, version) == (None, "1")
+    await order_cache.set([order], {order.id: version})
+    cached, _ = await order_cache.get(order.id)
+    assert cached == order
+
+
+@pytest.mark.asyncio
+async def test_ingestion_worker_writes_queued_orders_once(
+        client: AsyncClient,
+        customer: Customer,
+        address: Address,
+        ingestion_worker: OrderIngestionWorker
+) -> None:
+    order_data = {
+        "channel_order_id": "queued1",
+        "account_id": "acct123",
+        "brand_id": "brand123",
+        "pickup_time": "2023-10-01T12:00:00",
+        "customer_id": customer.id,
+        "address_id": address.id,
+        "items": [{"name": "Item 1", "plu": "PLU123", "quantity": 1}]
+    }
+    response = await client.post("/api/v1/orders/", json=order_data)
+    assert response.status_code == 202
+    tracking_id = response.json()["tracking_id"]
+    response = await client.get(f"/api/v1/orders/ingest/{tracking_id}")
+    assert (response.status_code, response.json()["status"]) == (200, "pending")
+    assert not await Order.exists()
+
+    messages, deliveries = await ingestion_worker.read_batch()
+    assert ([fields["tracking_id"] for _, fields in messages], deliveries) == ([tracking_id], {})
+    await ingestion_worker.process_batch(messages, deliveries)
+
+    order = await Order.get(ingestion_id=tracking_id)
+    response = await client.get(f"/api/v1/orders/ingest/{tracking_id}")
+    assert response.json() == {"tracking_id": tracking_id, "status": "completed", "order_id": order.id, "error": None}
+    assert await redis_client.xlen(settings.order_ingestion_stream) == 0
+
+    # a redelivered entry resolves to the order its tracking id already wrote
+    message_id = await redis_client.xadd(settings.order_ingestion_stream, messages[0][1])
+    await ingestion_worker.process([(message_id, messages[0][1])])
+    assert await Order.filter(ingestion_id=tracking_id).count() == 1
+    response = await client.get(f"/api/v1/orders/ingest/{tracking_id}")
+    assert (response.json()["status"], response.json()["order_id"]) == ("completed", order.id)
+
+    response = await client.get("/api/v1/orders/ingest/unknown")
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_ingestion_worker_dead_letters_entries_that_keep_failing(
+        customer: Customer,
+        address: Address,
+        ingestion_worker: OrderIngestionWorker,
+        monkeypatch: pytest.MonkeyPatch
+) -> None:
+    create_orders = ingestion_worker.service.create_orders
+
+    async def create_orders_failing_on_poison(
+            orders: list[OrderCreate],
+            ingestion_ids: list[str | None] | None = None
+    ) -> list[OrderSchema | ValueError]:
+        if any(order.channel_order_id == "poison" for order in orders):
+            raise RuntimeError("cannot write poison")
+        return await create_orders(orders, ingestion_ids)
+
+    monkeypatch.setattr(ingestion_worker.service, "create_orders", create_orders_failing_on_poison)
+    for channel_order_id in ("poison", "healthy"):
+        order = OrderCreate(
+            channel_order_id=channel_order_id,
+            account_id="acct123",
+            brand_id="brand123",
+            pickup_time=datetime(2023, 10, 1, 12, 0, 0),
+            customer_id=customer.id,
+            address_id=address.id,
+            items=[],
+        )
+        await ingestion_worker.ingestion.enqueue(order)
+
+    # the batch fails as a whole and stays pending
+    messages, deliveries = await ingestion_worker.read_batch()
+    with pytest.raises(RuntimeError):
+        await ingestion_worker.process_batch(messages, deliveries)
+    assert not await Order.exists()
+
+    # reclaimed on the second delivery, the entries are written one by one and only the poison one is moved
+    messages, deliveries = await ingestion_worker.read_batch()
+    assert sorted(deliveries.values()) == [2, 2]
+    await ingestion_worker.process_batch(messages, deliveries)
+
+    assert await Order.filter(channel_order_id="healthy").exists()
+    dead_letters = await redis_client.xrange(settings.order_ingestion_dead_letter_stream)
+    assert [(fields["deliveries"], fields["error"]) for _, fields in dead_letters] == [("2", "cannot write poison")]
+    status = await ingestion_worker.ingestion.get_status(dead_letters[0][1]["tracking_id"])
+    assert status is not None and (status.status.value, status.error) == ("failed", "cannot write poison")
+    assert await redis_client.xlen(settings.order_ingestion_stream) == 0
+    pending = await redis_client.xpending(settings.order_ingestion_stream, settings.order_ingestion_group)
+    assert pending["pending"] == 0